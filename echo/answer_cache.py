@@ -0,0 +1,112 @@
+"""
+In-process cache of final answers to repeated questions on a document.
+
+Entries are keyed by (document_id, normalised redacted question,
+Document.index_version). Re-indexing bumps the version, so answers built
+from the old chunks are never replayed; deleting a document drops its
+entries. Size is bounded by RAG_ANSWER_CACHE_MAX_ENTRIES (least recently
+used go first) and entries expire after RAG_ANSWER_CACHE_TTL_SECONDS.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Trailing punctuation doesn't change the question
+_TRAILING = "?!.,;: "
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.split()).casefold().rstrip(_TRAILING)
+
+
+class AnswerCache:
+
+    def __init__(self, max_entries: int, ttl: float, clock=time.monotonic):
+        """
+        ttl is in seconds (0 = entries never expire).
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (stored_at, answer), oldest first
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(document_id, question: str, version: int):
+        return str(document_id), normalize_question(question), version
+
+    def get(self, document_id, question: str, version: int):
+        key = self.key(document_id, question, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and self.clock() - entry[0] > self.ttl:
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, document_id, question: str, version: int, answer: str):
+        if self.max_entries <= 0:
+            return
+        key = self.key(document_id, question, version)
+        with self._lock:
+            self._entries[key] = (self.clock(), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate_document(self, document_id) -> int:
+        document_id = str(document_id)
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == document_id]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(
+                    settings.RAG_ANSWER_CACHE_MAX_ENTRIES,
+                    settings.RAG_ANSWER_CACHE_TTL_SECONDS,
+                )
+    return _cache
+
+
+def invalidate_document(document_id):
+    """
+    Drops a document's cached answers (re-indexed or deleted).
+    """
+    if _cache is None:
+        return
+    removed = _cache.invalidate_document(document_id)
+    if removed:
+        logger.info(f"Dropped {removed} cached answers for document {document_id}")
@@ -0,0 +1,562 @@
+"""
+Disk-backed LangGraph persistence: a checkpointer and a key-value store
+on one local SQLite file (WAL mode, so worker processes can share it).
+
+- Only the CHECKPOINT_KEEP_LATEST newest checkpoints per thread are kept;
+  older ones (and their pending writes) are pruned on every write.
+- Threads idle for CHECKPOINT_THREAD_TTL_SECONDS are deleted by a sweep
+  that piggybacks on writes.
+- Each class does its SQLite work on one dedicated thread. aput() and
+  aput_writes() only queue the write, so the graph never waits on disk;
+  reads go through the same queue and therefore still see every earlier
+  write.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.store.base import BaseStore, GetOp, Item, ListNamespacesOp, PutOp, SearchItem, SearchOp
+
+logger = logging.getLogger(__name__)
+
+# How often (at most) a write also evicts idle threads
+SWEEP_INTERVAL_SECONDS = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_last_seen ON threads (last_seen);
+CREATE TABLE IF NOT EXISTS store (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+
+class _SQLiteWorker:
+    """
+    One connection, used only from one thread. The file is
+    CHECKPOINT_DB_PATH unless a path is given; a changed setting (tests)
+    reopens the connection.
+    """
+
+    def __init__(self, path=None, name="checkpoint-writer"):
+        self.path = path
+        self.name = name
+        self._executor = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_path = None
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+            return self._executor.submit(fn, *args)
+
+    def connection(self):
+        path = str(self.path or settings.CHECKPOINT_DB_PATH)
+        if self._conn is None or self._conn_path != path:
+            self._close_connection()
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(_SCHEMA)
+            self._conn, self._conn_path = conn, path
+        return self._conn
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = self._conn_path = None
+
+    def close(self):
+        """
+        Waits for queued writes, then closes the connection.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.submit(self._close_connection)
+            executor.shutdown(wait=True)
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Background checkpoint write failed", exc_info=future.exception())
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+
+    def __init__(self, path=None, keep_latest: int = None, thread_ttl: float = None, *, serde=None):
+        super().__init__(serde=serde)
+        self.keep_latest = keep_latest
+        self.thread_ttl = thread_ttl
+        self._worker = _SQLiteWorker(path)
+        self._last_sweep = time.monotonic()
+
+    # --- Runs on the worker thread ---
+
+    def _to_tuple(self, conn, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        writes = conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id,
+                }}
+                if parent_id else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, channel, value_type, value in writes
+            ],
+        )
+
+    def _list(self, config, filter=None, before=None, limit=None):
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        conn = self._worker.connection()
+        rows = conn.execute(
+            f"SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            f"metadata_type, metadata FROM checkpoints {where} ORDER BY checkpoint_id DESC",
+            params,
+        ).fetchall()
+        results = []
+        for row in rows:
+            if limit is not None and len(results) >= limit:
+                break
+            item = self._to_tuple(conn, row)
+            if filter and not all(item.metadata.get(key) == value for key, value in filter.items()):
+                continue
+            results.append(item)
+        return results
+
+    def _get_tuple(self, config):
+        configurable = config["configurable"]
+        params = [configurable["thread_id"], configurable.get("checkpoint_ns", "")]
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+
+        conn = self._worker.connection()
+        row = conn.execute(query, params).fetchone()
+        return self._to_tuple(conn, row) if row else None
+
+    def _put(self, thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint, metadata):
+        conn = self._worker.connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint_id, parent_id, *checkpoint, *metadata),
+            )
+            conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+            self._prune(conn, thread_id, checkpoint_ns)
+        self._maybe_sweep()
+
+    def _prune(self, conn, thread_id, checkpoint_ns):
+        keep = self.keep_latest or settings.CHECKPOINT_KEEP_LATEST
+        oldest_kept = conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, keep - 1),
+        ).fetchone()
+        if oldest_kept is None:
+            return
+        # Checkpoint ids are uuid6: they sort by creation time
+        for table in ("checkpoints", "writes"):
+            conn.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, oldest_kept[0]),
+            )
+
+    def _put_writes(self, thread_id, checkpoint_ns, checkpoint_id, rows):
+        conn = self._worker.connection()
+        with conn:
+            for row in rows:
+                # Regular writes are idempotent per (task, idx); special
+                # ones (errors, interrupts) use negative idx and overwrite
+                verb = "INSERT OR IGNORE" if row[1] >= 0 else "INSERT OR REPLACE"
+                conn.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, *row),
+                )
+
+    def _delete_threads(self, where: str, params) -> int:
+        conn = self._worker.connection()
+        with conn:
+            doomed = f"SELECT thread_id FROM threads WHERE {where}"
+            conn.execute(f"DELETE FROM checkpoints WHERE thread_id IN ({doomed})", params)
+            conn.execute(f"DELETE FROM writes WHERE thread_id IN ({doomed})", params)
+            return conn.execute(f"DELETE FROM threads WHERE {where}", params).rowcount
+
+    def _evict_idle(self, ttl):
+        evicted = self._delete_threads("last_seen < ?", (time.time() - ttl,))
+        if evicted:
+            logger.info(f"Evicted {evicted} idle conversation thread(s) from the checkpointer")
+        return evicted
+
+    def _maybe_sweep(self):
+        ttl = self.thread_ttl if self.thread_ttl is not None else settings.CHECKPOINT_THREAD_TTL_SECONDS
+        now = time.monotonic()
+        if ttl and now - self._last_sweep >= min(ttl, SWEEP_INTERVAL_SECONDS):
+            self._last_sweep = now
+            self._evict_idle(ttl)
+
+    def _stats(self):
+        conn = self._worker.connection()
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("threads", "checkpoints", "writes")
+        }
+
+    # --- Serialisation happens on the caller's thread ---
+
+    def _prepare_put(self, config, checkpoint, metadata):
+        configurable = config["configurable"]
+        return (
+            configurable["thread_id"],
+            configurable.get("checkpoint_ns", ""),
+            checkpoint["id"],
+            configurable.get("checkpoint_id"),  # parent
+            self.serde.dumps_typed(checkpoint),
+            self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+        )
+
+    def _prepare_writes(self, config, writes, task_id, task_path):
+        configurable = config["configurable"]
+        rows = [
+            (task_id, WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"], rows
+
+    @staticmethod
+    def _saved_config(args):
+        thread_id, checkpoint_ns, checkpoint_id = args[:3]
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+        }}
+
+    # --- BaseCheckpointSaver API ---
+
+    def get_tuple(self, config):
+        return self._worker.submit(self._get_tuple, config).result()
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        yield from self._worker.submit(self._list, config, filter, before, limit).result()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        args = self._prepare_put(config, checkpoint, metadata)
+        self._worker.submit(self._put, *args).result()
+        return self._saved_config(args)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self._worker.submit(self._put_writes, *self._prepare_writes(config, writes, task_id, task_path)).result()
+
+    def delete_thread(self, thread_id):
+        self._worker.submit(self._delete_threads, "thread_id = ?", (thread_id,)).result()
+
+    async def aget_tuple(self, config):
+        return await asyncio.wrap_future(self._worker.submit(self._get_tuple, config))
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await asyncio.wrap_future(self._worker.submit(self._list, config, filter, before, limit)):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        # Queued, not awaited: the worker applies writes in order and
+        # serves reads from the same queue
+        args = self._prepare_put(config, checkpoint, metadata)
+        self._worker.submit(self._put, *args).add_done_callback(_log_failure)
+        return self._saved_config(args)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        args = self._prepare_writes(config, writes, task_id, task_path)
+        self._worker.submit(self._put_writes, *args).add_done_callback(_log_failure)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.wrap_future(self._worker.submit(self._delete_threads, "thread_id = ?", (thread_id,)))
+
+    def get_next_version(self, current, channel):
+        # Same scheme as InMemorySaver
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # --- Maintenance ---
+
+    def evict_idle(self, ttl: float = None) -> int:
+        """
+        Deletes threads idle for longer than ttl seconds; returns how many.
+        """
+        ttl = ttl if ttl is not None else settings.CHECKPOINT_THREAD_TTL_SECONDS
+        return self._worker.submit(self._evict_idle, ttl).result()
+
+    def stats(self) -> dict:
+        """
+        Row counts per table, after queued writes are applied.
+        """
+        return self._worker.submit(self._stats).result()
+
+    def flush(self):
+        self._worker.submit(lambda: None).result()
+
+    def close(self):
+        self._worker.close()
+
+
+class SQLiteStore(BaseStore):
+    """
+    BaseStore on the "store" table of the checkpoint database. Search
+    supports namespace prefixes and value filters; there is no vector
+    index, so a search query string is ignored.
+    """
+
+    def __init__(self, path=None):
+        self._worker = _SQLiteWorker(path, name="checkpoint-store")
+
+    @staticmethod
+    def _item(namespace, key, value, created_at, updated_at, cls=Item):
+        return cls(
+            namespace=tuple(namespace.split(".")) if namespace else (),
+            key=key,
+            value=json.loads(value),
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+
+    # Filter semantics follow langgraph's InMemoryStore (JSONB-like): nested
+    # dicts match field by field, lists element by element, and a dict of
+    # "$eq"/"$ne"/"$gt"/"$gte"/"$lt"/"$lte" keys compares with operators
+    _OPERATORS = {
+        "$eq": lambda value, target: value == target,
+        "$ne": lambda value, target: value != target,
+        "$gt": lambda value, target: float(value) > float(target),
+        "$gte": lambda value, target: float(value) >= float(target),
+        "$lt": lambda value, target: float(value) < float(target),
+        "$lte": lambda value, target: float(value) <= float(target),
+    }
+
+    @classmethod
+    def _matches(cls, value, target) -> bool:
+        if isinstance(target, dict):
+            if any(key.startswith("$") for key in target):
+                for operator, operand in target.items():
+                    if operator not in cls._OPERATORS:
+                        raise ValueError(f"Unsupported operator: {operator}")
+                    if not cls._OPERATORS[operator](value, operand):
+                        return False
+                return True
+            return isinstance(value, dict) and all(
+                cls._matches(value.get(key), operand) for key, operand in target.items()
+            )
+        if isinstance(target, (list, tuple)):
+            return (
+                isinstance(value, (list, tuple)) and len(value) == len(target)
+                and all(cls._matches(v, t) for v, t in zip(value, target))
+            )
+        return value == target
+
+    @staticmethod
+    def _namespace_matches(condition, namespace) -> bool:
+        # "*" in a prefix/suffix condition matches any one element
+        path = condition.path
+        if len(namespace) < len(path):
+            return False
+        if condition.match_type == "prefix":
+            pairs = zip(namespace, path)
+        elif condition.match_type == "suffix":
+            pairs = zip(reversed(namespace), reversed(path))
+        else:
+            raise ValueError(f"Unsupported match type: {condition.match_type}")
+        return all(part == "*" or element == part for element, part in pairs)
+
+    def _get(self, conn, op: GetOp):
+        row = conn.execute(
+            "SELECT namespace, key, value, created_at, updated_at FROM store WHERE namespace = ? AND key = ?",
+            (".".join(op.namespace), op.key),
+        ).fetchone()
+        return self._item(*row) if row else None
+
+    def _put(self, conn, op: PutOp):
+        namespace = ".".join(op.namespace)
+        if op.value is None:
+            conn.execute("DELETE FROM store WHERE namespace = ? AND key = ?", (namespace, op.key))
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        conn.execute(
+            "INSERT INTO store VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (namespace, op.key, json.dumps(op.value), now, now),
+        )
+
+    def _search(self, conn, op: SearchOp):
+        prefix = ".".join(op.namespace_prefix)
+        if prefix:
+            # "." sorts just before "/", so this range is every child namespace
+            rows = conn.execute(
+                "SELECT namespace, key, value, created_at, updated_at FROM store "
+                "WHERE namespace = ? OR (namespace > ? AND namespace < ?) ORDER BY updated_at DESC",
+                (prefix, f"{prefix}.", f"{prefix}/"),
+            )
+        else:
+            rows = conn.execute(
+                "SELECT namespace, key, value, created_at, updated_at FROM store ORDER BY updated_at DESC"
+            )
+        items = [self._item(*row, cls=SearchItem) for row in rows]
+        if op.filter:
+            items = [
+                item for item in items
+                if all(self._matches(item.value.get(key), value) for key, value in op.filter.items())
+            ]
+        return items[op.offset:op.offset + op.limit]
+
+    def _list_namespaces(self, conn, op: ListNamespacesOp):
+        namespaces = [
+            tuple(row[0].split(".")) for row in conn.execute("SELECT DISTINCT namespace FROM store")
+        ]
+        if op.match_conditions:
+            namespaces = [
+                namespace for namespace in namespaces
+                if all(self._namespace_matches(condition, namespace) for condition in op.match_conditions)
+            ]
+        if op.max_depth is not None:
+            namespaces = [namespace[:op.max_depth] for namespace in namespaces]
+        return sorted(set(namespaces))[op.offset:op.offset + op.limit]
+
+    def _batch(self, ops):
+        handlers = {GetOp: self._get, PutOp: self._put, SearchOp: self._search, ListNamespacesOp: self._list_namespaces}
+        conn = self._worker.connection()
+        with conn:
+            return [handlers[type(op)](conn, op) for op in ops]
+
+    def batch(self, ops):
+        return self._worker.submit(self._batch, list(ops)).result()
+
+    async def abatch(self, ops):
+        return await asyncio.wrap_future(self._worker.submit(self._batch, list(ops)))
+
+    def close(self):
+        self._worker.close()
+
+
+_checkpointer = None
+_store = None
+_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """
+    Process-wide saver for CHECKPOINT_BACKEND ("sqlite" or "memory").
+    """
+    global _checkpointer
+    with _lock:
+        if _checkpointer is None:
+            if settings.CHECKPOINT_BACKEND == "memory":
+                from langgraph.checkpoint.memory import MemorySaver
+                _checkpointer = MemorySaver()
+            else:
+                _checkpointer = SQLiteCheckpointSaver()
+        return _checkpointer
+
+
+def get_store():
+    global _store
+    with _lock:
+        if _store is None:
+            if settings.CHECKPOINT_BACKEND == "memory":
+                from langgraph.store.memory import InMemoryStore
+                _store = InMemoryStore()
+            else:
+                _store = SQLiteStore()
+        return _store
+
+
+def close_checkpointer():
+    """
+    Flushes queued checkpoint writes and closes the database (idempotent;
+    the next use reopens it).
+    """
+    with _lock:
+        for backend in (_checkpointer, _store):
+            if hasattr(backend, "close"):
+                backend.close()
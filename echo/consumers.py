@@ -1,10 +1,24 @@
 
 import json
 import asyncio
+import logging
+import uuid
+from contextlib import aclosing
 from channels.generic.websocket import AsyncWebsocketConsumer
-from langchain_core.messages import HumanMessage, SystemMessage
-from .llm_gateway import safe_stream
-from .rag_engine import rag_graph, redact_pii
+from django.conf import settings
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from . import single_flight
+from .frames import FrameCoalescer, frame_options
+from .rag_engine import rag_graph, redact_pii, schedule_compaction
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# generate_node pushes answer text as custom stream events; no per-event
+# callback overhead and no filtering of other LLM calls. "updates" carries
+# the generate node's token counts for the end frame (or the answer cache's
+# hit flag).
+STREAM_MODES = ["custom", "updates"]
 
 
 class DocumentConsumer(AsyncWebsocketConsumer):
@@ -29,40 +43,164 @@ class DocumentConsumer(AsyncWebsocketConsumer):
 #############
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Each question runs as a task tracked per connection. A new question
+    beyond CHAT_MAX_RUNS_PER_CONNECTION supersedes the oldest run (or is
+    refused when CHAT_SUPERSEDE_RUNS is off); {"type": "cancel"} and
+    disconnecting cancel everything. Cancelling the task unwinds the graph
+    run down to the LLM HTTP stream, so no tokens are generated for
+    answers nobody will read.
+
+    Identical first questions on the same document from different
+    connections share one graph run while it is in flight (see
+    echo/single_flight.py, CHAT_SINGLE_FLIGHT).
+    """
+
     async def connect(self):
+        # Answer text is batched into frames; see echo/frames.py
+        self.frame_options = frame_options(self.scope)
+        self.runs = {}  # task -> run id, oldest first
+        self.run_counter = 0
+        self.connected = True
         await self.accept()
 
+    async def disconnect(self, close_code):
+        self.connected = False
+        await self.cancel_runs()
+
+    async def cancel_runs(self, tasks=None):
+        """
+        Cancels the given runs (default: all) and waits for them to unwind.
+        """
+        tasks = [task for task in (self.runs if tasks is None else tasks) if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=settings.CHAT_CANCEL_TIMEOUT_SECONDS)
+            if pending:
+                logger.warning(f"{len(pending)} chat run(s) still unwinding after cancel")
+
     async def receive(self, text_data):
         # user_input = json.loads(text_data).get('message')
         message_data = json.loads(text_data)
+        if message_data.get('type') == 'cancel':
+            await self.cancel_runs()
+            return
+
         user_input = message_data.get('message')
         document_id = message_data.get('document_id')
         # thread_id = self.channel_name # Pass from UI in production
 
         thread_id = self.scope.get("session").session_key
 
-        # Fire and forget to keep the socket responsive
-        asyncio.create_task(self.stream_openai_response(user_input, thread_id, document_id))
-
-    
-    async def stream_openai_response(self, message, thread_id, document_id=None):
+        active = [task for task in self.runs if not task.done()]
+        excess = len(active) - settings.CHAT_MAX_RUNS_PER_CONNECTION + 1
+        if excess > 0:
+            if not settings.CHAT_SUPERSEDE_RUNS:
+                await self.send(text_data=json.dumps({"type": "error", "error": "too_many_runs"}))
+                return
+            await self.cancel_runs(active[:excess])
+
+        # Runs in the background to keep the socket responsive; tracked so
+        # it can be cancelled
+        self.run_counter += 1
+        task = asyncio.create_task(
+            self.stream_openai_response(user_input, thread_id, document_id, run_id=self.run_counter)
+        )
+        self.runs[task] = self.run_counter
+        task.add_done_callback(lambda done: self.runs.pop(done, None))
+
+    @staticmethod
+    async def _fresh_thread(config) -> bool:
+        # Without a checkpointer there is no history to check or record into
+        if getattr(rag_graph, "checkpointer", None) is None:
+            return False
+        snapshot = await rag_graph.aget_state(config)
+        return not snapshot.values.get("messages")
+
+    @staticmethod
+    async def _shared_run(graph_input):
+        """
+        A coalesced run's events. It runs on a throwaway thread; each
+        subscriber records the turn in its own thread afterwards.
+        """
+        config = {"configurable": {"thread_id": f"flight-{uuid.uuid4().hex}"}}
+        try:
+            async for event in rag_graph.astream(graph_input, config, stream_mode=STREAM_MODES):
+                yield event
+        finally:
+            await rag_graph.checkpointer.adelete_thread(config["configurable"]["thread_id"])
+
+    @staticmethod
+    async def _record_turn(config, question, answer, document_id):
+        # As if this thread's own run had just finished
+        await rag_graph.aupdate_state(
+            config,
+            {
+                "messages": [HumanMessage(content=question), AIMessage(content=answer)],
+                "question": question,
+                "answer": answer,
+                "document_id": document_id,
+            },
+            as_node="pii_post_check",
+        )
+
+    async def stream_openai_response(self, message, thread_id, document_id=None, run_id=None):
         config = {"configurable": {"thread_id": thread_id}}
+        graph_input = {"question": message, "document_id": document_id}
 
+        frames = FrameCoalescer(
+            self.send, fields={"run": run_id} if run_id is not None else None, **self.frame_options
+        )
         full_content = ""
-
-        async for event in rag_graph.astream_events(
-            {"question": message, "document_id": document_id},
-            config,
-            version="v1",
-        ):
-            # We only care about LLM token streaming events
-            if event["event"] == "on_chat_model_stream":
-                token = event["data"]["chunk"].content
-                if token:
-                    clean_token = redact_pii(token)
-                    full_content += clean_token
-                    await self.send(
-                        text_data=json.dumps({"text": clean_token})
-                    )
-
-      
\ No newline at end of file
+        usage = {}
+        error = None
+        cancelled = False
+
+        try:
+            shared = settings.CHAT_SINGLE_FLIGHT and await self._fresh_thread(config)
+            if shared:
+                events, joined = single_flight.join(
+                    single_flight.flight_key(document_id, redact_pii(message)),
+                    lambda: self._shared_run(graph_input),
+                )
+                if joined:
+                    usage["coalesced"] = True
+            else:
+                events = rag_graph.astream(graph_input, config, stream_mode=STREAM_MODES)
+
+            # aclosing: leaving early still unsubscribes / closes the graph run
+            async with aclosing(events):
+                async for mode, chunk in events:
+                    if mode == "updates":
+                        if (chunk.get("answer_cache") or {}).get("cached"):
+                            usage["cached"] = True
+                        if "generate" in chunk:
+                            generated = chunk["generate"]
+                            usage["prompt_tokens"] = generated.get("prompt_tokens", {}).get("generate")
+                            ttft = generated.get("timings", {}).get("generate_ttft")
+                            usage["ttft_ms"] = round(ttft * 1000) if ttft is not None else None
+                        continue
+                    token = chunk.get("token")
+                    if token:
+                        clean_token = redact_pii(token)
+                        full_content += clean_token
+                        await frames.push(clean_token)
+            if shared:
+                await self._record_turn(config, redact_pii(message), full_content, document_id)
+            if getattr(rag_graph, "checkpointer", None) is not None:
+                # In the background: the end frame doesn't wait for the summary
+                schedule_compaction(rag_graph, config)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception:
+            logger.exception("Chat generation failed")
+            error = "generation_failed"
+        finally:
+            if getattr(self, "connected", True):
+                usage["completion_tokens"] = count_tokens(full_content)
+                extra = {"error": error} if error else {"cancelled": True} if cancelled else {}
+                await frames.close(usage=usage, **extra)
+            else:
+                frames.discard()
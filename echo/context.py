@@ -0,0 +1,150 @@
+"""
+Builds the CONTEXT block for the generate prompt from retrieved hits.
+
+Hits are the {"content", "score", "metadata"} dicts from retrieval, where
+score is a distance (lower is better). Chunks are split with a 200-char
+overlap, so neighbouring hits from the same page repeat each other.
+build_context() stitches those back together using start_index, drops
+near-duplicates, and keeps the best passages that fit the token budget.
+"""
+import logging
+import re
+
+from django.conf import settings
+
+from .tokens import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# The splitter strips the separator between chunks that don't overlap,
+# so "adjacent" allows a few missing characters
+ADJACENT_GAP_CHARS = 3
+SHINGLE_SIZE = 3
+
+_WORD = re.compile(r"\w+")
+
+
+def _span(hit):
+    metadata = hit.get("metadata") or {}
+    start = metadata.get("start_index")
+    if not isinstance(start, int) or start < 0:
+        return None
+    owner = metadata.get("document_id") or metadata.get("source")
+    if owner is None:
+        return None
+    return (owner, metadata.get("page")), start
+
+
+def _stitch(left: str, left_start: int, right: str, right_start: int):
+    """
+    Joins two chunks of the same page text, or returns None if they
+    don't touch (or their overlap doesn't line up).
+    """
+    left_end = left_start + len(left)
+    overlap = left_end - right_start
+    if overlap < -ADJACENT_GAP_CHARS:
+        return None
+    if overlap <= 0:
+        return f"{left} {right}"
+    if right_start + len(right) <= left_end:
+        # Fully inside the left chunk
+        return left if left[right_start - left_start:].startswith(right) else None
+    if left[-overlap:] != right[:overlap]:
+        return None
+    return left + right[overlap:]
+
+
+def merge_adjacent(hits):
+    """
+    Merges hits that overlap or touch on the same document page. A merged
+    passage keeps the best score of its parts. Hits without start_index
+    pass through unchanged.
+    """
+    passages, groups = [], {}
+    for hit in hits:
+        span = _span(hit)
+        if span is None:
+            passages.append(hit)
+        else:
+            groups.setdefault(span[0], []).append((span[1], hit))
+
+    for group in groups.values():
+        group.sort(key=lambda item: item[0])
+        start, current = group[0]
+        for next_start, hit in group[1:]:
+            stitched = _stitch(current["content"], start, hit["content"], next_start)
+            if stitched is None:
+                passages.append(current)
+                start, current = next_start, hit
+            else:
+                current = {**current, "content": stitched, "score": min(current["score"], hit["score"])}
+        passages.append(current)
+
+    passages.sort(key=lambda passage: passage["score"])
+    return passages
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.casefold())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def is_near_duplicate(a: set, b: set, threshold: float) -> bool:
+    # Overlap coefficient: also catches a short chunk repeated inside a longer one
+    if not a or not b:
+        return False
+    return len(a & b) / min(len(a), len(b)) >= threshold
+
+
+def drop_near_duplicates(passages, threshold: float):
+    """
+    Keeps the first (best-scored) of each group of near-identical passages.
+    """
+    kept, seen = [], []
+    for passage in passages:
+        shingles = _shingles(passage["content"])
+        if any(is_near_duplicate(shingles, other, threshold) for other in seen):
+            continue
+        kept.append(passage)
+        seen.append(shingles)
+    return kept
+
+
+def fit_to_budget(passages, budget: int):
+    """
+    Best passages first until the budget is spent; smaller ones further
+    down may still fill the gap. The top passage is truncated rather than
+    dropped if it alone is over budget.
+    """
+    if not budget or budget <= 0:
+        return [passage["content"] for passage in passages]
+
+    selected, used = [], 0
+    for passage in passages:
+        tokens = count_tokens(passage["content"])
+        if used + tokens <= budget:
+            selected.append(passage["content"])
+            used += tokens
+        elif not selected:
+            selected.append(truncate_tokens(passage["content"], budget))
+            used = budget
+    return selected
+
+
+def build_context(hits, budget: int = None, duplicate_threshold: float = None):
+    """
+    Returns the context passages, best first.
+    budget defaults to RAG_CONTEXT_TOKEN_BUDGET, duplicate_threshold to
+    RAG_CONTEXT_DUPLICATE_THRESHOLD.
+    """
+    if budget is None:
+        budget = settings.RAG_CONTEXT_TOKEN_BUDGET
+    if duplicate_threshold is None:
+        duplicate_threshold = settings.RAG_CONTEXT_DUPLICATE_THRESHOLD
+
+    passages = drop_near_duplicates(merge_adjacent(hits), duplicate_threshold)
+    context = fit_to_budget(passages, budget)
+    logger.debug(f"Context: {len(hits)} hits -> {len(passages)} passages -> {len(context)} within budget {budget}")
+    return context
@@ -1,9 +1,371 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict, deque
+from typing import List
+
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
-import os 
+
+from .llm_gateway import percentile, rate_limiter
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-embeddings = OpenAIEmbeddings(
+
+class EmbeddingCache:
+    """
+    Two-tier content-addressed vector cache.
+
+    - Memory: LRU of float32 blobs, evicted by total byte size.
+    - Disk: SQLite table keyed by (model, sha256(text)), WAL mode so
+      readers in request threads don't block the ingestion writer.
+    """
+
+    def __init__(self, path: str, max_memory_bytes: int):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._conn = None
+
+    def _connection(self):
+        # Opened lazily so importing this module never touches disk.
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " digest TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, digest))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key, blob: bytes):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = blob
+        self._memory_bytes += len(blob)
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def get_memory(self, key):
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+            return blob
+
+    def get_disk(self, model: str, digests: List[str]) -> dict:
+        """
+        Returns {digest: blob} for the digests found on disk and promotes
+        them into the memory tier.
+        """
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(digests), 500):
+                batch = digests[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT digest, vector FROM embeddings "
+                    f"WHERE model = ? AND digest IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                found.update(rows)
+            for digest, blob in found.items():
+                self._remember((model, digest), blob)
+        return found
+
+    def put(self, model: str, items: dict):
+        """
+        Stores {digest: blob} in both tiers.
+        """
+        if not items:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, digest, vector) VALUES (?, ?, ?)",
+                    [(model, digest, blob) for digest, blob in items.items()],
+                )
+            for digest, blob in items.items():
+                self._remember((model, digest), blob)
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return self._memory_bytes
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._memory.clear()
+            self._memory_bytes = 0
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _to_blob(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _from_blob(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Drop-in Embeddings wrapper that only calls the provider for text it
+    has never embedded with this model before.
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_name: str = None):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name or getattr(underlying, "model", type(underlying).__name__)
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, value in deltas.items():
+                self._stats[name] += value
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        stats["memory_bytes"] = self.cache.memory_usage()
+        return stats
+
+    def _lookup_memory(self, digests):
+        found = {}
+        for digest in digests:
+            blob = self.cache.get_memory((self.model_name, digest))
+            if blob is not None:
+                found[digest] = blob
+        return found
+
+    def _lookup(self, texts):
+        """
+        Resolves what it can from the cache. Returns (digests, found, missing)
+        where missing maps digest -> text for unique uncached texts.
+        """
+        digests = [_digest(text) for text in texts]
+        unique = list(dict.fromkeys(digests))
+        found = self._lookup_memory(unique)
+        memory_hits = len(found)
+
+        remaining = [d for d in unique if d not in found]
+        if remaining:
+            found.update(self.cache.get_disk(self.model_name, remaining))
+
+        missing = {}
+        for digest, text in zip(digests, texts):
+            if digest not in found:
+                missing.setdefault(digest, text)
+
+        self._count(
+            memory_hits=memory_hits,
+            disk_hits=len(found) - memory_hits,
+            misses=len(missing),
+        )
+        return digests, found, missing
+
+    def _store(self, found, missing, vectors):
+        new = {digest: _to_blob(vector) for digest, vector in zip(missing, vectors)}
+        self.cache.put(self.model_name, new)
+        found.update(new)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests, found, missing = self._lookup(texts)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            self._store(found, missing, vectors)
+        return [_from_blob(found[digest]) for digest in digests]
+
+    def embed_query(self, text: str) -> List[float]:
+        digests, found, missing = self._lookup([text])
+        if missing:
+            self._store(found, missing, [self.underlying.embed_query(text)])
+        return _from_blob(found[digests[0]])
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests, found, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            await asyncio.to_thread(self._store, found, missing, vectors)
+        return [_from_blob(found[digest]) for digest in digests]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        digests, found, missing = await asyncio.to_thread(self._lookup, [text])
+        if missing:
+            vector = await self.underlying.aembed_query(text)
+            await asyncio.to_thread(self._store, found, missing, [vector])
+        return _from_blob(found[digests[0]])
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Waits on the provider's shared rate limiter (echo.llm_gateway) before
+    each request, at the caller's request_priority().
+    """
+
+    def __init__(self, underlying: Embeddings, quota: str):
+        self.underlying = underlying
+        self.quota = quota
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+
+    @staticmethod
+    def _tokens(texts: List[str]) -> int:
+        return sum(count_tokens(text) for text in texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        rate_limiter(self.quota).acquire(tokens=self._tokens(texts))
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        rate_limiter(self.quota).acquire(tokens=count_tokens(text))
+        return self.underlying.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await rate_limiter(self.quota).aacquire(tokens=self._tokens(texts))
+        return await self.underlying.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await rate_limiter(self.quota).aacquire(tokens=count_tokens(text))
+        return await self.underlying.aembed_query(text)
+
+
+class _PendingQueries:
+    # One per event loop: futures and timers can't cross loops
+    def __init__(self):
+        self.items = []  # (text, future, enqueued_at)
+        self.timer = None
+
+
+class QueryBatcher(Embeddings):
+    """
+    Coalesces concurrent aembed_query calls (one per chat question) into
+    a single aembed_documents request: queries are collected for up to
+    max_wait_ms after the first one, or until max_batch are waiting, and
+    the vectors are fanned back out to the callers. Everything else is
+    passed straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, max_batch: int = None, max_wait_ms: float = None):
+        self.underlying = underlying
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+        self.max_batch = settings.EMBEDDING_QUERY_BATCH_SIZE if max_batch is None else max_batch
+        max_wait_ms = settings.EMBEDDING_QUERY_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms
+        self.max_wait = max_wait_ms / 1000
+        self._pending = weakref.WeakKeyDictionary()  # loop -> _PendingQueries
+        self._dispatching = set()
+        self._sizes = deque(maxlen=1000)
+        self._waits = deque(maxlen=1000)
+        self._queries = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.max_batch <= 1 or self.max_wait <= 0:
+            return await self.underlying.aembed_query(text)
+
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = _PendingQueries()
+        future = loop.create_future()
+        pending.items.append((text, future, time.perf_counter()))
+        if len(pending.items) >= self.max_batch:
+            self._flush(pending)
+        elif pending.timer is None:
+            pending.timer = loop.call_later(self.max_wait, self._flush, pending)
+        return await future
+
+    def _flush(self, pending: _PendingQueries):
+        if pending.timer is not None:
+            pending.timer.cancel()
+            pending.timer = None
+        batch, pending.items = pending.items, []
+        # Callers cancelled while waiting don't need a vector
+        batch = [item for item in batch if not item[1].done()]
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch):
+        dispatched = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        self._sizes.append(len(texts))
+        self._waits.extend(dispatched - enqueued for _, _, enqueued in batch)
+        self._queries += len(batch)
+        try:
+            vectors = dict(zip(texts, await self.underlying.aembed_documents(texts)))
+        except Exception as exc:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def stats(self) -> dict:
+        sizes, waits = list(self._sizes), list(self._waits)
+        return {
+            "queries": self._queries,
+            "batches": len(sizes),
+            "mean_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else None,
+            "max_batch_size": max(sizes, default=None),
+            "wait_p50_ms": round(percentile(waits, 0.5) * 1000, 2) if waits else None,
+            "wait_p95_ms": round(percentile(waits, 0.95) * 1000, 2) if waits else None,
+        }
+
+
+openai_embeddings = OpenAIEmbeddings(
     model="text-embedding-3-small",
     openai_api_key=OPENAI_API_KEY
-)
\ No newline at end of file
+)
+
+# Cache first, so only misses are batched; one batch is one rate-limited request
+embeddings = CachedEmbeddings(
+    QueryBatcher(RateLimitedEmbeddings(openai_embeddings, "openai")),
+    EmbeddingCache(
+        settings.EMBEDDING_CACHE_PATH,
+        max_memory_bytes=settings.EMBEDDING_CACHE_MEMORY_BYTES,
+    ),
+)
@@ -0,0 +1,15 @@
+"""
+Evaluation questions for the GPT4All technical report, shared by the
+bulk RAG test and `manage.py calibrate_relevance`.
+"""
+
+# Golden pairs: (question, expected fact to check for)
+GOLDEN_PAIRS = [
+    ("Who are the authors of the GPT4All technical report?", "Yuvanesh Anand, Zach Nussbaum, Brandon Duderstadt, Benjamin Schmidt, Andriy Mulyar"),
+    ("What is the main purpose of GPT4All?", "chatbot trained over a massive curated corpus of assistant interactions"),
+    ("How many prompt-response pairs were collected for training?", "437,605 high-quality prompt-response pairs in final subset"),
+    ("What datasets were used to collect the initial prompts?", "chip2 subset of LAION OIG, Stackoverflow, Bigscience/P3"),
+    ("What were the GPU and API costs to train GPT4All?", "$800 in GPU costs and $500 in OpenAI API spend"),
+    ("Which model was fine-tuned to create GPT4All?", "LLaMA 7B with LoRA on curated dataset"),
+    ("What evaluation method was used to measure GPT4All’s performance?", "human evaluation from Self-Instruct paper comparing ground truth perplexity")
+]
@@ -0,0 +1,119 @@
+"""
+Coalesces streamed answer text into fewer WebSocket frames.
+
+A frame goes out when max_chars are buffered or max_delay has passed
+since the first buffered character, whichever comes first. Every frame
+carries a per-answer sequence number, and close() sends a final
+{"type": "end"} frame with the answer's stats.
+"""
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Per-connection overrides (?frame_chars=..&frame_ms=..) are clamped to these
+MAX_FRAME_CHARS = 4096
+MAX_FRAME_DELAY_MS = 1000
+
+
+def frame_options(scope) -> dict:
+    """
+    Coalescing settings for a WebSocket connection: CHAT_FRAME_MAX_CHARS /
+    CHAT_FRAME_MAX_DELAY_MS, overridable by the client's query string.
+    0 chars sends every token as its own frame.
+    """
+    options = {
+        "max_chars": settings.CHAT_FRAME_MAX_CHARS,
+        "max_delay": settings.CHAT_FRAME_MAX_DELAY_MS / 1000,
+    }
+    query = parse_qs((scope.get("query_string") or b"").decode())
+    try:
+        if "frame_chars" in query:
+            options["max_chars"] = min(max(int(query["frame_chars"][0]), 0), MAX_FRAME_CHARS)
+        if "frame_ms" in query:
+            options["max_delay"] = min(max(int(query["frame_ms"][0]), 0), MAX_FRAME_DELAY_MS) / 1000
+    except ValueError:
+        logger.info(f"Ignoring invalid frame options in query string: {query}")
+    return options
+
+
+class FrameCoalescer:
+
+    def __init__(self, send, max_chars: int = 64, max_delay: float = 0.02, fields: dict = None):
+        """
+        send is the consumer's send(text_data=...) coroutine function;
+        fields (e.g. a run id) are added to every frame.
+        """
+        self._send = send
+        self.fields = fields or {}
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._buffer = []
+        self._buffered = 0
+        self._timer = None
+        self._lock = asyncio.Lock()
+        self.seq = 0
+        self.chars = 0
+        self.started = time.perf_counter()
+
+    async def push(self, text: str):
+        if not text:
+            return
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.max_chars or self.max_delay <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        await self.flush()
+
+    async def _emit(self, frame: dict):
+        self.seq += 1
+        await self._send(text_data=json.dumps({**self.fields, "seq": self.seq, **frame}))
+
+    async def flush(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._buffer:
+                return
+            text = "".join(self._buffer)
+            self._buffer.clear()
+            self._buffered = 0
+            self.chars += len(text)
+            await self._emit({"text": text})
+
+    def discard(self):
+        """
+        Drops buffered text and any pending timed flush (socket is gone).
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer.clear()
+        self._buffered = 0
+
+    async def close(self, **stats):
+        """
+        Flushes what's left and sends the end-of-stream frame. stats
+        (usage, errors, ...) are included in it.
+        """
+        await self.flush()
+        async with self._lock:
+            await self._emit({
+                "type": "end",
+                "frames": self.seq,
+                "chars": self.chars,
+                "elapsed_ms": round((time.perf_counter() - self.started) * 1000),
+                **stats,
+            })
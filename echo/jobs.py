@@ -0,0 +1,270 @@
+"""
+Durable ingestion job queue.
+
+Jobs live in the IngestionJob table (SQLite by default) so accepted
+uploads survive restarts. Workers lease a job for a visibility timeout and
+heartbeat while it runs; if a worker dies its lease expires and another
+worker resumes the job from its checkpoint. Failures are retried with
+exponential backoff.
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .embeddings import embeddings
+from .models import Document, IngestionJob, JobStatus, ProcessingStatus
+from .services import IngestionCheckpoint
+from .tasks import ingest_document_background
+
+logger = logging.getLogger(__name__)
+
+
+# --- Queue operations (sync, ORM) ---
+
+def enqueue_ingestion(document: Document) -> IngestionJob:
+    """
+    Queues ingestion for a document. Call it inside the transaction that
+    creates the document so the two are persisted together.
+    """
+    return IngestionJob.objects.create(document=document)
+
+
+def _leasable(now):
+    return (
+        Q(status=JobStatus.QUEUED, available_at__lte=now)
+        | Q(status=JobStatus.RUNNING, leased_until__lt=now)
+    )
+
+
+def lease_next_job(worker_id: str, lease_seconds: int = None):
+    """
+    Claims the oldest available job, or returns None.
+    The conditional UPDATE is the lock: only one worker can match the row.
+    """
+    lease_seconds = lease_seconds or settings.INGESTION_LEASE_SECONDS
+    now = timezone.now()
+    candidates = list(
+        IngestionJob.objects.filter(_leasable(now))
+        .order_by("available_at", "id")
+        .values_list("id", flat=True)[:10]
+    )
+    for job_id in candidates:
+        leased = IngestionJob.objects.filter(_leasable(now), id=job_id).update(
+            status=JobStatus.RUNNING,
+            worker_id=worker_id,
+            leased_until=now + timedelta(seconds=lease_seconds),
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+        if leased:
+            return IngestionJob.objects.select_related("document").get(id=job_id)
+    return None
+
+
+def extend_lease(job_id, worker_id: str, lease_seconds: int = None) -> bool:
+    lease_seconds = lease_seconds or settings.INGESTION_LEASE_SECONDS
+    now = timezone.now()
+    return bool(
+        IngestionJob.objects.filter(id=job_id, worker_id=worker_id, status=JobStatus.RUNNING).update(
+            leased_until=now + timedelta(seconds=lease_seconds),
+            updated_at=now,
+        )
+    )
+
+
+def complete_job(job_id):
+    IngestionJob.objects.filter(id=job_id).update(
+        status=JobStatus.DONE,
+        leased_until=None,
+        last_error=None,
+        updated_at=timezone.now(),
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    delay = settings.INGESTION_RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0))
+    return min(delay, settings.INGESTION_RETRY_MAX_DELAY)
+
+
+def fail_job(job: IngestionJob, error: Exception) -> bool:
+    """
+    Records a failed attempt. Returns True when the job is given up on.
+    """
+    now = timezone.now()
+    final = job.attempts >= settings.INGESTION_MAX_ATTEMPTS
+    if final:
+        updates = {"status": JobStatus.FAILED, "leased_until": None}
+    else:
+        updates = {
+            "status": JobStatus.QUEUED,
+            "leased_until": None,
+            "available_at": now + timedelta(seconds=retry_delay(job.attempts)),
+        }
+    IngestionJob.objects.filter(id=job.id).update(last_error=str(error), updated_at=now, **updates)
+    return final
+
+
+def recover_pending_documents() -> int:
+    """
+    Queues PENDING documents that have no live job, e.g. uploads accepted
+    by the old fire-and-forget flow before a restart. Expired leases need
+    no recovery: lease_next_job picks them up again.
+    """
+    live_jobs = IngestionJob.objects.filter(status__in=[JobStatus.QUEUED, JobStatus.RUNNING])
+    orphans = Document.objects.filter(processing_status=ProcessingStatus.PENDING).exclude(
+        id__in=live_jobs.values("document_id")
+    )
+    count = 0
+    for document in orphans:
+        enqueue_ingestion(document)
+        count += 1
+    if count:
+        logger.info(f"Re-queued {count} stale PENDING document(s)")
+    return count
+
+
+class JobCheckpoint(IngestionCheckpoint):
+    """
+    Persists ingestion progress on the job row as it happens.
+    """
+
+    def __init__(self, job: IngestionJob):
+        super().__init__(
+            stage=job.stage,
+            completed_batches=job.checkpoint.get("completed_batches"),
+        )
+        self.job_id = job.id
+
+    def _save(self):
+        IngestionJob.objects.filter(id=self.job_id).update(
+            stage=self.stage,
+            checkpoint={"completed_batches": sorted(self.completed_batches)},
+            updated_at=timezone.now(),
+        )
+
+    def set_stage(self, stage):
+        if stage != self.stage:
+            super().set_stage(stage)
+            self._save()
+
+    def batch_done(self, index):
+        super().batch_done(index)
+        self._save()
+
+
+# --- Workers ---
+
+class IngestionWorkerPool:
+    """
+    N asyncio workers pulling from the job table. Runs in-process on the
+    server's event loop (started by echo.lifecycle) or standalone via
+    `manage.py run_ingestion_workers`.
+    """
+
+    def __init__(self, embeddings, workers: int = None, poll_interval: float = None):
+        self.embeddings = embeddings
+        self.workers = workers or settings.INGESTION_WORKERS
+        self.poll_interval = poll_interval or settings.INGESTION_POLL_INTERVAL
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = []
+        self._loop = None
+        self._wakeup = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """
+        Starts the workers on the running event loop (idempotent).
+        """
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(f"{self.worker_prefix}:{index}"))
+            for index in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} ingestion worker(s)")
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop = None
+
+    def notify(self):
+        """
+        Wakes idle workers after a new job was queued. Safe from any
+        thread; a no-op when the pool is not running in this process.
+        """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _worker(self, worker_id: str):
+        while True:
+            try:
+                processed = await self.run_once(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Queue/DB hiccup: keep the worker alive
+                logger.exception("Ingestion worker loop error")
+                processed = False
+
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _heartbeat(self, job_id, worker_id: str):
+        interval = settings.INGESTION_LEASE_SECONDS / 3
+        while True:
+            await asyncio.sleep(interval)
+            if not await sync_to_async(extend_lease)(job_id, worker_id):
+                logger.warning(f"Lost lease on ingestion job {job_id}")
+                return
+
+    async def run_once(self, worker_id: str = None) -> bool:
+        """
+        Leases and runs at most one job. Returns False when the queue is empty.
+        """
+        worker_id = worker_id or f"{self.worker_prefix}:once"
+        job = await sync_to_async(lease_next_job)(worker_id)
+        if job is None:
+            return False
+
+        final_attempt = job.attempts >= settings.INGESTION_MAX_ATTEMPTS
+        heartbeat = asyncio.create_task(self._heartbeat(job.id, worker_id))
+        try:
+            await ingest_document_background(
+                job.document_id,
+                self.embeddings,
+                checkpoint=JobCheckpoint(job),
+                final_attempt=final_attempt,
+            )
+        except Exception as exc:
+            given_up = await sync_to_async(fail_job)(job, exc)
+            logger.warning(
+                f"Ingestion job {job.id} attempt {job.attempts} failed"
+                f"{' permanently' if given_up else '; will retry'}: {exc}"
+            )
+        else:
+            await sync_to_async(complete_job)(job.id)
+        finally:
+            heartbeat.cancel()
+        return True
+
+
+ingestion_workers = IngestionWorkerPool(embeddings)
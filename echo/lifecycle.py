@@ -0,0 +1,121 @@
+"""
+Process-level startup and shutdown hooks for the ASGI worker.
+
+Called once from ragtalk/asgi.py so long-lived resources (vector store
+clients, the embedding cache, ...) are opened before the first request
+and closed on exit.
+
+Work that needs the server's event loop (ingestion workers) is started by
+LifecycleMiddleware: on ASGI lifespan startup where the server supports
+it, otherwise on the first connection (Daphne sends no lifespan events).
+"""
+import asyncio
+import atexit
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_started = False
+_lock = threading.Lock()
+_loop_started = None
+
+
+def startup():
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    from .embeddings import embeddings
+    from .vectorstore import vector_store_registry
+
+    if settings.VECTORSTORE_WARMUP:
+        try:
+            vector_store_registry.warmup(embeddings)
+        except Exception:
+            # Not fatal: the registry builds the client lazily on first use.
+            logger.exception("Vector store warmup failed")
+
+    atexit.register(shutdown)
+
+
+def shutdown():
+    global _started
+    with _lock:
+        if not _started:
+            return
+        _started = False
+
+    from .checkpoint import close_checkpointer
+    from .embeddings import embeddings
+    from .parse_pool import shutdown_parse_pool
+    from .vectorstore import vector_store_registry
+
+    vector_store_registry.shutdown()
+    embeddings.cache.close()
+    shutdown_parse_pool()
+    close_checkpointer()
+    logger.info("Vector store clients, embedding cache, parse pool and checkpointer closed")
+
+
+async def astartup():
+    """
+    Starts event-loop bound services on the running loop (idempotent).
+    """
+    global _loop_started
+    loop = asyncio.get_running_loop()
+    if _loop_started is loop:
+        return
+    _loop_started = loop
+
+    startup()
+
+    if settings.INGESTION_WORKERS_IN_PROCESS:
+        from .jobs import ingestion_workers, recover_pending_documents
+
+        try:
+            await sync_to_async(recover_pending_documents)()
+        except Exception:
+            logger.exception("Failed to recover pending documents")
+        ingestion_workers.start()
+
+
+async def ashutdown():
+    global _loop_started
+    _loop_started = None
+
+    from .jobs import ingestion_workers
+
+    await ingestion_workers.stop()
+    shutdown()
+
+
+class LifecycleMiddleware:
+    """
+    Outermost ASGI app: answers lifespan events and makes sure astartup()
+    ran before the first HTTP request / WebSocket is handled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await astartup()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await ashutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        await astartup()
+        return await self.app(scope, receive, send)
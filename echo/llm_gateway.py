@@ -34,39 +34,553 @@
 #             raise e2
 
 
+import asyncio
+import heapq
+import itertools
 import logging
 import os
-from tenacity import retry, stop_after_attempt, wait_exponential
+import threading
+import time
+from collections import deque
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import AIMessage, BaseMessage
 from typing import List, AsyncGenerator
 
+from .tokens import count_tokens
+
 logger = logging.getLogger(__name__)
 
 primary_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, streaming=True)
 fallback_llm = ChatAnthropic(model="claude-haiku-4-5-20251001", temperature=0, streaming=True)
 
-@retry(
-    stop=stop_after_attempt(3), 
-    wait=wait_exponential(multiplier=1, min=2, max=10),
-    reraise=True
-)
+
+class ProviderUnavailable(RuntimeError):
+    """Every provider's circuit breaker is open."""
+
+
+# Rate limiter priority classes; lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: int):
+    """
+    Rate-limited calls made inside this block (in this thread or task)
+    queue at the given priority.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimiter:
+    """
+    Token bucket over requests and tokens per minute for one provider
+    quota, shared by sync callers (ingestion threads) and async ones
+    (chat). Waiters are served by priority, then arrival, so background
+    work never overtakes a waiting interactive call. A limit of 0 means
+    unlimited.
+
+    The bucket is per process; see LLM_RATE_LIMIT_PROCESSES.
+    """
+
+    def __init__(self, name: str, requests_per_minute: int = 0, tokens_per_minute: int = 0, clock=time.monotonic):
+        self.name = name
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.available = dict(self.limits)
+        self.clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self._queue = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._max_depth = 0
+        self._granted = dict.fromkeys(PRIORITY_NAMES, 0)
+        self._waits = {priority: deque(maxlen=settings.LLM_STATS_WINDOW) for priority in PRIORITY_NAMES}
+
+    @property
+    def unlimited(self) -> bool:
+        return not any(self.limits.values())
+
+    def _refill(self):
+        now = self.clock()
+        elapsed, self._updated = now - self._updated, now
+        for kind, limit in self.limits.items():
+            if limit:
+                self.available[kind] = min(limit, self.available[kind] + elapsed * limit / 60)
+
+    def _cost(self, tokens: int, requests: int) -> dict:
+        # A single call bigger than the whole bucket would wait forever
+        cost = {"requests": requests, "tokens": tokens}
+        return {kind: min(cost[kind], limit) for kind, limit in self.limits.items() if limit}
+
+    def _enter(self, priority):
+        with self._lock:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            self._max_depth = max(self._max_depth, len(self._queue))
+        return entry
+
+    def _leave(self, entry):
+        with self._lock:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+
+    def _try_acquire(self, entry, cost: dict, started: float) -> float:
+        """
+        Takes cost from the bucket if entry is first in line and it fits.
+        Returns 0 when granted, else the seconds worth waiting.
+        """
+        with self._lock:
+            if self._queue[0] != entry:
+                return settings.LLM_RATE_POLL_SECONDS
+            self._refill()
+            wait = max((cost[kind] - self.available[kind]) * 60 / self.limits[kind] for kind in cost)
+            if wait > 0:
+                return wait
+            for kind in cost:
+                self.available[kind] -= cost[kind]
+            heapq.heappop(self._queue)
+            self._granted[entry[0]] += 1
+            self._waits[entry[0]].append(self.clock() - started)
+            return 0.0
+
+    def acquire(self, tokens: int = 0, requests: int = 1, priority: int = None) -> float:
+        """
+        Blocks the calling thread until the call fits; returns seconds waited.
+        priority defaults to the caller's request_priority().
+        """
+        if self.unlimited:
+            return 0.0
+        started = self.clock()
+        entry = self._enter(_priority.get() if priority is None else priority)
+        cost = self._cost(tokens, requests)
+        try:
+            while (wait := self._try_acquire(entry, cost, started)) > 0:
+                time.sleep(min(wait, settings.LLM_RATE_POLL_SECONDS))
+        except BaseException:
+            self._leave(entry)
+            raise
+        return self.clock() - started
+
+    async def aacquire(self, tokens: int = 0, requests: int = 1, priority: int = None) -> float:
+        """
+        acquire() for coroutines: waits without blocking the event loop.
+        """
+        if self.unlimited:
+            return 0.0
+        started = self.clock()
+        entry = self._enter(_priority.get() if priority is None else priority)
+        cost = self._cost(tokens, requests)
+        try:
+            while (wait := self._try_acquire(entry, cost, started)) > 0:
+                await asyncio.sleep(min(wait, settings.LLM_RATE_POLL_SECONDS))
+        except BaseException:
+            self._leave(entry)
+            raise
+        return self.clock() - started
+
+    def charge(self, tokens: int):
+        """
+        Takes tokens only known after the call (the completion) from the
+        bucket; it may go negative, which delays the next callers.
+        """
+        if not self.limits["tokens"] or not tokens:
+            return
+        with self._lock:
+            self._refill()
+            self.available["tokens"] -= tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+            for priority, _ in self._queue:
+                depth[PRIORITY_NAMES[priority]] += 1
+            return {
+                "queue_depth": depth,
+                "max_queue_depth": self._max_depth,
+                "granted": {PRIORITY_NAMES[p]: count for p, count in self._granted.items()},
+                "wait_p95_ms": {
+                    PRIORITY_NAMES[p]: round(percentile(waits, 0.95) * 1000, 1) if waits else None
+                    for p, waits in self._waits.items()
+                },
+                "wait_max_ms": {
+                    PRIORITY_NAMES[p]: round(max(waits) * 1000, 1) if waits else None
+                    for p, waits in self._waits.items()
+                },
+            }
+
+
+class CircuitBreaker:
+    """
+    Opens after LLM_BREAKER_FAILURES consecutive failures. Once
+    LLM_BREAKER_COOLDOWN_SECONDS have passed a single probe call is let
+    through (other callers keep being turned away); its success closes
+    the circuit, its failure re-opens it. A probe that never reports back
+    (cancelled, or routed but not called) is given up after another
+    cooldown.
+    """
+
+    def __init__(self, name: str, clock=time.monotonic):
+        self.name = name
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = None  # when the half-open probe was let through
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= settings.LLM_BREAKER_COOLDOWN_SECONDS:
+            return "half_open"
+        return "open"
+
+    def allows(self) -> bool:
+        state = self.state
+        if state != "half_open":
+            return state == "closed"
+        now = self.clock()
+        if self.probing is not None and now - self.probing < settings.LLM_BREAKER_COOLDOWN_SECONDS:
+            return False
+        self.probing = now
+        return True
+
+    def success(self):
+        if self.opened_at is not None:
+            logger.info(f"{self.name} circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = None
+
+    def failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (
+            self.opened_at is None and self.failures >= settings.LLM_BREAKER_FAILURES
+        ):
+            logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+            self.opened_at = self.clock()
+        self.probing = None
+
+
+class Provider:
+    """
+    A chat model plus rolling stats over its last LLM_STATS_WINDOW calls:
+    outcomes, ainvoke latency and streaming time to first token.
+    """
+
+    def __init__(self, name: str, attr: str, quota: str, window: int = None):
+        window = window or settings.LLM_STATS_WINDOW
+        self.name = name
+        self.attr = attr
+        self.quota = quota
+        self.outcomes = deque(maxlen=window)
+        self.latency = deque(maxlen=window)
+        self.ttft = deque(maxlen=window)
+        self.breaker = CircuitBreaker(name)
+
+    @property
+    def llm(self):
+        # Looked up on each call so tests can patch primary_llm / fallback_llm
+        return globals()[self.attr]
+
+    @property
+    def limiter(self) -> RateLimiter:
+        return rate_limiter(self.quota)
+
+    def success(self, latency: float = None):
+        self.outcomes.append(True)
+        if latency is not None:
+            self.latency.append(latency)
+        self.breaker.success()
+
+    def failure(self):
+        self.outcomes.append(False)
+        self.breaker.failure()
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "calls": len(self.outcomes),
+            "error_rate": round(self.error_rate, 3),
+            "latency_p50": percentile(self.latency, 0.5),
+            "latency_p95": percentile(self.latency, 0.95),
+            "ttft_p95": percentile(self.ttft, 0.95),
+            "circuit": self.breaker.state,
+        }
+
+
+def percentile(samples, q: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_providers = None
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def providers() -> List[Provider]:
+    global _providers
+    if _providers is None:
+        _providers = [Provider("OpenAI", "primary_llm", "openai"), Provider("Anthropic", "fallback_llm", "anthropic")]
+    return _providers
+
+
+def rate_limiter(quota: str) -> RateLimiter:
+    """
+    The process's limiter for a provider quota in LLM_RATE_LIMITS
+    ("openai" covers both chat and embeddings): its share of the quota,
+    split over LLM_RATE_LIMIT_PROCESSES.
+    """
+    with _limiters_lock:
+        if quota not in _limiters:
+            limits = settings.LLM_RATE_LIMITS.get(quota, {})
+            processes = max(1, settings.LLM_RATE_LIMIT_PROCESSES)
+            # Rounded up so a share never drops to 0 (= unlimited)
+            share = lambda limit: -(-limit // processes)
+            _limiters[quota] = RateLimiter(
+                quota,
+                requests_per_minute=share(limits.get("requests_per_minute", 0)),
+                tokens_per_minute=share(limits.get("tokens_per_minute", 0)),
+            )
+        return _limiters[quota]
+
+
+def reset_gateway():
+    """
+    Forgets all stats, closes every circuit and refills the rate limiters
+    (tests, settings changes).
+    """
+    global _providers
+    _providers = None
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def gateway_stats() -> dict:
+    return {provider.name: provider.stats() for provider in providers()}
+
+
+def rate_limit_stats() -> dict:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+def _route():
+    """
+    (first, second) providers to try, primary first, skipping open
+    circuits; second is None if only one is available.
+    """
+    available = [provider for provider in providers() if provider.breaker.allows()]
+    if not available:
+        raise ProviderUnavailable("All LLM provider circuits are open")
+    return available[0], (available[1] if len(available) > 1 else None)
+
+
+def _hedge_delay(samples):
+    """
+    Seconds to wait on the first provider before hedging: its p95 once
+    LLM_HEDGE_MIN_SAMPLES calls are recorded, else None (no hedge).
+    """
+    if not settings.LLM_HEDGE or len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+        return None
+    return percentile(samples, settings.LLM_HEDGE_PERCENTILE)
+
+
+async def _race(call, first: Provider, second: Provider, delay, discard=None, samples=None):
+    """
+    Awaits call(first), failing over to call(second) if it fails. If
+    first is still running after `delay` seconds, second is started
+    alongside it and whichever succeeds first wins; the other is cancelled
+    (discard() closes a loser that had already succeeded).
+
+    samples names first's deque ("latency" or "ttft") that gets its time
+    so far when it loses a hedge: cancelled calls never record their own,
+    and leaving them out would keep lowering the p95 that hedging uses.
+    """
+    if second is None:
+        return await call(first)
+
+    started = time.perf_counter()
+    running = [asyncio.create_task(call(first))]
+    winner = None
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(running, timeout=delay)
+            if not done:
+                logger.info(f"{first.name} slower than its p95 ({delay:.2f}s); hedging to {second.name}")
+                running.append(asyncio.create_task(call(second)))
+
+        pending, error = set(running), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    return task.result()
+                error = task.exception()
+                if len(running) == 1:
+                    logger.warning(f"{first.name} LLM failed: {error}. Falling back to {second.name}.")
+                    running.append(asyncio.create_task(call(second)))
+                    pending.add(running[-1])
+        raise error
+    finally:
+        losers = [task for task in running if task is not winner]
+        if samples and winner is not None and winner is not running[0] and not running[0].done():
+            getattr(first, samples).append(time.perf_counter() - started)
+        for task in losers:
+            task.cancel()
+        for result in await asyncio.gather(*losers, return_exceptions=True):
+            if discard and not isinstance(result, BaseException):
+                await discard(result)
+
+
+def _prompt_tokens(messages: List[BaseMessage]) -> int:
+    return sum(count_tokens(_text(message.content)) for message in messages)
+
+
+async def _invoke(provider: Provider, messages: List[BaseMessage]):
+    await provider.limiter.aacquire(tokens=_prompt_tokens(messages))
+    started = time.perf_counter()
+    try:
+        response = await provider.llm.ainvoke(messages)
+    except Exception:
+        provider.failure()
+        raise
+    provider.success(time.perf_counter() - started)
+    provider.limiter.charge(count_tokens(_text(response.content)))
+    return response
+
+
 async def safe_generate(messages: List[BaseMessage]):
+    """
+    One LLM answer: primary first, fallback if it fails or (hedged) if it
+    is slower than usual. Providers with an open circuit are skipped.
+    """
+    first, second = _route()
+    return await _race(
+        lambda provider: _invoke(provider, messages), first, second, _hedge_delay(first.latency), samples="latency",
+    )
+
+def _text(content) -> str:
+    # Anthropic streams content blocks; OpenAI streams plain strings
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") for block in content
+        if isinstance(block, dict) and block.get("type", "text") == "text"
+    )
+
+
+async def _texts(provider: Provider, chunks, head: str = "") -> AsyncGenerator[str, None]:
+    """
+    The text of a provider's stream (after head, its already-read first
+    text), recording how the stream ended and charging its tokens.
+    """
+    streamed = [head]
     try:
-        return await primary_llm.ainvoke(messages)
-    except Exception as e:
-        logger.warning(f"Primary LLM failed: {e}. Attempting fallback to Anthropic.")
-        return await fallback_llm.ainvoke(messages)
+        # aclosing: if our caller is cancelled or stops early, the HTTP
+        # stream is closed now rather than whenever the generator is GC'd
+        async with aclosing(chunks):
+            if head:
+                yield head
+            async for chunk in chunks:
+                if text := _text(chunk.content):
+                    streamed.append(text)
+                    yield text
+    except Exception:
+        provider.failure()
+        raise
+    finally:
+        provider.limiter.charge(count_tokens("".join(streamed)))
+    provider.success()
+
+
+async def _open_stream(provider: Provider, messages: List[BaseMessage]):
+    """
+    Starts a provider's stream and waits for its first text.
+    Returns (provider, first_text, chunks).
+    """
+    await provider.limiter.aacquire(tokens=_prompt_tokens(messages))
+    started = time.perf_counter()
+    chunks = provider.llm.astream(messages)
+    try:
+        async for chunk in chunks:
+            if text := _text(chunk.content):
+                provider.ttft.append(time.perf_counter() - started)
+                return provider, text, chunks
+    except BaseException as e:
+        await chunks.aclose()
+        if isinstance(e, Exception):
+            provider.failure()
+        raise
+    return provider, "", chunks
+
+
+async def _continue_on_fallback(provider: Provider, messages: List[BaseMessage], partial: str) -> AsyncGenerator[str, None]:
+    """
+    Streams the fallback's continuation of a partial answer (assistant
+    prefill), so text already sent to the client is never repeated.
+    """
+    # Anthropic rejects a prefill that ends in whitespace; that whitespace
+    # has been sent already, so drop it from the start of the continuation
+    prefill = partial.rstrip()
+    sent_whitespace = len(prefill) < len(partial)
+    first = True
+    messages = [*messages, AIMessage(content=prefill)]
+    await provider.limiter.aacquire(tokens=_prompt_tokens(messages))
+    chunks = provider.llm.astream(messages)
+    async with aclosing(_texts(provider, chunks)) as texts:
+        async for text in texts:
+            if first and sent_whitespace:
+                text = text.lstrip()
+            if text:
+                first = False
+                yield text
+
 
 async def safe_stream(messages: List[BaseMessage]) -> AsyncGenerator[str, None]:
     """
-    Streams tokens from the primary LLM with a basic fallback check.
+    Streams answer text. Up to the first token this works like
+    safe_generate (failover, hedging on time to first token); if the
+    primary fails mid-stream the fallback picks up where it stopped.
     """
+    first, second = _route()
+    provider, head, chunks = await _race(
+        lambda candidate: _open_stream(candidate, messages), first, second, _hedge_delay(first.ttft),
+        discard=lambda opened: opened[2].aclose(), samples="ttft",
+    )
+
+    emitted = []
     try:
-        async for chunk in primary_llm.astream(messages):
-            yield chunk.content
+        async with aclosing(_texts(provider, chunks, head)) as texts:
+            async for text in texts:
+                emitted.append(text)
+                yield text
+        return
     except Exception as e:
-        logger.warning(f"Primary streaming failed: {e}. Falling back to Anthropic stream.")
-        async for chunk in fallback_llm.astream(messages):
-            yield chunk.content
+        if provider is not first or second is None or not second.breaker.allows():
+            raise
+        partial = "".join(emitted)
+        logger.warning(f"{first.name} stream failed after {len(partial)} chars: {e}. Continuing on {second.name}.")
+
+    async with aclosing(_continue_on_fallback(second, messages, partial)) as texts:
+        async for text in texts:
+            yield text
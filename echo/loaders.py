@@ -1,4 +1,29 @@
 from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from pypdf import PdfReader, PageObject
+from pypdf.generic import NameObject
+
+# Page attributes a /Pages node passes down to its kids (PDF 1.7, 7.7.3.4)
+_INHERITABLE_PAGE_ATTRS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+def _walk_pages(reader: PdfReader, node_ref, inherited: dict):
+    node = node_ref.get_object()
+    if "/Kids" in node:
+        inherited = {
+            **inherited,
+            **{attr: node[attr] for attr in _INHERITABLE_PAGE_ATTRS if attr in node},
+        }
+        for kid in node["/Kids"]:
+            yield from _walk_pages(reader, kid, inherited)
+        return
+
+    page = PageObject(reader, node_ref)
+    page.update(node)
+    for attr, value in inherited.items():
+        if attr not in page:
+            page[NameObject(attr)] = value
+    yield page
 
 
 class DocumentLoader:
@@ -11,3 +36,46 @@ class DocumentLoader:
     def load_pdf(file_path: str):
         loader = PyPDFLoader(file_path)
         return loader.load()
+
+    @staticmethod
+    def count_pdf_pages(file_path: str) -> int:
+        with open(file_path, "rb") as fh:
+            return int(PdfReader(fh).trailer["/Root"]["/Pages"]["/Count"])
+
+    @staticmethod
+    def lazy_load_pdf(file_path: str, start: int = 0, stop: int = None):
+        """
+        Yields one Document per page (same text as load_pdf) while keeping
+        memory flat:
+        - the file is read on demand rather than slurped,
+        - the page tree is walked one leaf at a time (reader.pages would
+          flatten and keep every page object),
+        - pypdf's resolved-object cache is dropped after every page.
+
+        start/stop restrict extraction to pages [start, stop) so a large
+        PDF can be split across parse workers.
+        """
+        with open(file_path, "rb") as fh:
+            reader = PdfReader(fh)
+            root = reader.trailer["/Root"]
+            total_pages = int(root["/Pages"]["/Count"])
+            # Custom labels are rare; only then pay for the full label list
+            page_labels = reader.page_labels if "/PageLabels" in root else None
+
+            for page_number, page in enumerate(_walk_pages(reader, root.raw_get("/Pages"), {})):
+                if stop is not None and page_number >= stop:
+                    break
+                if page_number < start:
+                    reader.resolved_objects.clear()
+                    continue
+                text = page.extract_text(extraction_mode="plain")
+                yield Document(
+                    page_content=text.strip(),
+                    metadata={
+                        "source": file_path,
+                        "page": page_number,
+                        "page_label": page_labels[page_number] if page_labels else str(page_number + 1),
+                        "total_pages": total_pages,
+                    },
+                )
+                reader.resolved_objects.clear()
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+
+from echo.consumers import ChatConsumer
+
+WORDS = "the model was trained on four hundred thousand curated prompt response pairs".split()
+
+
+class ScriptedGraph:
+    """
+    Stands in for rag_graph: emits the answer as custom token events at a
+    fixed rate, like a streaming LLM.
+    """
+
+    def __init__(self, tokens, interval):
+        self.tokens = tokens
+        self.interval = interval
+
+    async def astream(self, input, config, stream_mode):
+        for token in self.tokens:
+            await asyncio.sleep(self.interval)
+            yield "custom", {"token": token}
+        yield "updates", {"generate": {"prompt_tokens": {"generate": 1200}, "timings": {"generate_ttft": 0.3}}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams answers to many concurrent chat WebSockets through ChatConsumer "
+        "(in-memory ASGI transport) and compares one frame per token with "
+        "coalesced frames: frames/s and process CPU per streamed answer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chats", type=int, default=200)
+        parser.add_argument("--tokens", type=int, default=300, help="Tokens per answer")
+        parser.add_argument("--token-interval-ms", type=float, default=10.0)
+        parser.add_argument(
+            "--modes", nargs="+", default=["frame_chars=0", "frame_chars=64&frame_ms=20"],
+            help="Query strings to compare (frame_chars=0 is one frame per token)",
+        )
+
+    def handle(self, *args, **options):
+        tokens = [f"{WORDS[i % len(WORDS)]} " for i in range(options["tokens"])]
+        graph = ScriptedGraph(tokens, options["token_interval_ms"] / 1000)
+        self.stdout.write(
+            f"{options['chats']} concurrent chats x {options['tokens']} tokens, "
+            f"one token every {options['token_interval_ms']}ms"
+        )
+        self.stdout.write(
+            f"{'mode':<28} {'frames/answer':>14} {'frames/s':>10} {'CPU ms/answer':>14} {'wall s':>7}"
+        )
+        with patch("echo.consumers.rag_graph", graph):
+            for mode in options["modes"]:
+                asyncio.run(self._run(mode, options["chats"]))
+
+    async def _chat(self, index, mode):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f"/ws/chat/?{mode}")
+        communicator.scope["session"] = SimpleNamespace(session_key=f"bench-{index}")
+        await communicator.connect()
+        await communicator.send_json_to({"message": "How many pairs?", "document_id": None})
+        frames = 0
+        while True:
+            frame = await communicator.receive_json_from(timeout=60)
+            if frame.get("type") == "end":
+                break
+            frames += 1
+        await communicator.disconnect()
+        return frames
+
+    async def _run(self, mode, chats):
+        cpu, wall = time.process_time(), time.perf_counter()
+        frames = await asyncio.gather(*(self._chat(index, mode) for index in range(chats)))
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        total = sum(frames)
+        self.stdout.write(
+            f"{mode:<28} {total / chats:>14.1f} {total / wall:>10.0f} {cpu * 1000 / chats:>14.2f} {wall:>7.2f}"
+        )
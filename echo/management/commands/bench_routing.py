@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from langchain_core.documents import Document
+
+from echo.management.commands.bench_vectorstore import INSERT_BATCH, VectorsOnly
+from echo.routing import DocumentRoutingIndex
+from echo.vectorstore import vector_store_registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Recall-vs-latency benchmark of centroid routing against flat search "
+        "on a synthetic clustered corpus. Recall@k is measured against exact "
+        "brute-force top-k."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents", type=int, default=200)
+        parser.add_argument("--chunks-per-document", type=int, default=50)
+        parser.add_argument("--dim", type=int, default=384)
+        parser.add_argument("--spread", type=float, default=2.0, help="Chunk noise relative to its document's topic vector; higher makes documents overlap")
+        parser.add_argument("--query-noise", type=float, default=0.5, help="Query noise relative to the chunk it paraphrases")
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--candidates", type=int, nargs="+", default=[1, 3, 5, 10, 20])
+        parser.add_argument(
+            "--partitioning", nargs="+", default=["none", "document"], choices=["none", "document", "shard"],
+            help="VECTORSTORE_PARTITIONING modes to run the comparison under",
+        )
+
+    def handle(self, *args, **options):
+        for partitioning in options["partitioning"]:
+            directory = tempfile.mkdtemp(prefix="bench_routing_")
+            try:
+                with override_settings(
+                    CHROMA_DB_DIR=directory, NUMPY_INDEX_DIR=directory, VECTORSTORE_PARTITIONING=partitioning
+                ):
+                    self.stdout.write(f"\nVECTORSTORE_PARTITIONING = {partitioning!r}")
+                    self._run(options)
+            finally:
+                vector_store_registry.shutdown()
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _noise(self, rng, shape, scale):
+        # Scaled so `scale` is the noise norm relative to a unit vector
+        return scale / np.sqrt(shape[-1]) * rng.standard_normal(shape, dtype=np.float32)
+
+    def _run(self, options):
+        rng = np.random.default_rng(0)
+        documents, per_doc, dim, k = (
+            options["documents"], options["chunks_per_document"], options["dim"], options["k"]
+        )
+        topics = rng.standard_normal((documents, dim), dtype=np.float32)
+        topics /= np.linalg.norm(topics, axis=1, keepdims=True)
+        vectors = np.repeat(topics, per_doc, axis=0)
+        vectors += self._noise(rng, vectors.shape, options["spread"])
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        routing = DocumentRoutingIndex(VectorsOnly(), collection_name="bench")
+        for start in range(0, len(vectors), INSERT_BATCH):
+            stop = min(start + INSERT_BATCH, len(vectors))
+            routing.chunks.add_embedded(
+                [Document(page_content=str(row), metadata={"document_id": f"doc-{row // per_doc}"}) for row in range(start, stop)],
+                vectors[start:stop].tolist(),
+                ids=[str(row) for row in range(start, stop)],
+            )
+        for document in range(documents):
+            routing.update_document(f"doc-{document}")
+
+        # Queries near real chunks, like a question about a passage
+        picked = rng.choice(len(vectors), options["queries"], replace=False)
+        queries = vectors[picked] + self._noise(rng, (len(picked), dim), options["query_noise"])
+        truth = [set(np.argsort(-(vectors @ query))[:k].astype(str)) for query in queries]
+
+        self.stdout.write(f"{len(vectors)} chunks in {documents} documents, dim {dim}, k={k}")
+        self.stdout.write(f"{'search':<12} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        self._report("flat", truth, queries, lambda q: routing.chunks.search_by_vector_with_scores(q, k=k))
+        for n in options["candidates"]:
+            self._report(f"routed N={n}", truth, queries, lambda q: routing.search_by_vector_with_scores(q, k=k, n=n))
+
+    def _report(self, label, truth, queries, search):
+        latencies, recalls = [], []
+        for expected, query in zip(truth, queries):
+            start = time.perf_counter()
+            hits = search(query.tolist())
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected & {doc.page_content for doc, _ in hits}) / len(expected))
+        self.stdout.write(
+            f"{label:<12} {np.mean(recalls):>9.3f} "
+            f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f}"
+        )
@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from langchain_core.documents import Document
+
+from echo.vectorstore import VECTORSTORE_BACKENDS
+
+# Chroma rejects larger upserts (max_batch_size is ~5.4k)
+INSERT_BATCH = 5000
+
+
+class VectorsOnly:
+    """
+    Embeddings stand-in: the benchmark hands both backends pre-computed
+    vectors, so nothing should ever be embedded.
+    """
+
+    def embed_query(self, text):
+        raise AssertionError("benchmark should only search by vector")
+
+    embed_documents = embed_query
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks vector store backends on synthetic data: build time and "
+        "p50/p95 query latency, unfiltered and filtered by document_id. "
+        "1M x 1536-d is ~6GB of vectors; lower --dim or --sizes to fit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--backends", nargs="+", default=sorted(VECTORSTORE_BACKENDS), choices=sorted(VECTORSTORE_BACKENDS))
+        parser.add_argument("--dim", type=int, default=1536, help="Vector size (text-embedding-3-small: 1536)")
+        parser.add_argument("--documents", type=int, default=100, help="Distinct document_ids the chunks are spread over")
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--k", type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'backend':<8} {'chunks':>9} {'build s':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'filt p50':>9} {'filt p95':>9}"
+        )
+        for size in options["sizes"]:
+            for backend in options["backends"]:
+                row = self._bench(backend, size, options)
+                self.stdout.write(
+                    f"{backend:<8} {size:>9} {row['build']:>9.1f} "
+                    f"{row['p50']:>8.2f} {row['p95']:>8.2f} "
+                    f"{row['filtered_p50']:>9.2f} {row['filtered_p95']:>9.2f}"
+                )
+
+    def _bench(self, backend, size, options):
+        dim, documents, k = options["dim"], options["documents"], options["k"]
+        directory = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+        # Same seed per size, so every backend indexes the same corpus
+        rng = np.random.default_rng(size)
+        try:
+            with self.settings_for(directory):
+                service = VECTORSTORE_BACKENDS[backend](VectorsOnly(), collection_name="bench")
+
+                start = time.perf_counter()
+                for offset in range(0, size, INSERT_BATCH):
+                    count = min(INSERT_BATCH, size - offset)
+                    service.add_embedded(
+                        [
+                            Document(
+                                page_content=f"chunk {offset + i}",
+                                # Contiguous per document, like real ingestion
+                                metadata={"document_id": f"doc-{(offset + i) * documents // size}"},
+                            )
+                            for i in range(count)
+                        ],
+                        rng.standard_normal((count, dim), dtype=np.float32).tolist(),
+                        ids=[f"c{offset + i}" for i in range(count)],
+                    )
+                build = time.perf_counter() - start
+                service.warmup()
+
+                queries = rng.standard_normal((options["queries"], dim), dtype=np.float32).tolist()
+                unfiltered = self._latencies(service, queries, k, None)
+                filtered = self._latencies(
+                    service, queries, k, lambda n: {"document_id": f"doc-{n % documents}"}
+                )
+                service.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        return {
+            "build": build,
+            "p50": np.percentile(unfiltered, 50),
+            "p95": np.percentile(unfiltered, 95),
+            "filtered_p50": np.percentile(filtered, 50),
+            "filtered_p95": np.percentile(filtered, 95),
+        }
+
+    def _latencies(self, service, queries, k, make_filter):
+        latencies = []
+        for n, query in enumerate(queries):
+            metadata_filter = make_filter(n) if make_filter else None
+            start = time.perf_counter()
+            service.search_by_vector_with_scores(query, k=k, metadata_filter=metadata_filter)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def settings_for(self, directory):
+        from django.test.utils import override_settings
+
+        return override_settings(CHROMA_DB_DIR=directory, NUMPY_INDEX_DIR=directory)
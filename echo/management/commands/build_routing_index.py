@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from echo.embeddings import embeddings
+from echo.models import Document, ProcessingStatus
+from echo.routing import DocumentRoutingIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds document routing entries (chunk-embedding centroids) for every "
+        "INDEXED document from its stored vectors. Ingestion keeps the index up "
+        "to date; run this once for documents indexed before routing existed."
+    )
+
+    def handle(self, *args, **options):
+        index = DocumentRoutingIndex(embeddings)
+        built = 0
+        for document in Document.objects.filter(processing_status=ProcessingStatus.INDEXED).iterator():
+            chunks = index.update_document(str(document.id), title=document.title)
+            if chunks:
+                built += 1
+            else:
+                self.stdout.write(self.style.WARNING(f"No chunks stored for {document.id} ({document.title})"))
+        self.stdout.write(self.style.SUCCESS(f"Routing entries built for {built} document(s)"))
@@ -0,0 +1,86 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from echo.eval import GOLDEN_PAIRS
+from echo.rag_engine import retrieval_hits
+
+# Questions the indexed documents should not be able to answer
+OFF_TOPIC = [
+    "What is the recipe for chocolate cake?",
+    "Who won the 1998 FIFA World Cup?",
+    "How do I change a flat tyre on a bicycle?",
+    "What is the capital of Australia?",
+    "Which planets in the solar system have rings?",
+    "How long should I boil an egg?",
+    "What are the rules of cricket?",
+]
+
+
+def pick_threshold(answerable, off_topic, margin: float = 0.1):
+    """
+    Best-hit distances of answerable and off-topic questions -> the
+    RAG_RELEVANCE_MAX_DISTANCE that classifies the most of them right
+    (ties go to the larger distance: refusing an answerable question is
+    worse than one wasted LLM call). The threshold sits halfway to the
+    next distance, or margin above the furthest answerable one.
+    """
+    if not answerable:
+        raise ValueError("No answerable questions to calibrate with")
+
+    def correct(threshold):
+        return sum(d <= threshold for d in answerable) + sum(d > threshold for d in off_topic)
+
+    best = max(sorted(answerable), key=lambda threshold: (correct(threshold), threshold))
+    further = [d for d in off_topic if d > best]
+    if further:
+        return (best + min(further)) / 2
+    return best * (1 + margin)
+
+
+class Command(BaseCommand):
+    help = (
+        "Picks RAG_RELEVANCE_MAX_DISTANCE from the indexed documents: retrieves "
+        "for the golden questions from echo/eval.py (answerable) and a set of "
+        "off-topic ones the way the chat graph does, query expansion included "
+        "(one LLM call per question), and prints the distance that best "
+        "separates them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--document-id", help="Search one document (default: routed global search)")
+        parser.add_argument("--off-topic", nargs="+", default=OFF_TOPIC, help="Questions the documents can't answer")
+        parser.add_argument("--margin", type=float, default=0.1)
+
+    def handle(self, *args, **options):
+        answerable = [question for question, _ in GOLDEN_PAIRS]
+        distances = asyncio.run(self._best_distances(answerable + options["off_topic"], options["document_id"]))
+        answerable_d, off_topic_d = distances[:len(answerable)], distances[len(answerable):]
+
+        self.stdout.write(f"{'best distance':>13}  question")
+        for label, questions, found in (("answerable", answerable, answerable_d), ("off-topic", options["off_topic"], off_topic_d)):
+            self.stdout.write(label)
+            for question, distance in zip(questions, found):
+                self.stdout.write(f"{distance:>13.4f}  {question}" if distance is not None else f"{'no hits':>13}  {question}")
+
+        answerable_d = [d for d in answerable_d if d is not None]
+        off_topic_d = [d for d in off_topic_d if d is not None]
+        if not answerable_d:
+            self.stderr.write("No hits for the golden questions; index the GPT4All report first.")
+            return
+
+        threshold = pick_threshold(answerable_d, off_topic_d, options["margin"])
+        kept = sum(d <= threshold for d in answerable_d)
+        skipped = sum(d > threshold for d in off_topic_d)
+        self.stdout.write(
+            f"\nanswerable kept: {kept}/{len(answerable_d)}, off-topic skipped: {skipped}/{len(off_topic_d)}"
+            f" ({settings.VECTORSTORE_BACKEND} backend)"
+        )
+        self.stdout.write(f"RAG_RELEVANCE_MAX_DISTANCE = {threshold:.4f}")
+
+    async def _best_distances(self, questions, document_id):
+        # The hits is_relevant gates on: expanded query, merged with the raw
+        # question's hits in speculative mode
+        results = await asyncio.gather(*(retrieval_hits(question, document_id) for question in questions))
+        return [min((hit["score"] for hit in hits), default=None) for hits in results]
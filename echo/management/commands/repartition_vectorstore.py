@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from echo.embeddings import embeddings
+from echo.partitions import PARTITIONING_MODES, PartitionRouter
+from echo.vectorstore import DEFAULT_COLLECTION, vector_store_registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves chunks from a single Chroma collection into per-document or "
+        "per-shard partitions, reusing the stored embeddings (nothing is "
+        "re-embedded). Set VECTORSTORE_PARTITIONING to the same mode afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=PARTITIONING_MODES, default=None, help="Default: VECTORSTORE_PARTITIONING")
+        parser.add_argument("--shards", type=int, default=None, help="Default: VECTORSTORE_SHARDS")
+        parser.add_argument("--collection", default=DEFAULT_COLLECTION, help="Source collection")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--keep-source",
+            action="store_true",
+            help="Leave moved chunks in the source too (global queries will then see them twice)",
+        )
+
+    def handle(self, *args, **options):
+        if settings.VECTORSTORE_BACKEND != "chroma":
+            raise CommandError("repartition_vectorstore only migrates Chroma directories")
+
+        mode = options["mode"] or settings.VECTORSTORE_PARTITIONING
+        if mode not in PARTITIONING_MODES:
+            raise CommandError(f"Pass --mode ({' or '.join(PARTITIONING_MODES)})")
+        if mode != settings.VECTORSTORE_PARTITIONING:
+            self.stdout.write(self.style.WARNING(
+                f"VECTORSTORE_PARTITIONING is '{settings.VECTORSTORE_PARTITIONING}'; "
+                f"set it to '{mode}' before serving from the new partitions"
+            ))
+
+        source = vector_store_registry.get(embeddings, options["collection"])
+        router = PartitionRouter(embeddings, options["collection"], mode=mode, shards=options["shards"])
+
+        moved_ids, kept = [], 0
+        for ids, documents, vectors in source.iter_embedded(batch_size=options["batch_size"]):
+            # Unscoped chunks already live where the router looks for them
+            scoped = [i for i, doc in enumerate(documents) if doc.metadata.get("document_id") is not None]
+            kept += len(ids) - len(scoped)
+            if scoped:
+                router.add_embedded(
+                    [documents[i] for i in scoped],
+                    [vectors[i] for i in scoped],
+                    ids=[ids[i] for i in scoped],
+                )
+                moved_ids.extend(ids[i] for i in scoped)
+            self.stdout.write(f"Copied {len(moved_ids)} chunk(s)...")
+
+        # Delete only after everything is copied: deleting while paging
+        # would shift the offsets under iter_embedded.
+        if not options["keep_source"]:
+            for start in range(0, len(moved_ids), options["batch_size"]):
+                source.delete(moved_ids[start:start + options["batch_size"]])
+
+        partitions = router.partitions()[1:]
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {len(moved_ids)} chunk(s) into {len(partitions)} {mode} partition(s); "
+            f"{kept} unscoped chunk(s) left in '{options['collection']}'"
+        ))
@@ -0,0 +1,44 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+
+from echo.embeddings import embeddings
+from echo.jobs import IngestionWorkerPool, recover_pending_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs ingestion workers against the durable job queue. Use with "
+        "INGESTION_WORKERS_IN_PROCESS = False. WebSocket notifications need a "
+        "shared channel layer (e.g. Redis) to reach clients from this process, "
+        "and provider rate limits are per process: count it in "
+        "LLM_RATE_LIMIT_PROCESSES."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Concurrent workers (default: INGESTION_WORKERS)")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit instead of polling forever")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options["workers"], options["once"]))
+
+    async def _run(self, workers, once):
+        recovered = await sync_to_async(recover_pending_documents)()
+        self.stdout.write(f"Re-queued {recovered} stale PENDING document(s)")
+
+        pool = IngestionWorkerPool(embeddings, workers=workers)
+
+        if once:
+            processed = 0
+            while await pool.run_once():
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)"))
+            return
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(f"Running {pool.workers} ingestion worker(s); Ctrl+C to stop"))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await pool.stop()
@@ -0,0 +1,98 @@
+import asyncio
+import gc
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from echo.checkpoint import SQLiteCheckpointSaver
+from echo.rag_engine import compile_workflow
+
+CHUNK = "GPT4All was trained on 437,605 prompt-response pairs collected with GPT-3.5-Turbo. " * 10
+
+
+async def stub_search(state, query):
+    return [{"content": CHUNK, "score": 0.1, "metadata": {}}]
+
+
+async def stub_generate(messages):
+    return AIMessage(content="Stub answer. " * 40)
+
+
+async def stub_stream(messages):
+    for _ in range(40):
+        yield "Stub answer. "
+
+
+class Command(BaseCommand):
+    help = (
+        "Soak test for conversation persistence: runs many short chat sessions "
+        "through rag_graph (retrieval and LLM stubbed) and samples Python heap "
+        "usage, comparing MemorySaver with the SQLite checkpointer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions", type=int, default=10000)
+        parser.add_argument("--turns", type=int, default=2, help="Questions per session")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--samples", type=int, default=10)
+        parser.add_argument("--ttl", type=float, default=5.0, help="CHECKPOINT_THREAD_TTL_SECONDS for the SQLite run")
+        parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"], choices=["memory", "sqlite"])
+
+    def handle(self, *args, **options):
+        for backend in options["backends"]:
+            directory = tempfile.mkdtemp(prefix="soak_checkpoints_")
+            path = os.path.join(directory, "checkpoints.sqlite3")
+            saver = MemorySaver() if backend == "memory" else SQLiteCheckpointSaver(path, thread_ttl=options["ttl"])
+            try:
+                with override_settings(RAG_EXPANSION_BUDGET_SECONDS=0), \
+                        patch("echo.rag_engine._search", stub_search), \
+                        patch("echo.rag_engine.safe_generate", stub_generate), \
+                        patch("echo.rag_engine.safe_stream", stub_stream), \
+                        patch("echo.rag_engine.get_checkpointer", return_value=saver):
+                    graph = compile_workflow(speculative=False)
+                    self.stdout.write(f"\n{backend}")
+                    asyncio.run(self._soak(graph, saver, path, options))
+            finally:
+                if hasattr(saver, "close"):
+                    saver.close()
+                shutil.rmtree(directory, ignore_errors=True)
+
+    async def _session(self, graph, session, turns):
+        config = {"configurable": {"thread_id": f"soak-{session}"}}
+        for turn in range(turns):
+            await graph.ainvoke({"question": f"question {turn} of session {session}"}, config)
+
+    async def _soak(self, graph, saver, path, options):
+        sessions, concurrency = options["sessions"], options["concurrency"]
+        every = max(1, sessions // options["samples"])
+        self.stdout.write(f"{'sessions':>9} {'heap MB':>9} {'db MB':>8} {'sessions/s':>11}")
+
+        tracemalloc.start()
+        start, done = time.perf_counter(), 0
+        try:
+            while done < sessions:
+                batch = range(done, min(done + concurrency, sessions))
+                await asyncio.gather(*(self._session(graph, session, options["turns"]) for session in batch))
+                done = batch.stop
+                if done % every < concurrency or done == sessions:
+                    if hasattr(saver, "flush"):
+                        saver.flush()
+                    gc.collect()
+                    heap = tracemalloc.get_traced_memory()[0] / 2**20
+                    disk = sum(
+                        os.path.getsize(f"{path}{suffix}")
+                        for suffix in ("", "-wal") if os.path.exists(f"{path}{suffix}")
+                    ) / 2**20
+                    self.stdout.write(
+                        f"{done:>9} {heap:>9.1f} {disk:>8.1f} {done / (time.perf_counter() - start):>11.0f}"
+                    )
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,108 @@
+"""
+Conversation memory policy for rag_graph threads.
+
+- Prompts get only the most recent turns that fit
+  RAG_HISTORY_TOKEN_BUDGET, plus a rolling summary of anything older.
+- Once a thread's stored messages pass RAG_MEMORY_TOKEN_LIMIT, the turns
+  outside the window are folded into the summary and removed from the
+  state, so a long session's checkpoint stops growing.
+"""
+import logging
+
+from django.conf import settings
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+
+from .tokens import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message overhead for role markers in the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and a document "
+    "assistant. Keep names, numbers, documents discussed and open questions. "
+    "Reply with the summary only, under {words} words."
+)
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def prompt_tokens(messages) -> int:
+    return sum(message_tokens(message) for message in messages)
+
+
+def recent_window(messages, budget: int = None):
+    """
+    The newest messages that fit the token budget, starting on a human
+    turn. The last message (the current question) is always included.
+    """
+    if budget is None:
+        budget = settings.RAG_HISTORY_TOKEN_BUDGET
+    if not messages:
+        return []
+
+    start, used = len(messages) - 1, message_tokens(messages[-1])
+    for index in range(len(messages) - 2, -1, -1):
+        used += message_tokens(messages[index])
+        if used > budget:
+            break
+        start = index
+    # Don't open the window on an orphaned AI reply
+    while start < len(messages) - 1 and not isinstance(messages[start], HumanMessage):
+        start += 1
+    return list(messages[start:])
+
+
+def with_summary(system_text: str, summary: str) -> str:
+    if not summary:
+        return system_text
+    return f"{system_text}\n\nSUMMARY OF THE EARLIER CONVERSATION:\n{summary}"
+
+
+def prompt_messages(system_text: str, state) -> list:
+    """
+    System prompt (plus summary) followed by the recent window. The
+    current question is already the last message in state["messages"].
+    """
+    return [
+        SystemMessage(content=with_summary(system_text, state.get("summary"))),
+        *recent_window(state.get("messages") or []),
+    ]
+
+
+async def compact(messages, summary: str, summarize, limit: int = None):
+    """
+    Returns a {"summary", "messages"} state update that folds everything
+    outside the recent window into the summary, or {} while the thread
+    is under RAG_MEMORY_TOKEN_LIMIT.
+
+    summarize is the LLM call (safe_generate). If it fails the old turns
+    are still dropped and the previous summary kept, so the ceiling holds.
+    """
+    if limit is None:
+        limit = settings.RAG_MEMORY_TOKEN_LIMIT
+    if prompt_tokens(messages) <= limit:
+        return {}
+
+    keep = recent_window(messages)
+    old = messages[:len(messages) - len(keep)]
+    if not old:
+        return {}
+
+    summary_limit = settings.RAG_SUMMARY_TOKEN_LIMIT
+    transcript = "\n".join(f"{message.type}: {message.content}" for message in old)
+    try:
+        response = await summarize([
+            SystemMessage(content=SUMMARY_PROMPT.format(words=int(summary_limit * 0.75))),
+            HumanMessage(content=f"CURRENT SUMMARY:\n{summary or '(none)'}\n\nNEW TURNS:\n{transcript}"),
+        ])
+        summary = truncate_tokens(response.content, summary_limit)
+    except Exception as exc:
+        logger.warning(f"Conversation summary failed ({exc}); dropping {len(old)} old messages unsummarised")
+
+    logger.info(f"Compacted {len(old)} messages into the conversation summary")
+    return {"summary": summary or "", "messages": [RemoveMessage(id=message.id) for message in old]}
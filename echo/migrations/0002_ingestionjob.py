@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('echo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=20)),
+                ('stage', models.CharField(choices=[('PARSE', 'Parse'), ('CHUNK', 'Chunk'), ('EMBED', 'Embed and upsert'), ('DONE', 'Done')], default='PARSE', max_length=20)),
+                ('checkpoint', models.JSONField(blank=True, default=dict)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('leased_until', models.DateTimeField(blank=True, null=True)),
+                ('worker_id', models.CharField(blank=True, default='', max_length=64)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_jobs', to='echo.document')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'available_at'], name='echo_ingest_status_435f0c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('echo', '0002_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='index_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,9 +1,15 @@
 from django.db import models
 import hashlib
+import logging
 import uuid
 import os
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .answer_cache import invalidate_document
+
+logger = logging.getLogger(__name__)
 
 class ProcessingStatus(models.TextChoices):
     PENDING = "PENDING", "Pending"
@@ -27,6 +33,8 @@ class Document(models.Model):
         default=ProcessingStatus.PENDING,
     )
     is_indexed = models.BooleanField(default=False)
+    # Bumped every time ingestion completes; part of the answer cache key
+    index_version = models.PositiveIntegerField(default=0)
     
     # Essential for interview: shows you handle "Generative AI" failures (like OOM or Parsing errors)
     error_message = models.TextField(blank=True, null=True)
@@ -56,4 +64,64 @@ def delete_file_on_document_delete(sender, instance, **kwargs):
                 os.remove(instance.file.path)
                 print(f"Successfully deleted file: {instance.file.path}")
             except Exception as e:
-                print(f"Error deleting file: {e}")
\ No newline at end of file
+                print(f"Error deleting file: {e}")
+
+
+@receiver(post_delete, sender=Document)
+def invalidate_answers_on_document_delete(sender, instance, **kwargs):
+    invalidate_document(instance.id)
+
+@receiver(post_delete, sender=Document)
+def remove_routing_entry_on_document_delete(sender, instance, **kwargs):
+    # Imported here: the vector store stack is heavy and not needed by models
+    from .embeddings import embeddings
+    from .routing import DocumentRoutingIndex
+
+    try:
+        DocumentRoutingIndex(embeddings).remove_document(instance.id)
+    except Exception:
+        logger.exception(f"Failed to remove routing entry for document {instance.id}")
+
+class JobStatus(models.TextChoices):
+    QUEUED = "QUEUED", "Queued"
+    RUNNING = "RUNNING", "Running"
+    DONE = "DONE", "Done"
+    FAILED = "FAILED", "Failed"
+
+
+class IngestionStage(models.TextChoices):
+    PARSE = "PARSE", "Parse"
+    CHUNK = "CHUNK", "Chunk"
+    # Embed + upsert are checkpointed together: a batch only counts as
+    # completed once its vectors are in the store.
+    EMBED = "EMBED", "Embed and upsert"
+    DONE = "DONE", "Done"
+
+
+class IngestionJob(models.Model):
+    """
+    Durable ingestion work item. Workers lease a job for a visibility
+    timeout; a crashed worker's lease simply expires and the job is picked
+    up again, resuming from `checkpoint`.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="ingestion_jobs")
+
+    status = models.CharField(max_length=20, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    stage = models.CharField(max_length=20, choices=IngestionStage.choices, default=IngestionStage.PARSE)
+    # e.g. {"completed_batches": [0, 1, 2]}
+    checkpoint = models.JSONField(default=dict, blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    leased_until = models.DateTimeField(blank=True, null=True)
+    worker_id = models.CharField(max_length=64, blank=True, default="")
+    last_error = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "available_at"])]
+
+    def __str__(self):
+        return f"Job {self.id} for {self.document_id} ({self.status}/{self.stage})"
@@ -0,0 +1,335 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.float32
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyVectorIndex:
+    """
+    Exact, in-process vector index for corpora small enough to scan.
+
+    Files under <directory>/<collection_name>/:
+    - vectors.f32: row-major float32 matrix of L2-normalised embeddings,
+      memory-mapped for search and appended to on insert.
+    - chunks.sqlite3: row -> (id, document_id, text, metadata JSON).
+
+    document_id -> row ranges are kept in memory (ingestion appends each
+    document's chunks contiguously, so a document is a handful of ranges)
+    and filtered searches only score those rows.
+
+    Scores are cosine distances (1 - cosine similarity): lower is closer,
+    like the Chroma distances VectorStoreService returns.
+    """
+
+    def __init__(self, directory: str, collection_name: str):
+        self.path = os.path.join(directory, collection_name)
+        os.makedirs(self.path, exist_ok=True)
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._lock = threading.RLock()
+
+        self._conn = sqlite3.connect(
+            os.path.join(self.path, "chunks.sqlite3"), check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY,"
+            " id TEXT NOT NULL UNIQUE,"
+            " document_id TEXT,"
+            " content TEXT NOT NULL,"
+            " metadata TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        # Bumped whenever rows are renumbered (delete), so a search that
+        # scored the old matrix doesn't fetch the wrong chunks
+        self._generation = 0
+        self._load()
+
+    def _load(self):
+        row = self._conn.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+        # Vectors are written before their rows commit; drop any tail left
+        # behind by a crash between the two.
+        if self.dim and os.path.exists(self._vectors_path):
+            expected = self._rows * self.dim * DTYPE().itemsize
+            if os.path.getsize(self._vectors_path) > expected:
+                logger.warning(f"Truncating uncommitted vectors in {self._vectors_path}")
+                os.truncate(self._vectors_path, expected)
+
+        self._doc_ranges = {}
+        for row, document_id in self._conn.execute(
+            "SELECT row, document_id FROM chunks ORDER BY row"
+        ):
+            self._extend_range(document_id, row)
+        self._remap()
+
+    def _remap(self):
+        if self._rows and self.dim:
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=DTYPE, mode="r", shape=(self._rows, self.dim)
+            )
+        else:
+            self._vectors = np.empty((0, self.dim or 0), dtype=DTYPE)
+
+    def _extend_range(self, document_id, row: int):
+        ranges = self._doc_ranges.setdefault(document_id, [])
+        if ranges and ranges[-1][1] == row:
+            ranges[-1][1] = row + 1
+        else:
+            ranges.append([row, row + 1])
+
+    def count(self) -> int:
+        return self._rows
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return [chunk_id for (chunk_id,) in self._conn.execute("SELECT id FROM chunks ORDER BY row")]
+
+    def upsert(self, ids: List[str], vectors, contents: List[str], metadatas: List[dict]):
+        """
+        Inserts new ids at the end, overwrites existing ids in place. An id
+        repeated within the batch is stored once (the last one wins).
+        """
+        vectors = _normalise(np.asarray(vectors, dtype=DTYPE))
+        last = {chunk_id: position for position, chunk_id in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids = [ids[p] for p in keep]
+            vectors = vectors[keep]
+            contents = [contents[p] for p in keep]
+            metadatas = [metadatas[p] for p in keep]
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO info (key, value) VALUES ('dim', ?)", (str(self.dim),)
+                    )
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}-d")
+
+            existing = self._existing_rows(ids)
+            rows, new_positions, old_positions = [], [], []
+            next_row = self._rows
+            for position, chunk_id in enumerate(ids):
+                if chunk_id in existing:
+                    rows.append(existing[chunk_id][0])
+                    old_positions.append(position)
+                else:
+                    rows.append(next_row)
+                    new_positions.append(position)
+                    next_row += 1
+
+            if old_positions:
+                stored = np.memmap(
+                    self._vectors_path, dtype=DTYPE, mode="r+", shape=(self._rows, self.dim)
+                )
+                stored[[rows[p] for p in old_positions]] = vectors[old_positions]
+                stored.flush()
+                del stored
+            if new_positions:
+                # Write at the committed end, not EOF, so a failed earlier
+                # batch can't shift rows out of line with the table.
+                mode = "r+b" if os.path.exists(self._vectors_path) else "wb"
+                with open(self._vectors_path, mode) as fh:
+                    fh.seek(self._rows * self.dim * DTYPE().itemsize)
+                    fh.write(vectors[new_positions].tobytes())
+                    fh.truncate()
+
+            document_ids = [metadata.get("document_id") for metadata in metadatas]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, id, document_id, content, metadata) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (row, chunk_id, document_id, content, json.dumps(metadata))
+                        for row, chunk_id, document_id, content, metadata
+                        in zip(rows, ids, document_ids, contents, metadatas)
+                    ],
+                )
+
+            self._rows = next_row
+            for position in new_positions:
+                self._extend_range(document_ids[position], rows[position])
+            if any(existing[ids[p]][1] != document_ids[p] for p in old_positions):
+                # An overwrite may have moved a row to another document
+                self._doc_ranges = {}
+                for row, document_id in self._conn.execute(
+                    "SELECT row, document_id FROM chunks ORDER BY row"
+                ):
+                    self._extend_range(document_id, row)
+            self._remap()
+        return ids
+
+    def _existing_rows(self, ids: List[str]) -> dict:
+        # {id: (row, document_id)} for ids already stored
+        found = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for chunk_id, row, document_id in self._conn.execute(
+                f"SELECT id, row, document_id FROM chunks WHERE id IN ({placeholders})", batch
+            ):
+                found[chunk_id] = (row, document_id)
+        return found
+
+    def _filter_rows(self, metadata_filter: dict, total: int):
+        """
+        Candidate rows for an equality filter, or None for "all rows".
+        document_id is answered from the range index; any other key is
+        looked up in the metadata table. Keys combine as AND via a mask.
+        """
+        if not metadata_filter:
+            return None
+
+        mask = np.ones(total, dtype=bool)
+        for key, value in metadata_filter.items():
+            key_mask = np.zeros(total, dtype=bool)
+            if key == "document_id":
+                for start, stop in self._doc_ranges.get(value, ()):
+                    key_mask[start:min(stop, total)] = True
+            else:
+                rows = [row for (row,) in self._conn.execute(
+                    "SELECT row FROM chunks WHERE json_extract(metadata, ?) = ?",
+                    (f"$.{key}", value),
+                )]
+                rows = np.asarray(rows, dtype=np.int64)
+                key_mask[rows[rows < total]] = True
+            mask &= key_mask
+        return np.flatnonzero(mask)
+
+    def delete(self, ids: List[str]) -> int:
+        """
+        Removes ids and renumbers the rows after them. Rewrites the vector
+        file, so this is O(rows); deletes are rare next to upserts.
+        """
+        with self._lock:
+            doomed = sorted(row for row, _ in self._existing_rows(list(ids)).values())
+            if not doomed:
+                return 0
+            keep = np.setdiff1d(np.arange(self._rows), doomed)
+            compacted = self._vectors_path + ".compact"
+            np.asarray(self._vectors[keep], dtype=DTYPE).tofile(compacted)
+            with self._conn:
+                self._conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in doomed])
+                # Ascending, so every target row is already free
+                self._conn.executemany(
+                    "UPDATE chunks SET row = ? WHERE row = ?",
+                    [(new, int(old)) for new, old in enumerate(keep) if new != old],
+                )
+                # Swapped in before the commit: a failed rename rolls the table back
+                os.replace(compacted, self._vectors_path)
+            self._generation += 1
+            self._load()
+        return len(doomed)
+
+    def search(self, query_vector, k: int = 5, metadata_filter: dict = None):
+        """
+        Top-k rows by cosine similarity: [(content, metadata, distance)].
+        """
+        query = _normalise(np.asarray(query_vector, dtype=DTYPE))
+        while True:
+            hits = self._search(query, k, metadata_filter)
+            if hits is not None:
+                return hits
+
+    def _search(self, query, k, metadata_filter):
+        # None if a delete renumbered the rows while scoring
+        with self._lock:
+            vectors = self._vectors
+            generation = self._generation
+            rows = self._filter_rows(metadata_filter, len(vectors))
+
+        if not len(vectors):
+            return []
+        if rows is None:
+            scores = vectors @ query
+        elif len(rows):
+            scores = vectors[rows] @ query
+        else:
+            return []
+
+        k = min(k, len(scores))
+        top = np.argpartition(scores, len(scores) - k)[-k:]
+        top = top[np.argsort(-scores[top])]
+        hit_rows = rows[top] if rows is not None else top
+        fetched = self._fetch(hit_rows, generation)
+        if fetched is None:
+            return None
+        return [
+            (content, metadata, float(1.0 - scores[position]))
+            for (content, metadata), position in zip(fetched, top)
+        ]
+
+    def _fetch(self, rows, generation: int):
+        rows = [int(row) for row in rows]
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            if generation != self._generation:
+                return None
+            found = {
+                row: (content, json.loads(metadata))
+                for row, content, metadata in self._conn.execute(
+                    f"SELECT row, content, metadata FROM chunks WHERE row IN ({placeholders})",
+                    rows,
+                )
+            }
+        return [found[row] for row in rows]
+
+    def iter_rows(self, batch_size: int = 1000, metadata_filter: dict = None):
+        """
+        Yields (ids, contents, metadatas, vectors) pages in row order.
+        """
+        with self._lock:
+            vectors = self._vectors
+            generation = self._generation
+            rows = self._filter_rows(metadata_filter, len(vectors))
+        if rows is None:
+            rows = np.arange(len(vectors))
+
+        for start in range(0, len(rows), batch_size):
+            batch = [int(row) for row in rows[start:start + batch_size]]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                if generation != self._generation:
+                    raise RuntimeError(f"Rows in {self.path} were renumbered by a delete while iterating")
+                found = {
+                    row: (chunk_id, content, json.loads(metadata))
+                    for row, chunk_id, content, metadata in self._conn.execute(
+                        f"SELECT row, id, content, metadata FROM chunks WHERE row IN ({placeholders})",
+                        batch,
+                    )
+                }
+            ids, contents, metadatas = zip(*(found[row] for row in batch))
+            yield list(ids), list(contents), list(metadatas), np.asarray(vectors[batch])
+
+    def warmup(self) -> int:
+        # Fault the matrix into the page cache before the first query
+        with self._lock:
+            vectors = self._vectors
+        if len(vectors):
+            float(vectors.sum())
+        return self._rows
+
+    def close(self):
+        with self._lock:
+            self._vectors = np.empty((0, self.dim or 0), dtype=DTYPE)
+            self._conn.close()
@@ -0,0 +1,156 @@
+"""
+Parse/chunk stage of ingestion, optionally run in worker processes.
+
+PDF text extraction and text splitting are pure-Python CPU work; in a
+thread they hold the GIL against the ASGI server and stall token
+streaming. With INGESTION_PARSE_PROCESSES > 0 the work moves to a process
+pool: the parent sends (file path, page range) and gets back compact
+ChunkRecord tuples instead of pickled Document objects.
+
+Large PDFs are split into INGESTION_PARSE_PAGES_PER_TASK page ranges so
+several workers extract one file in parallel. Results are yielded in page
+order, so chunks (and therefore embedding batch ids) are identical to the
+in-thread path. If the pool can't be started or breaks mid-file, the
+remaining pages are parsed in-thread.
+
+Worker code only imports pypdf/langchain; Django is never set up in the
+children.
+"""
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, NamedTuple
+
+from django.conf import settings
+from langchain_core.documents import Document
+
+from .loaders import DocumentLoader
+from .parsers import DocumentParser
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkRecord(NamedTuple):
+    text: str
+    page: int
+    start_index: int
+    page_label: str
+
+
+def parse_page_range(file_path: str, start: int, stop: int) -> List[ChunkRecord]:
+    """
+    Worker entry point: extract and chunk pages [start, stop).
+    """
+    pages = DocumentLoader.lazy_load_pdf(file_path, start=start, stop=stop)
+    return [
+        ChunkRecord(
+            text=chunk.page_content,
+            page=chunk.metadata["page"],
+            start_index=chunk.metadata["start_index"],
+            page_label=chunk.metadata["page_label"],
+        )
+        for chunk in DocumentParser.iter_chunks(pages)
+    ]
+
+
+def _to_document(record: ChunkRecord, file_path: str, total_pages: int) -> Document:
+    # Same metadata, in the same order, as the in-thread splitter output
+    return Document(
+        page_content=record.text,
+        metadata={
+            "source": file_path,
+            "page": record.page,
+            "page_label": record.page_label,
+            "total_pages": total_pages,
+            "start_index": record.start_index,
+        },
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Lazily started, process-wide pool. Uses spawn rather than fork: the
+    ASGI process has live threads (event loop, executors, Chroma) that a
+    forked child would inherit in an undefined state.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.INGESTION_PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_parse_pool(wait: bool = True):
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _page_ranges(total_pages: int, pages_per_task: int):
+    for start in range(0, total_pages, pages_per_task):
+        yield start, min(start + pages_per_task, total_pages)
+
+
+def _iter_chunks_in_thread(file_path: str, start: int = 0):
+    pages = DocumentLoader.lazy_load_pdf(file_path, start=start)
+    return DocumentParser.iter_chunks(pages)
+
+
+def _iter_chunks_in_pool(file_path: str):
+    total_pages = DocumentLoader.count_pdf_pages(file_path)
+    ranges = deque(_page_ranges(total_pages, settings.INGESTION_PARSE_PAGES_PER_TASK))
+    # Submit a couple of ranges per worker ahead; more would only hold
+    # parsed pages in memory while the embedder catches up.
+    max_in_flight = settings.INGESTION_PARSE_PROCESSES * 2
+    in_flight = deque()
+    next_page = 0
+
+    try:
+        try:
+            pool = get_parse_pool()
+            while ranges or in_flight:
+                while ranges and len(in_flight) < max_in_flight:
+                    start, stop = ranges.popleft()
+                    future = pool.submit(parse_page_range, file_path, start, stop)
+                    in_flight.append((stop, future))
+                stop, future = in_flight.popleft()
+                records = future.result()
+                for record in records:
+                    yield _to_document(record, file_path, total_pages)
+                next_page = stop
+        except (BrokenProcessPool, OSError, RuntimeError) as exc:
+            # Page ranges are yielded whole, so everything before next_page
+            # is already out and the in-thread path picks up from there.
+            logger.warning(
+                f"Parse pool unavailable ({exc!r}); parsing {file_path} "
+                f"from page {next_page} in-thread"
+            )
+            if isinstance(exc, BrokenProcessPool):
+                shutdown_parse_pool(wait=False)
+            yield from _iter_chunks_in_thread(file_path, start=next_page)
+    finally:
+        # Consumer stopped early (e.g. embedding failed): drop queued work
+        for _, future in in_flight:
+            future.cancel()
+
+
+def iter_pdf_chunks(file_path: str):
+    """
+    Streams chunk Documents for a PDF, in page order, using the parse
+    pool when INGESTION_PARSE_PROCESSES is set.
+    """
+    if settings.INGESTION_PARSE_PROCESSES > 0:
+        return _iter_chunks_in_pool(file_path)
+    return _iter_chunks_in_thread(file_path)
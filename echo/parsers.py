@@ -7,10 +7,29 @@ class DocumentParser:
     Decoupled from loading source.
     """
 
-    @staticmethod
-    def chunk_documents(documents):
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=200,
+    CHUNK_SIZE = 800
+    CHUNK_OVERLAP = 200
+
+    @classmethod
+    def _splitter(cls):
+        return RecursiveCharacterTextSplitter(
+            chunk_size=cls.CHUNK_SIZE,
+            chunk_overlap=cls.CHUNK_OVERLAP,
+            # start_index lets later stages merge overlapping neighbours
+            add_start_index=True,
         )
-        return splitter.split_documents(documents)
+
+    @classmethod
+    def chunk_documents(cls, documents):
+        return cls._splitter().split_documents(documents)
+
+    @classmethod
+    def iter_chunks(cls, documents):
+        """
+        Generator version of chunk_documents(): splits pages as they
+        arrive so chunks can be embedded before the last page is read.
+        Output is identical to chunk_documents() on the same pages.
+        """
+        splitter = cls._splitter()
+        for document in documents:
+            yield from splitter.split_documents([document])
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .vectorstore import DEFAULT_COLLECTION, _run_off_loop, vector_store_registry
+
+logger = logging.getLogger(__name__)
+
+PARTITIONING_MODES = ("document", "shard")
+
+_fanout_executor = None
+_fanout_lock = threading.Lock()
+
+
+def get_fanout_executor() -> ThreadPoolExecutor:
+    """
+    Threads for sync fan-out searches. Separate from the vector store
+    executor, which may itself be the caller.
+    """
+    global _fanout_executor
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(
+                max_workers=settings.VECTORSTORE_EXECUTOR_WORKERS,
+                thread_name_prefix="vectorstore-fanout",
+            )
+        return _fanout_executor
+
+
+# {(persist directory, partition prefix): (listed_at, names)}, shared by
+# every router in the process so global queries don't list collections
+_partition_names = {}
+_partition_names_lock = threading.Lock()
+
+
+def merge_top_k(result_lists, k: int):
+    """
+    Merges per-partition (Document, distance) lists into one top-k.
+    """
+    merged = [hit for hits in result_lists for hit in hits]
+    merged.sort(key=lambda hit: hit[1])
+    return merged[:k]
+
+
+class PartitionRouter:
+    """
+    VectorStoreService-compatible front for a partitioned collection.
+
+    - "document": one collection per document_id.
+    - "shard": VECTORSTORE_SHARDS collections, document_id hashed (crc32)
+      to a shard so a document's chunks stay together.
+
+    Chunks without a document_id, and anything not yet re-partitioned,
+    stay in the base collection, which is always part of a fan-out.
+    Queries filtered by document_id hit one partition; other queries fan
+    out over every partition in parallel and merge the top-k.
+    """
+
+    def __init__(self, embeddings, collection_name: str = DEFAULT_COLLECTION, mode: str = None, shards: int = None):
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.mode = mode or settings.VECTORSTORE_PARTITIONING
+        self.shards = shards or settings.VECTORSTORE_SHARDS
+        if self.mode not in PARTITIONING_MODES:
+            raise ValueError(f"Unknown partitioning mode {self.mode!r}")
+        self.prefix = f"{collection_name}_{'doc' if self.mode == 'document' else 'shard'}_"
+
+    # --- Routing ---
+
+    def partition_for(self, document_id) -> str:
+        if document_id is None:
+            return self.collection_name
+        if self.mode == "document":
+            return f"{self.prefix}{document_id}"
+        # crc32 rather than hash(): stable across processes and restarts
+        return f"{self.prefix}{zlib.crc32(str(document_id).encode()) % self.shards:03d}"
+
+    def service(self, collection_name: str):
+        return vector_store_registry.get(self.embeddings, collection_name)
+
+    @property
+    def base(self):
+        return self.service(self.collection_name)
+
+    def _names_key(self):
+        return self.base.persist_directory, self.prefix
+
+    def partitions(self, refresh: bool = False):
+        """
+        Base collection first, then every partition. The listing is reused
+        for VECTORSTORE_PARTITION_LIST_TTL_SECONDS; partitions written by
+        this process are added to it straight away.
+        """
+        key = self._names_key()
+        with _partition_names_lock:
+            cached = _partition_names.get(key)
+        if refresh or cached is None or time.monotonic() - cached[0] > settings.VECTORSTORE_PARTITION_LIST_TTL_SECONDS:
+            names = {name for name in self.base.list_collections() if name.startswith(self.prefix)}
+            with _partition_names_lock:
+                _partition_names[key] = (time.monotonic(), names)
+        else:
+            names = cached[1]
+        return [self.collection_name, *sorted(names)]
+
+    def _remember(self, name: str):
+        with _partition_names_lock:
+            cached = _partition_names.get(self._names_key())
+            if cached is not None:
+                cached[1].add(name)
+
+    def _exists(self, name: str) -> bool:
+        # Checked rather than opened: opening a service creates the
+        # collection, and would for every unknown document_id read
+        with _partition_names_lock:
+            cached = _partition_names.get(self._names_key())
+            if cached is not None and name in cached[1]:
+                return True
+        if self.base.has_collection(name):
+            self._remember(name)
+            return True
+        return False
+
+    def _route(self, metadata_filter: dict):
+        """
+        Returns (collections to search, filter to pass them).
+        """
+        document_id = (metadata_filter or {}).get("document_id")
+        if document_id is None:
+            return self.partitions(), metadata_filter
+        if not self._exists(self.partition_for(document_id)):
+            return [], metadata_filter
+        if self.mode == "document":
+            # The partition *is* the filter; drop it so Chroma skips the
+            # metadata scan
+            rest = {key: value for key, value in metadata_filter.items() if key != "document_id"}
+            return [self.partition_for(document_id)], rest or None
+        return [self.partition_for(document_id)], metadata_filter
+
+    def _fallback(self, metadata_filter):
+        # A document that predates partitioning still lives in the base
+        return (metadata_filter or {}).get("document_id") is not None
+
+    # --- Writes ---
+
+    def add_embedded(self, documents, vectors, ids=None):
+        if not documents:
+            return []
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        groups = {}
+        for position, doc in enumerate(documents):
+            partition = self.partition_for((doc.metadata or {}).get("document_id"))
+            groups.setdefault(partition, []).append(position)
+        for partition, positions in groups.items():
+            self.service(partition).add_embedded(
+                [documents[p] for p in positions],
+                [vectors[p] for p in positions],
+                ids=[ids[p] for p in positions],
+            )
+            if partition != self.collection_name:
+                self._remember(partition)
+        return ids
+
+    def add_documents(self, documents):
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        self.add_embedded(documents, vectors)
+
+    async def aadd_documents(self, documents, ids=None):
+        vectors = await self.embeddings.aembed_documents(
+            [doc.page_content for doc in documents]
+        )
+        return await _run_off_loop(self.add_embedded, documents, vectors, ids=ids)
+
+    def iter_embedded(self, batch_size: int = 1000, metadata_filter: dict = None):
+        collections, partition_filter = self._route(metadata_filter)
+        found = False
+        for name in collections:
+            for page in self.service(name).iter_embedded(batch_size, metadata_filter=partition_filter):
+                found = True
+                yield page
+        if not found and self._fallback(metadata_filter):
+            yield from self.base.iter_embedded(batch_size, metadata_filter=metadata_filter)
+
+    # --- Sync search ---
+
+    def _search_partition(self, name, embedding, k, metadata_filter):
+        # Blocking: may open the partition on first use
+        return self.service(name).search_by_vector_with_scores(
+            embedding, k=k, metadata_filter=metadata_filter
+        )
+
+    def search_by_vector_with_scores(self, embedding: list, k: int = 5, metadata_filter: dict = None):
+        collections, partition_filter = self._route(metadata_filter)
+
+        if len(collections) == 1:
+            hits = self._search_partition(collections[0], embedding, k, partition_filter)
+        else:
+            hits = merge_top_k(
+                get_fanout_executor().map(
+                    lambda name: self._search_partition(name, embedding, k, partition_filter),
+                    collections,
+                ),
+                k,
+            )
+
+        if not hits and self._fallback(metadata_filter):
+            hits = self._search_partition(self.collection_name, embedding, k, metadata_filter)
+        return hits
+
+    def search(self, query: str, k: int = 5, metadata_filter: dict = None):
+        return self.search_by_vector_with_scores(
+            self.embeddings.embed_query(query), k=k, metadata_filter=metadata_filter
+        )
+
+    def search_by_vector(self, embedding: list, k: int = 5, metadata_filter: dict = None):
+        return [
+            doc for doc, _ in
+            self.search_by_vector_with_scores(embedding, k=k, metadata_filter=metadata_filter)
+        ]
+
+    # --- Async search ---
+
+    async def _asearch_vector(self, embedding, k, metadata_filter):
+        collections, partition_filter = await _run_off_loop(self._route, metadata_filter)
+        results = await asyncio.gather(*(
+            _run_off_loop(self._search_partition, name, embedding, k, partition_filter)
+            for name in collections
+        ))
+        hits = merge_top_k(results, k)
+
+        if not hits and self._fallback(metadata_filter):
+            hits = await _run_off_loop(
+                self._search_partition, self.collection_name, embedding, k, metadata_filter
+            )
+        return hits
+
+    async def asearch(self, query: str, k: int = 5, metadata_filter: dict = None):
+        embedding = await self.embeddings.aembed_query(query)
+        return await self._asearch_vector(embedding, k, metadata_filter)
+
+    async def asearch_by_vector(self, embedding: list, k: int = 5, metadata_filter: dict = None):
+        return [doc for doc, _ in await self._asearch_vector(embedding, k, metadata_filter)]
+
+    # --- Lifecycle ---
+
+    def count(self) -> int:
+        return sum(self.service(name).count() for name in self.partitions())
+
+    def warmup(self):
+        return self.count()
@@ -0,0 +1,183 @@
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.conf import settings
+
+from .llm_gateway import BACKGROUND, request_priority
+from .tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatchError(Exception):
+    """
+    Raised when a batch could not be embedded/stored. Batches that
+    finished before the failure are listed so a re-run can skip them.
+    """
+
+    def __init__(self, message, completed_batches):
+        super().__init__(message)
+        self.completed_batches = completed_batches
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    try:
+        import openai
+        if isinstance(exc, openai.RateLimitError):
+            return True
+    except ImportError:
+        pass
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429
+
+
+@dataclass
+class IngestionMetrics:
+    document_id: str
+    chunks: int = 0
+    tokens: int = 0
+    batches: int = 0
+    skipped_batches: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started_at
+        return self
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "document_id": self.document_id,
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "batches": self.batches,
+            "skipped_batches": self.skipped_batches,
+            "retries": self.retries,
+            "elapsed_s": round(self.elapsed, 3),
+            "chunks_per_s": round(self.chunks_per_second, 1),
+            "tokens_per_s": round(self.tokens_per_second, 1),
+        }
+
+
+class EmbeddingPipeline:
+    """
+    Embeds and stores chunks in fixed-size batches with a bounded number
+    of batches in flight.
+
+    - Rate-limit errors are retried per batch with exponential backoff.
+    - Chunk ids are deterministic (document_id:index) so re-running a
+      document upserts instead of duplicating, and completed batches can
+      be skipped entirely.
+    """
+
+    def __init__(self, embeddings, vector_service, batch_size=None, max_in_flight=None,
+                 max_retries=None, retry_base_delay=None):
+        self.embeddings = embeddings
+        self.vector_service = vector_service
+        self.batch_size = batch_size or settings.INGESTION_EMBED_BATCH_SIZE
+        self.max_in_flight = max_in_flight or settings.INGESTION_EMBED_MAX_IN_FLIGHT
+        self.max_retries = settings.INGESTION_EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_base_delay = (
+            settings.INGESTION_EMBED_RETRY_BASE_DELAY if retry_base_delay is None else retry_base_delay
+        )
+
+    def _batches(self, chunks):
+        # Works on any iterable so a lazily parsed PDF is only ever
+        # materialised one batch at a time.
+        iterator = iter(chunks)
+        index = 0
+        while True:
+            batch = list(islice(iterator, self.batch_size))
+            if not batch:
+                return
+            yield index, index * self.batch_size, batch
+            index += 1
+
+    def _embed_batch(self, document_id, start, batch):
+        texts = [chunk.page_content for chunk in batch]
+        attempt = 0
+        while True:
+            try:
+                # Queues behind interactive chat calls on the shared rate limiter
+                with request_priority(BACKGROUND):
+                    vectors = self.embeddings.embed_documents(texts)
+                break
+            except Exception as exc:
+                if not is_rate_limited(exc) or attempt >= self.max_retries:
+                    raise
+                delay = self.retry_base_delay * (2 ** attempt) * (1 + random.random() * 0.25)
+                attempt += 1
+                logger.warning(f"Rate limited embedding batch at {start}; retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+
+        ids = [f"{document_id}:{start + offset}" for offset in range(len(batch))]
+        self.vector_service.add_embedded(batch, vectors, ids=ids)
+        return sum(count_tokens(text) for text in texts), attempt
+
+    def run(self, chunks, document_id: str, completed_batches=None, on_batch_done=None) -> IngestionMetrics:
+        """
+        Embeds and stores every chunk of one document. `chunks` may be a
+        generator; batches are stored (and searchable) as soon as they land.
+
+        completed_batches: batch indexes already stored by an earlier run.
+        on_batch_done: called with the batch index after each batch lands.
+        """
+        completed = set(completed_batches or ())
+        metrics = IngestionMetrics(document_id=document_id)
+        failure = None
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed") as pool:
+            in_flight = {}
+
+            def drain(return_when):
+                nonlocal failure
+                done, _ = wait(in_flight, return_when=return_when)
+                for future in done:
+                    index, size = in_flight.pop(future)
+                    try:
+                        tokens, retries = future.result()
+                    except Exception as exc:
+                        logger.exception(f"Embedding batch {index} failed for document {document_id}")
+                        failure = failure or exc
+                        continue
+                    completed.add(index)
+                    metrics.tokens += tokens
+                    metrics.retries += retries
+                    metrics.chunks += size
+                    metrics.batches += 1
+                    if on_batch_done:
+                        on_batch_done(index)
+
+            for index, start, batch in self._batches(chunks):
+                if index in completed:
+                    metrics.skipped_batches += 1
+                    continue
+                while len(in_flight) >= self.max_in_flight:
+                    drain(FIRST_COMPLETED)
+                if failure:
+                    break
+                future = pool.submit(self._embed_batch, document_id, start, batch)
+                in_flight[future] = (index, len(batch))
+
+            while in_flight:
+                drain(FIRST_COMPLETED)
+
+        metrics.finish()
+        if failure:
+            raise EmbeddingBatchError(str(failure), sorted(completed)) from failure
+
+        logger.info(f"Embedded document {document_id}: {metrics.as_dict()}")
+        return metrics
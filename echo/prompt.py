@@ -1,4 +1,7 @@
 
+# Reply when retrieval finds nothing relevant (no LLM call is made)
+NO_ANSWER = "I cannot find this in the documents."
+
 SYSTEM_PROMPT = """
 CRITICAL INSTRUCTION: You are an offline Document Processing Unit. 
 The text provided in the 'CONTEXT' section below is the ONLY document you know. 
@@ -1,30 +1,69 @@
-from typing import TypedDict, List, Annotated, Sequence
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
-from .llm_gateway import safe_generate
-from .vectorstore import VectorStoreService
+import asyncio
+import functools
+import logging
+import time
+import uuid
+from typing import TypedDict, List, Annotated, Optional, Sequence
+from django.conf import settings
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from .answer_cache import get_answer_cache
+from .llm_gateway import safe_generate, safe_stream
+from .vectorstore import get_vector_service
+from .routing import DocumentRoutingIndex
+from .context import build_context
+from .memory import compact, prompt_messages, prompt_tokens
 # from langchain_openai import OpenAIEmbeddings
 
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
-# from langgraph.checkpoint.memory import InMemorySaver
-from langgraph.checkpoint.memory import MemorySaver
-
-from langgraph.store.memory import InMemoryStore
-from langgraph.graph.message import add_messages  
+from langgraph.graph.message import add_messages
+from .checkpoint import get_checkpointer, get_store
 
 import re  
 from .embeddings import embeddings
-from .prompt import MAINPROMPT, BASEPROMPT, SYSTEM_PROMPT
+from .prompt import MAINPROMPT, BASEPROMPT, NO_ANSWER, SYSTEM_PROMPT
+
+logger = logging.getLogger(__name__)
+
+
+def merge_timings(current: dict, update: dict) -> dict:
+    return {**(current or {}), **(update or {})}
+
 
 # State Definition
 class RAGState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
     question: str # The original user input (e.g., "summarize this")
     expanded_query: str    # The optimized search string (e.g., "executive summary findings...")
-    context: List[str]  # Chunks retrieved
+    raw_hits: List[dict]  # Speculative hits for the raw question: {"content", "score", "metadata"}
+    hits: List[dict]  # Final retrieval result, best first
+    context: List[str]  # Passages sent to the LLM (merged, deduped, within the token budget)
     answer: str
     error: str
     is_redacted: bool
     document_id: str
+    timings: Annotated[dict, merge_timings]  # Seconds spent per node, latest turn
+    summary: str  # Rolling summary of turns compacted out of messages
+    prompt_tokens: Annotated[dict, merge_timings]  # Prompt size per LLM node, latest turn
+    cache_version: Optional[int]  # Document.index_version if this turn's answer may be cached
+    cached: bool  # Answer replayed from the answer cache
+
+
+def timed(name: str):
+    """
+    Records the node's wall time under state["timings"][name].
+    """
+    def decorator(node):
+        @functools.wraps(node)
+        async def wrapper(state: RAGState):
+            start = time.perf_counter()
+            update = await node(state)
+            elapsed = time.perf_counter() - start
+            logger.debug(f"RAG node {name} took {elapsed * 1000:.0f}ms")
+            timings = {**update.get("timings", {}), name: round(elapsed, 4)}
+            return {**update, "timings": timings}
+        return wrapper
+    return decorator
 
 
 def redact_pii(text: str) -> str:
@@ -34,127 +73,360 @@ def redact_pii(text: str) -> str:
 
 # --- Nodes ---
 
+@timed("pii_pre_check")
 async def pii_guard_node(state: RAGState):
     """
     Redacts PII from the incoming question.
     """
-    # Return both the current question and append it to the messages list
+    question = redact_pii(state["question"])
+    # The only place the turn's question enters the history; generate
+    # reads it from there
     return {
-        "question": redact_pii(state["question"]), 
-        "messages": [HumanMessage(content=state["question"])], # Log to history
-        "is_redacted": True
+        "question": question,
+        "messages": [HumanMessage(content=question)],
+        "is_redacted": True,
+        # Don't let a previous turn's speculative hits leak into this one
+        "raw_hits": [],
     }
 
+@timed("pii_post_check")
 async def output_guard_node(state: RAGState):
     """
-    Final scrub of the LLM answer before it hits the UI.
+    Final scrub of the LLM answer before it hits the UI. Cacheable
+    answers are stored here, once scrubbed.
+    """
+    answer = redact_pii(state["answer"])
+    if answer and state.get("cache_version") is not None and not state.get("cached"):
+        get_answer_cache().put(state["document_id"], state["question"], state["cache_version"], answer)
+    return {"answer": answer}
+
+
+# --- Answer Cache Node ---
+async def _index_version(document_id):
+    """
+    The document's index_version, or None if it isn't an indexed document.
     """
-    return {"answer": redact_pii(state["answer"])}
+    # Imported here: ragtalk.asgi imports this module before apps are loaded
+    from .models import Document, ProcessingStatus
+
+    try:
+        uuid.UUID(str(document_id))
+    except ValueError:
+        return None
+    return await Document.objects.filter(
+        id=document_id, processing_status=ProcessingStatus.INDEXED,
+    ).values_list("index_version", flat=True).afirst()
+
+
+def _cacheable(state: RAGState) -> bool:
+    if not settings.RAG_ANSWER_CACHE or not state.get("document_id"):
+        return False
+    if settings.RAG_ANSWER_CACHE_FIRST_TURN_ONLY:
+        # Later turns may lean on the conversation, not just the question
+        return len(state["messages"]) == 1 and not state.get("summary")
+    return True
+
+
+@timed("answer_cache")
+async def answer_cache_node(state: RAGState):
+    """
+    Replays the cached answer to a repeated question on the same document
+    (see echo/answer_cache.py) as a single token event; on a hit the graph
+    skips expansion, retrieval and generation.
+    """
+    version = await _index_version(state["document_id"]) if _cacheable(state) else None
+    answer = None
+    if version is not None:
+        answer = get_answer_cache().get(state["document_id"], state["question"], version)
+    if answer is None:
+        return {"cache_version": version, "cached": False}
+
+    logger.info(f"Answer cache hit for document {state['document_id']}")
+    get_stream_writer()({"token": answer})
+    return {
+        "answer": answer,
+        "messages": [AIMessage(content=answer)],
+        "context": [],
+        "cache_version": version,
+        "cached": True,
+    }
 
 
 # --- Query Expansion Node ---
+@timed("expand_query")
 async def query_expansion_node(state: RAGState):
     """
     Step 1: Contextual Query Rewriting.
     Populates state["expanded_query"] for the retriever.
+
+    Bounded by RAG_EXPANSION_BUDGET_SECONDS: a slow rewrite is abandoned
+    and the raw question is used instead (0 skips expansion entirely).
     """
+    budget = settings.RAG_EXPANSION_BUDGET_SECONDS
+    if budget is not None and budget <= 0:
+        return {"expanded_query": state["question"]}
 
     # Use your gateway's safe_generate
-    rewrite_prompt = [
-        SystemMessage(content=(
-            "You are a search optimizer. Rewrite the user's question into a standalone "
-            "search query for a vector database. Focus on key technical terms. "
-            "If they ask for a summary, search for 'key findings, conclusions, and objectives'."
-        )),
-        *state.get("messages", []),
-        HumanMessage(content=state["question"])
-    ]
-    
+    rewrite_prompt = prompt_messages(
+        "You are a search optimizer. Rewrite the user's question into a standalone "
+        "search query for a vector database. Focus on key technical terms. "
+        "If they ask for a summary, search for 'key findings, conclusions, and objectives'.",
+        state,
+    )
+    usage = {"prompt_tokens": {"expand_query": prompt_tokens(rewrite_prompt)}}
+
     try:
-        response = await safe_generate(rewrite_prompt)
-        return {"expanded_query": response.content}
+        response = await asyncio.wait_for(safe_generate(rewrite_prompt), timeout=budget)
+        return {"expanded_query": response.content, **usage}
+    except asyncio.TimeoutError:
+        logger.info(f"Query expansion exceeded {budget}s budget; using raw question")
+        return {"expanded_query": state["question"], **usage}
     except Exception:
         # Fallback: if expansion fails, use the original question
-        return {"expanded_query": state["question"]}
+        return {"expanded_query": state["question"], **usage}
 
-# --- Retrieve Node ---
-async def retrieve_node(state: RAGState):
+# --- Retrieve Nodes ---
+async def _search(state: RAGState, query: str):
+    """
+    Returns [{"content", "score", "metadata"}] for query; score is the
+    backend's distance (lower is closer).
+    """
+    if state.get("document_id"):
+        docs = await get_vector_service(embeddings).asearch(
+            query,
+            k=settings.RAG_RETRIEVAL_K,
+            metadata_filter={"document_id": state["document_id"]},
+        )
+    elif settings.RAG_ROUTING_CANDIDATES > 0:
+        # Global question: pick candidate documents first, then their chunks
+        docs = await DocumentRoutingIndex(embeddings).asearch(query, k=settings.RAG_RETRIEVAL_K)
+    else:
+        docs = await get_vector_service(embeddings).asearch(query, k=settings.RAG_RETRIEVAL_K)
+    return [{"content": doc.page_content, "score": score, "metadata": doc.metadata} for doc, score in docs]
+
+
+def _adds_value(question: str, expanded_query: str) -> bool:
+    # A rewrite that only changes case/whitespace retrieves the same chunks
+    normalise = lambda text: " ".join((text or "").split()).casefold()
+    return bool(expanded_query) and normalise(expanded_query) != normalise(question)
+
+
+def merge_hits(*hit_lists, k: int) -> List[dict]:
+    """
+    Union of several result lists, deduped by chunk text, best (lowest)
+    distance first.
+    """
+    best = {}
+    for hits in hit_lists:
+        for hit in hits:
+            seen = best.get(hit["content"])
+            if seen is None or hit["score"] < seen["score"]:
+                best[hit["content"]] = hit
+    return sorted(best.values(), key=lambda hit: hit["score"])[:k]
+
+
+@timed("retrieve_raw")
+async def speculative_retrieve_node(state: RAGState):
     """
-    Step 2: Uses the expanded_query explicitly from the state.
+    Speculative mode only: searches with the raw question while
+    query expansion is still running.
     """
-    vector_service = VectorStoreService(embeddings)
-    
-    # We pull the expanded version specifically
-    search_term = state.get("expanded_query") or state["question"]
-    
-    docs = vector_service.search(search_term, k=6)
-    context_chunks = [doc[0].page_content for doc in docs]
-    
-    return {"context": context_chunks}
+    return {"raw_hits": await _search(state, state["question"])}
 
+
+@timed("retrieve")
 async def retrieve_node(state: RAGState):
     """
-    Node 1: Fetches context from Chroma.
+    Step 2: Fetches context from Chroma.
+
+    Searches with expanded_query when it differs from the question. In
+    speculative mode the raw-question hits are already in state and are
+    merged in; otherwise the raw question is only the fallback.
     """
-    vector_service = VectorStoreService(embeddings)
-    
-    # We retrieve k=5 for better grounding
-    if state.get("document_id"):
-        docs = vector_service.search(
-            state["question"],
-            k=5,
-            metadata_filter={"document_id": state["document_id"]}
-        )
+    question = state["question"]
+    expanded_query = state.get("expanded_query")
+    raw_hits = state.get("raw_hits") or []
+
+    if _adds_value(question, expanded_query):
+        hits = merge_hits(raw_hits, await _search(state, expanded_query), k=settings.RAG_RETRIEVAL_K)
+    elif raw_hits:
+        hits = raw_hits
     else:
-        docs = vector_service.search(state["question"], k=5)
-    
-    # docs is a list of (Document, Score)
-    context_chunks = [doc[0].page_content for doc in docs]
-    
-    return {"context": context_chunks}
+        hits = await _search(state, question)
+
+    return {"hits": hits}
+
+def is_relevant(hits: List[dict]) -> bool:
+    """
+    Whether retrieval found anything to answer from: at least one hit,
+    and with RAG_RELEVANCE_MAX_DISTANCE set, one at most that far away.
+    """
+    if not hits:
+        return False
+    limit = settings.RAG_RELEVANCE_MAX_DISTANCE
+    return limit is None or min(hit["score"] for hit in hits) <= limit
+
+
+async def retrieval_hits(question: str, document_id=None, speculative: bool = None) -> List[dict]:
+    """
+    The hits is_relevant sees for a first-turn question: the graph's
+    redaction, expansion and (speculative) merge, without the answer
+    cache or generation. Used by calibrate_relevance.
+    """
+    if speculative is None:
+        speculative = settings.RAG_SPECULATIVE_RETRIEVAL
+    state = {"question": question, "document_id": document_id}
+    state.update(await pii_guard_node(state))
+    branches = [query_expansion_node(state)]
+    if speculative:
+        branches.append(speculative_retrieve_node(state))
+    for update in await asyncio.gather(*branches):
+        state.update(update)
+    return (await retrieve_node(state))["hits"]
+
+
+@timed("no_answer")
+async def no_answer_node(state: RAGState):
+    """
+    Nothing relevant was retrieved: the canned reply, without an LLM call.
+    """
+    logger.info("Nothing relevant retrieved; skipping generation")
+    get_stream_writer()({"token": NO_ANSWER})
+    return {"answer": NO_ANSWER, "messages": [AIMessage(content=NO_ANSWER)], "context": []}
 
+
+@timed("generate")
 async def generate_node(state: RAGState):
     """
-    Node 2: Generates grounded response using the safe_generate gateway.
+    Node 2: Streams a grounded response through the safe_stream gateway.
+    Overlapping hits are merged and the context capped at
+    RAG_CONTEXT_TOKEN_BUDGET (see echo.context).
+
+    Each text chunk is also emitted as a {"token": ...} custom stream
+    event, so callers using stream_mode="custom" can forward it directly.
     """
-    context_text = "\n\n".join(state["context"])
-    
-    system_prompt = SystemMessage(content=SYSTEM_PROMPT.format(context_text=context_text))
+    context = build_context(state.get("hits") or [])
+    context_text = "\n\n".join(context)
+
+    # System prompt + recent history; the question is its last message
+    llm_input = prompt_messages(SYSTEM_PROMPT.format(context_text=context_text), state)
+    tokens = prompt_tokens(llm_input)
+    logger.info(f"RAG generate prompt: {tokens} tokens, {len(llm_input) - 1} messages of history")
 
-    user_message = HumanMessage(content=state["question"])
+    writer = get_stream_writer()
+    parts, ttft = [], None
+    start = time.perf_counter()
+    async for text in safe_stream(llm_input):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+            logger.info(f"RAG generate time to first token: {ttft * 1000:.0f}ms")
+        parts.append(text)
+        writer({"token": text})
+    answer = "".join(parts)
 
-    # Combine History + System Prompt
-    llm_input = [system_prompt] + state["messages"] + [user_message]
-    
-    # Calls the gateway with retry logic
-    response = await safe_generate(llm_input)
-    
-    return {"answer": response.content, "messages": [user_message, response]}
+    return {
+        "answer": answer,
+        "messages": [AIMessage(content=answer)],
+        "context": context,
+        "prompt_tokens": {"generate": tokens},
+        "timings": {"generate_ttft": round(ttft, 4)} if ttft is not None else {},
+    }
 
 
-def compile_workflow():
+async def compact_thread(graph, config):
+    """
+    Keeps a finished thread under RAG_MEMORY_TOKEN_LIMIT by summarising
+    old turns. Runs after the turn, not as a graph node, so the summary
+    call never holds up the end of an answer.
+    """
+    snapshot = await graph.aget_state(config)
+    update = await compact(snapshot.values.get("messages") or [], snapshot.values.get("summary"), safe_generate)
+    if update:
+        # Removals are by message id, so a turn that landed meanwhile is kept
+        await graph.aupdate_state(config, update, as_node="pii_post_check")
+
+
+_compactions = {}  # thread_id -> task
+
+
+async def _compact_logged(graph, config):
+    try:
+        await compact_thread(graph, config)
+    except Exception:
+        logger.exception(f"Compacting thread {config['configurable']['thread_id']} failed")
+
+
+def schedule_compaction(graph, config) -> asyncio.Task:
+    """
+    Starts compact_thread in the background, at most one per thread, and
+    returns its task. Not tied to the caller: cancelling the chat run
+    that scheduled it leaves it running.
+    """
+    thread_id = config["configurable"]["thread_id"]
+    running = _compactions.get(thread_id)
+    if running is not None and not running.done():
+        return running
+    task = asyncio.create_task(_compact_logged(graph, config))
+    _compactions[thread_id] = task
+    task.add_done_callback(
+        lambda done: _compactions.pop(thread_id, None) if _compactions.get(thread_id) is done else None
+    )
+    return task
+
+
+def compile_workflow(speculative: bool = None):
+    """
+    speculative (default: RAG_SPECULATIVE_RETRIEVAL) runs raw-question
+    retrieval in parallel with query expansion and merges both result
+    sets; otherwise expansion and retrieval run in sequence.
+    """
+    if speculative is None:
+        speculative = settings.RAG_SPECULATIVE_RETRIEVAL
+
     workflow = StateGraph(RAGState)
 
     # Define Nodes
     workflow.add_node("pii_pre_check", pii_guard_node)
+    workflow.add_node("answer_cache", answer_cache_node)
     workflow.add_node("expand_query", query_expansion_node) # <--- New Node
     workflow.add_node("retrieve", retrieve_node)
     workflow.add_node("generate", generate_node)
+    workflow.add_node("no_answer", no_answer_node)
     workflow.add_node("pii_post_check", output_guard_node)
 
     # Define Edges
     workflow.set_entry_point("pii_pre_check")
     # workflow.add_edge("pii_pre_check", "retrieve")
-    workflow.add_edge("pii_pre_check", "expand_query") # <--- Route to expansion
-    workflow.add_edge("expand_query", "retrieve")     # <--- Then to retrieval
+    workflow.add_edge("pii_pre_check", "answer_cache")
+    # Cache hit: straight to the output guard. Miss: on to expansion
+    # (and, in speculative mode, raw-question retrieval alongside it)
+    misses = ["expand_query", "retrieve_raw"] if speculative else ["expand_query"]
+    workflow.add_conditional_edges(
+        "answer_cache",
+        lambda state: "pii_post_check" if state.get("cached") else misses,
+        ["pii_post_check", *misses],
+    )
+    if speculative:
+        # Fan out: both branches run in the same step; retrieve waits for both
+        workflow.add_node("retrieve_raw", speculative_retrieve_node)
+        workflow.add_edge(["expand_query", "retrieve_raw"], "retrieve")
+    else:
+        workflow.add_edge("expand_query", "retrieve")     # <--- Then to retrieval
 
-    workflow.add_edge("retrieve", "generate")
+    # Nothing close enough retrieved: canned reply instead of the LLM
+    workflow.add_conditional_edges(
+        "retrieve",
+        lambda state: "generate" if is_relevant(state.get("hits")) else "no_answer",
+        ["generate", "no_answer"],
+    )
     workflow.add_edge("generate", "pii_post_check")
+    workflow.add_edge("no_answer", "pii_post_check")
+    # Memory compaction runs after the answer is out (schedule_compaction)
     workflow.add_edge("pii_post_check", END)
 
     graph = workflow.compile(
-        checkpointer=MemorySaver(),   # per-thread state
-        store=InMemoryStore()           # cross-thread state
+        checkpointer=get_checkpointer(),   # per-thread state (see echo/checkpoint.py)
+        store=get_store()                  # cross-thread state
     )
     return graph
 
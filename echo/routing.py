@@ -0,0 +1,148 @@
+"""
+Two-level retrieval for questions that aren't scoped to a document.
+
+Each indexed Document gets one routing entry: the normalised mean of its
+chunk embeddings, stored in a small "<collection>_routing" collection.
+A global question first picks the RAG_ROUTING_CANDIDATES closest
+documents there, then searches only those documents' chunks (in
+parallel) and merges the top-k, so its cost follows N rather than the
+total chunk count. While any INDEXED document has no entry (indexed
+before routing existed; see `manage.py build_routing_index`) global
+questions use a flat search instead, so those documents stay reachable.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from langchain_core.documents import Document
+
+from .partitions import get_fanout_executor, merge_top_k
+from .vectorstore import DEFAULT_COLLECTION, _run_off_loop, get_vector_service, vector_store_registry
+
+logger = logging.getLogger(__name__)
+
+
+def centroid(vectors) -> list:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    mean = vectors.mean(axis=0)
+    return (mean / max(float(np.linalg.norm(mean)), 1e-12)).tolist()
+
+
+# {(persist directory, routing collection): (checked_at, unrouted count)}
+_coverage = {}
+_coverage_lock = threading.Lock()
+
+
+class DocumentRoutingIndex:
+
+    def __init__(self, embeddings, collection_name: str = DEFAULT_COLLECTION):
+        self.embeddings = embeddings
+        self.chunks = get_vector_service(embeddings, collection_name)
+        self.index = vector_store_registry.get(embeddings, f"{collection_name}_routing")
+
+    def update_document(self, document_id: str, title: str = "") -> int:
+        """
+        (Re)computes the document's centroid from its stored chunk vectors.
+        Returns the number of chunks summarised.
+        """
+        vectors = []
+        for _, _, page in self.chunks.iter_embedded(metadata_filter={"document_id": document_id}):
+            vectors.extend(page)
+        if not vectors:
+            return 0
+        self.index.add_embedded(
+            [Document(page_content=title or document_id, metadata={"document_id": document_id, "chunks": len(vectors)})],
+            [centroid(vectors)],
+            ids=[document_id],
+        )
+        self._forget_coverage()
+        return len(vectors)
+
+    def remove_document(self, document_id: str):
+        self.index.delete([str(document_id)])
+        self._forget_coverage()
+
+    def _coverage_key(self):
+        return self.index.persist_directory, self.index.collection_name
+
+    def _forget_coverage(self):
+        with _coverage_lock:
+            _coverage.pop(self._coverage_key(), None)
+
+    def unrouted(self) -> int:
+        """
+        Number of INDEXED documents without a routing entry. Rechecked at
+        most every RAG_ROUTING_COVERAGE_TTL_SECONDS.
+        """
+        from .models import Document as StoredDocument, ProcessingStatus
+
+        key = self._coverage_key()
+        with _coverage_lock:
+            cached = _coverage.get(key)
+        if cached is not None and time.monotonic() - cached[0] <= settings.RAG_ROUTING_COVERAGE_TTL_SECONDS:
+            return cached[1]
+
+        indexed = {
+            str(document_id) for document_id in StoredDocument.objects.filter(
+                processing_status=ProcessingStatus.INDEXED,
+            ).values_list("id", flat=True)
+        }
+        missing = len(indexed - set(self.index.ids()))
+        if missing:
+            logger.warning(
+                f"{missing} indexed document(s) have no routing entry; global questions "
+                f"use a flat search until `manage.py build_routing_index` is run"
+            )
+        with _coverage_lock:
+            _coverage[key] = (time.monotonic(), missing)
+        return missing
+
+    def candidates(self, embedding: list, n: int) -> list:
+        hits = self.index.search_by_vector_with_scores(embedding, k=n)
+        return [doc.metadata["document_id"] for doc, _ in hits]
+
+    def _search_document(self, document_id, embedding, k):
+        return self.chunks.search_by_vector_with_scores(
+            embedding, k=k, metadata_filter={"document_id": document_id}
+        )
+
+    def search_by_vector_with_scores(self, embedding: list, k: int = 5, n: int = None):
+        """
+        Routed search alone, without the coverage check asearch() makes.
+        """
+        n = n or settings.RAG_ROUTING_CANDIDATES
+        document_ids = self.candidates(embedding, n)
+        if not document_ids:
+            return self.chunks.search_by_vector_with_scores(embedding, k=k)
+        return merge_top_k(
+            get_fanout_executor().map(
+                lambda document_id: self._search_document(document_id, embedding, k),
+                document_ids,
+            ),
+            k,
+        )
+
+    async def asearch(self, query: str, k: int = 5, n: int = None):
+        """
+        Same (Document, distance) pairs as VectorStoreService.asearch().
+        Falls back to a flat search while the routing index is empty or
+        misses an INDEXED document.
+        """
+        n = n or settings.RAG_ROUTING_CANDIDATES
+        embedding = await self.embeddings.aembed_query(query)
+        if await sync_to_async(self.unrouted)():
+            return await _run_off_loop(self.chunks.search_by_vector_with_scores, embedding, k=k)
+        document_ids = await _run_off_loop(self.candidates, embedding, n)
+        if not document_ids:
+            return await _run_off_loop(self.chunks.search_by_vector_with_scores, embedding, k=k)
+
+        results = await asyncio.gather(*(
+            _run_off_loop(self._search_document, document_id, embedding, k)
+            for document_id in document_ids
+        ))
+        return merge_top_k(results, k)
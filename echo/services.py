@@ -1,8 +1,10 @@
 import logging
-from .models import Document, ProcessingStatus
-from .loaders import DocumentLoader
-from .parsers import DocumentParser
-from .vectorstore import VectorStoreService 
+from .answer_cache import invalidate_document
+from .models import Document, IngestionStage, ProcessingStatus
+from .parse_pool import iter_pdf_chunks
+from .vectorstore import get_vector_service
+from .pipeline import EmbeddingPipeline
+from .routing import DocumentRoutingIndex
 
 from asgiref.sync import sync_to_async
 from channels.layers import get_channel_layer
@@ -10,6 +12,26 @@ from channels.layers import get_channel_layer
 
 logger = logging.getLogger(__name__)
 
+
+class IngestionCheckpoint:
+    """
+    Progress hooks for one ingestion run.
+
+    The base class only keeps progress in memory; the job queue persists
+    it (see echo.jobs.JobCheckpoint) so a crashed run can resume.
+    """
+
+    def __init__(self, stage=IngestionStage.PARSE, completed_batches=None):
+        self.stage = stage
+        self.completed_batches = set(completed_batches or ())
+
+    def set_stage(self, stage):
+        self.stage = stage
+
+    def batch_done(self, index):
+        self.completed_batches.add(index)
+
+
 class DocumentIngestionService:
     """
     Orchestrates:
@@ -20,13 +42,39 @@ class DocumentIngestionService:
     """
 
     def __init__(self, embeddings):
-        self.vector_service = VectorStoreService(embeddings)
+        self.vector_service = get_vector_service(embeddings)
+        self.pipeline = EmbeddingPipeline(embeddings, self.vector_service)
+        self.routing_index = DocumentRoutingIndex(embeddings)
 
-    def ingest(self, document: Document):
+    @staticmethod
+    def _tag_chunks(chunks, document: Document):
+        # Inject document_id into metadata (minimal change)
+        for chunk in chunks:
+            if not chunk.metadata:
+                chunk.metadata = {}
+            chunk.metadata["document_id"] = str(document.id)
+            yield chunk
+
+    @staticmethod
+    def _mark_first(items, checkpoint, stage):
+        # Records that the stream has reached `stage` once it yields
+        first = True
+        for item in items:
+            if first:
+                checkpoint.set_stage(stage)
+                first = False
+            yield item
+
+    def ingest(self, document: Document, checkpoint: IngestionCheckpoint = None, mark_failed: bool = True):
         """
         Synchronous ingestion logic.
-        Async wrapper will call this in next phase.
+
+        checkpoint: resume point from an earlier attempt; batches listed
+        in checkpoint.completed_batches are neither embedded nor upserted.
+        mark_failed: set to False when the caller will retry, so the
+        document stays PENDING between attempts.
         """
+        checkpoint = checkpoint or IngestionCheckpoint()
         try:
             existing = Document.objects.filter(
                 file_hash=document.file_hash,
@@ -39,23 +87,44 @@ class DocumentIngestionService:
                 document.save(update_fields=["processing_status"])
                 return
 
-            raw_docs = DocumentLoader.load_pdf(document.file.path)
-            chunks = DocumentParser.chunk_documents(raw_docs)
+            # Streamed end to end: pages are read lazily, chunked as they
+            # arrive and embedded/upserted in batches, so memory stays flat
+            # regardless of PDF size.
+            # Parse/chunk are deterministic, so a resumed run re-reads pages
+            # but skips every batch that already reached the vector store.
+            # Parsing runs in the parse process pool when it is enabled.
+            checkpoint.set_stage(IngestionStage.PARSE)
+            chunks = self._mark_first(
+                self._tag_chunks(iter_pdf_chunks(document.file.path), document),
+                checkpoint,
+                IngestionStage.CHUNK,
+            )
 
-            # Inject document_id into metadata (minimal change)
-            for chunk in chunks:
-                if not chunk.metadata:
-                    chunk.metadata = {}
-                chunk.metadata["document_id"] = str(document.id)
+            def batch_done(index):
+                checkpoint.batch_done(index)
+                checkpoint.set_stage(IngestionStage.EMBED)
 
-            self.vector_service.add_documents(chunks)
+            # Batched, concurrent embed + upsert with per-batch retries
+            self.pipeline.run(
+                chunks,
+                document_id=str(document.id),
+                completed_batches=checkpoint.completed_batches,
+                on_batch_done=batch_done,
+            )
+            # Document-level entry for routing global questions
+            self.routing_index.update_document(str(document.id), title=document.title)
+            checkpoint.set_stage(IngestionStage.DONE)
 
             document.processing_status = ProcessingStatus.INDEXED
-            document.save(update_fields=["processing_status"])
+            document.index_version += 1
+            document.save(update_fields=["processing_status", "index_version"])
+            # Answers built from the previous chunks no longer apply
+            invalidate_document(document.id)
 
         except Exception as exc:
             logger.exception("Document ingestion failed.")
-            document.processing_status = ProcessingStatus.FAILED
             document.error_message = str(exc)
+            if mark_failed:
+                document.processing_status = ProcessingStatus.FAILED
             document.save(update_fields=["processing_status", "error_message"])
             raise
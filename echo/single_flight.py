@@ -0,0 +1,107 @@
+"""
+Single-flight coalescing of identical chat runs.
+
+A run started through join() is shared: later callers with the same key
+attach to it instead of starting their own, and every subscriber gets
+the run's full event stream (events already sent are replayed first).
+The run is cancelled once its last subscriber goes away.
+"""
+import asyncio
+import logging
+from contextlib import aclosing
+
+from .answer_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+
+    def __init__(self, key, events):
+        """
+        events is the async iterator of the shared run.
+        """
+        self.key = key
+        self.events = []
+        self.error = None
+        self.done = False
+        self.subscribers = 0
+        self._wake = asyncio.Event()
+        self.task = asyncio.create_task(self._run(events))
+
+    @property
+    def joinable(self) -> bool:
+        # Once the last subscriber has left, the run is being cancelled
+        # even though it hasn't unwound yet
+        return not self.done and self.subscribers > 0 and not self.task.cancelling()
+
+    def _notify(self):
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+    async def _run(self, events):
+        try:
+            async with aclosing(events):
+                async for event in events:
+                    self.events.append(event)
+                    self._notify()
+        except asyncio.CancelledError:
+            # Anyone still subscribed must not take the partial run as whole
+            self.error = RuntimeError(f"shared run {self.key} cancelled")
+            raise
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self):
+        """
+        Yields every event of the run from the start. Call join() rather
+        than this directly: it counts the subscriber in.
+        """
+        index = 0
+        try:
+            while True:
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._wake.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                logger.info(f"Last subscriber left; cancelling shared run {self.key}")
+                self.task.cancel()
+
+
+_flights = {}
+
+
+def flight_key(document_id, question: str):
+    return str(document_id or ""), normalize_question(question)
+
+
+def join(key, start):
+    """
+    Returns (events, joined): the events of the run in flight for key,
+    or of a new run from start() (an async iterator) if there is none;
+    joined is True when attaching to a run that was already going.
+    """
+    flight = _flights.get(key)
+    joined = flight is not None and flight.joinable
+    if not joined:
+        flight = Flight(key, start())
+        _flights[key] = flight
+        flight.task.add_done_callback(lambda _: _flights.pop(key, None) if _flights.get(key) is flight else None)
+    else:
+        logger.info(f"Joining shared run {key} ({flight.subscribers} subscribers)")
+    flight.subscribers += 1
+    return flight.subscribe(), joined
+
+
+def in_flight() -> int:
+    return len(_flights)
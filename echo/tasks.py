@@ -1,22 +1,58 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from asgiref.sync import sync_to_async
 from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections
 from .models import Document, ProcessingStatus
 from .services import DocumentIngestionService  # existing sync service
 
 logger = logging.getLogger(__name__)
 
+_ingestion_executor = None
+_executor_lock = threading.Lock()
 
-async def ingest_document_background(document_id, embeddings):
+
+def get_ingestion_executor() -> ThreadPoolExecutor:
+    """
+    Threads reserved for ingestion.
+
+    sync_to_async's default (thread_sensitive=True) would run every
+    ingestion on Django's single shared sync thread, the same one views use
+    for ORM calls, so one large PDF would block all request-path DB access
+    and ingestions would run one at a time.
+    """
+    global _ingestion_executor
+    with _executor_lock:
+        if _ingestion_executor is None:
+            _ingestion_executor = ThreadPoolExecutor(
+                max_workers=settings.INGESTION_EXECUTOR_WORKERS,
+                thread_name_prefix="ingestion",
+            )
+        return _ingestion_executor
+
+
+def _run_ingestion(document, embeddings, **kwargs):
+    try:
+        DocumentIngestionService(embeddings).ingest(document, **kwargs)
+    finally:
+        # Executor threads outlive the job; don't leak their DB connections
+        connections.close_all()
+
+
+async def ingest_document_background(document_id, embeddings, checkpoint=None, final_attempt=True):
     """
     Async wrapper around the synchronous ingestion service.
 
-    Uses sync_to_async to prevent blocking the event loop.
+    Runs ingestion on its own thread pool (INGESTION_EXECUTOR_WORKERS)
+    so it blocks neither the event loop nor request-path ORM calls.
     Sends WebSocket notification when processing completes.
 
-    NOTE:
-    This is intentionally a lightweight async approach.
-    In production, this should move to Celery / SQS.
+    Driven by the ingestion job queue (echo/jobs.py), which passes the
+    job's checkpoint and retries failures; only the final attempt marks
+    the document FAILED and notifies the UI. Errors are re-raised so the
+    queue can record them.
     """
 
     channel_layer = get_channel_layer()
@@ -24,11 +60,14 @@ async def ingest_document_background(document_id, embeddings):
     try:
         # Fetch document safely in async context
         document = await sync_to_async(Document.objects.get)(id=document_id)
-        
-        ingestion_service = DocumentIngestionService(embeddings)
 
-        # Run CPU-bound ingestion in thread
-        await sync_to_async(ingestion_service.ingest)(document)
+        # Run CPU-bound ingestion on the dedicated ingestion pool; the short
+        # status lookups around it stay on the shared sync thread.
+        await sync_to_async(
+            _run_ingestion,
+            thread_sensitive=False,
+            executor=get_ingestion_executor(),
+        )(document, embeddings, checkpoint=checkpoint, mark_failed=final_attempt)
 
         # Refresh document state
         document = await sync_to_async(Document.objects.get)(id=document_id)
@@ -46,6 +85,9 @@ async def ingest_document_background(document_id, embeddings):
     except Exception as exc:
         logger.exception("Background ingestion failed")
 
+        if not final_attempt:
+            raise
+
         try:
             document = await sync_to_async(Document.objects.get)(id=document_id)
             document.processing_status = ProcessingStatus.FAILED
@@ -64,3 +106,4 @@ async def ingest_document_background(document_id, embeddings):
                 "message": "Document indexing failed.",
             },
         )
+        raise
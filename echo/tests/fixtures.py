@@ -0,0 +1,82 @@
+"""
+Shared test helpers: real files on disk, a throwaway checkpoint database
+and fake LLM gateways.
+"""
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test import override_settings
+
+from echo.checkpoint import close_checkpointer
+
+
+def write_text_pdf(path, pages, lines_per_page=40):
+    """
+    Writes a minimal multi-page text PDF (Helvetica, one content stream
+    per page) without any PDF-writing dependency.
+    """
+    body = {}
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    for page in range(pages):
+        lines = [
+            f"Page {page} line {line}: the quick brown fox jumps over the lazy dog "
+            f"{page * lines_per_page + line}"
+            for line in range(lines_per_page)
+        ]
+        stream = "BT /F1 9 Tf 36 800 Td 11 TL " + " ".join(f"({text}) '" for text in lines) + " ET"
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        body[content_id] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+        body[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(page_id)
+
+    body[1] = "<< /Type /Catalog /Pages 2 0 R >>"
+    body[2] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>"
+    body[font_id] = "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+
+    with open(path, "wb") as fh:
+        fh.write(b"%PDF-1.4\n")
+        offsets = {}
+        for obj_id in range(1, next_id):
+            offsets[obj_id] = fh.tell()
+            fh.write(f"{obj_id} 0 obj\n{body[obj_id]}\nendobj\n".encode("latin-1"))
+        xref = fh.tell()
+        fh.write(f"xref\n0 {next_id}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, next_id):
+            fh.write(f"{offsets[obj_id]:010d} 00000 n \n".encode())
+        fh.write(f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return path
+
+
+def temporary_checkpoints(test, prefix="ragtalk_checkpoints_"):
+    """
+    Points CHECKPOINT_DB_PATH at a fresh temp directory for one test and
+    closes the checkpointer afterwards. Call from setUp; returns the
+    directory.
+    """
+    directory = tempfile.mkdtemp(prefix=prefix)
+    test.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    settings_override = override_settings(CHECKPOINT_DB_PATH=Path(directory) / "checkpoints.sqlite3")
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    test.addCleanup(close_checkpointer)
+    return directory
+
+
+def streaming(generate):
+    """
+    Turns a fake safe_generate (messages -> AIMessage) into a fake
+    safe_stream that yields the reply word by word.
+    """
+    async def stream(messages):
+        response = await generate(messages)
+        for word in re.findall(r"\S+\s*", response.content):
+            yield word
+    return stream
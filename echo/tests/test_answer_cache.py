@@ -0,0 +1,202 @@
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from langchain_core.messages import AIMessage
+
+from echo.answer_cache import AnswerCache, get_answer_cache
+from echo.models import Document, ProcessingStatus
+from echo.rag_engine import _index_version, compile_workflow
+from echo.tests.fixtures import streaming, temporary_checkpoints
+from echo.vectorstore import vector_store_registry
+
+DOCUMENT = "6f1c1f0e-6a3e-4a4e-9c55-0d5cc0a1b6f2"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class AnswerCacheTest(SimpleTestCase):
+
+    def test_questions_are_normalised(self):
+        cache = AnswerCache(max_entries=10, ttl=0)
+        cache.put(DOCUMENT, "Who are the authors?", 1, "Yuvanesh Anand")
+
+        self.assertEqual(cache.get(DOCUMENT, "  who are the   AUTHORS ", 1), "Yuvanesh Anand")
+        self.assertIsNone(cache.get(DOCUMENT, "who are the authors", 2))
+        self.assertIsNone(cache.get("other", "who are the authors", 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = AnswerCache(max_entries=2, ttl=0)
+        cache.put(DOCUMENT, "one", 1, "1")
+        cache.put(DOCUMENT, "two", 1, "2")
+        cache.get(DOCUMENT, "one", 1)
+        cache.put(DOCUMENT, "three", 1, "3")
+
+        self.assertIsNone(cache.get(DOCUMENT, "two", 1))
+        self.assertEqual(cache.get(DOCUMENT, "one", 1), "1")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = AnswerCache(max_entries=10, ttl=60, clock=clock)
+        cache.put(DOCUMENT, "summarize this", 1, "Summary.")
+
+        clock.now = 59
+        self.assertEqual(cache.get(DOCUMENT, "summarize this", 1), "Summary.")
+        clock.now = 61
+        self.assertIsNone(cache.get(DOCUMENT, "summarize this", 1))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_invalidate_document(self):
+        cache = AnswerCache(max_entries=10, ttl=0)
+        cache.put(DOCUMENT, "one", 1, "1")
+        cache.put(DOCUMENT, "two", 1, "2")
+        cache.put("other", "one", 1, "1")
+
+        self.assertEqual(cache.invalidate_document(DOCUMENT), 2)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+
+async def fake_search(state, query):
+    return [{"content": "GPT4All was written by Yuvanesh Anand.", "score": 0.1, "metadata": {}}]
+
+
+class CountingLLM:
+
+    def __init__(self):
+        self.answers = 0
+
+    async def __call__(self, messages):
+        if "CONTEXT" in messages[0].content:
+            self.answers += 1
+            return AIMessage(content=f"Answer {self.answers}: Yuvanesh Anand.")
+        return AIMessage(content=messages[-1].content)
+
+
+@override_settings(
+    RAG_EXPANSION_BUDGET_SECONDS=0, RAG_ANSWER_CACHE=True, RAG_ANSWER_CACHE_FIRST_TURN_ONLY=True,
+)
+class AnswerCacheGraphTest(SimpleTestCase):
+
+    def setUp(self):
+        temporary_checkpoints(self, prefix="ragtalk_answer_cache_")
+
+        get_answer_cache().clear()
+        self.addCleanup(get_answer_cache().clear)
+        self.version = 1
+        self.llm = CountingLLM()
+
+        async def index_version(document_id):
+            return self.version
+
+        patches = [
+            patch("echo.rag_engine._search", fake_search),
+            patch("echo.rag_engine._index_version", index_version),
+            patch("echo.rag_engine.safe_generate", self.llm),
+            patch("echo.rag_engine.safe_stream", streaming(self.llm)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.graph = compile_workflow(speculative=True)
+
+    async def ask(self, question, thread, document_id=DOCUMENT):
+        config = {"configurable": {"thread_id": thread}}
+        tokens, cached = [], False
+        async for mode, chunk in self.graph.astream(
+            {"question": question, "document_id": document_id}, config, stream_mode=["custom", "updates"],
+        ):
+            if mode == "custom":
+                tokens.append(chunk["token"])
+            elif (chunk.get("answer_cache") or {}).get("cached"):
+                cached = True
+        return "".join(tokens), cached
+
+    async def test_repeated_question_replays_the_cached_answer(self):
+        first, cached = await self.ask("Who are the authors?", "a")
+        self.assertFalse(cached)
+
+        second, cached = await self.ask("who are the authors", "b")
+
+        self.assertTrue(cached)
+        self.assertEqual(second, first)
+        self.assertEqual(self.llm.answers, 1)
+        state = await self.graph.aget_state({"configurable": {"thread_id": "b"}})
+        self.assertEqual([m.type for m in state.values["messages"]], ["human", "ai"])
+
+    async def test_reindexed_document_is_answered_again(self):
+        await self.ask("Who are the authors?", "a")
+        self.version = 2
+
+        _, cached = await self.ask("Who are the authors?", "b")
+
+        self.assertFalse(cached)
+        self.assertEqual(self.llm.answers, 2)
+
+    async def test_follow_up_turns_are_not_cached(self):
+        await self.ask("Who are the authors?", "a")
+        await self.ask("Summarize this", "b")
+
+        _, cached = await self.ask("Who are the authors?", "b")
+
+        self.assertFalse(cached)
+        self.assertEqual(self.llm.answers, 3)
+
+    @override_settings(RAG_ANSWER_CACHE_FIRST_TURN_ONLY=False)
+    async def test_follow_up_turns_can_reuse_answers(self):
+        await self.ask("Who are the authors?", "a")
+        await self.ask("Summarize this", "b")
+
+        _, cached = await self.ask("Who are the authors?", "b")
+
+        self.assertTrue(cached)
+
+    async def test_global_questions_are_not_cached(self):
+        await self.ask("Who are the authors?", "a", document_id=None)
+        _, cached = await self.ask("Who are the authors?", "b", document_id=None)
+
+        self.assertFalse(cached)
+
+
+class IndexVersionTest(TestCase):
+
+    def setUp(self):
+        # Deleting a document also drops its routing entry from the vector store
+        chroma_dir = tempfile.mkdtemp(prefix="ragtalk_chroma_")
+        self.addCleanup(shutil.rmtree, chroma_dir, ignore_errors=True)
+        self.addCleanup(vector_store_registry.shutdown)
+        settings_override = override_settings(CHROMA_DB_DIR=chroma_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_answer_cache().clear()
+        self.document = Document.objects.create(
+            title="paper",
+            file=SimpleUploadedFile("paper.pdf", b"%PDF-1.4"),
+            processing_status=ProcessingStatus.INDEXED,
+            index_version=3,
+        )
+        self.addCleanup(self.document.file.storage.delete, self.document.file.name)
+
+    async def test_index_version_of_indexed_documents_only(self):
+        self.assertEqual(await _index_version(self.document.id), 3)
+        self.assertIsNone(await _index_version("not-a-uuid"))
+
+        await Document.objects.filter(id=self.document.id).aupdate(processing_status=ProcessingStatus.PENDING)
+        self.assertIsNone(await _index_version(self.document.id))
+
+    def test_deleting_a_document_drops_its_answers(self):
+        cache = get_answer_cache()
+        cache.put(self.document.id, "summarize this", 3, "Summary.")
+
+        self.document.delete()
+
+        self.assertIsNone(cache.get(self.document.id, "summarize this", 3))
+        self.assertEqual(cache.stats()["entries"], 0)
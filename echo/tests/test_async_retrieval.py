@@ -0,0 +1,118 @@
+import asyncio
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+from echo.rag_engine import rag_graph
+from echo.tests.fixtures import streaming, temporary_checkpoints
+from echo.vectorstore import get_vector_service, vector_store_registry
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    """
+    The sync path blocks like a real HTTP call; the async path yields.
+    If retrieval used the sync client the event loop would stall.
+    """
+
+    latency: float = 0.05
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency)
+        return super().embed_documents(texts)
+
+
+async def fake_generate(messages):
+    await asyncio.sleep(0.01)
+    return AIMessage(content="stub answer")
+
+
+class AsyncRetrievalTest(SimpleTestCase):
+
+    def setUp(self):
+        self.chroma_dir = tempfile.mkdtemp(prefix="ragtalk_chroma_")
+        self.settings_override = override_settings(CHROMA_DB_DIR=self.chroma_dir)
+        self.settings_override.enable()
+        temporary_checkpoints(self)
+        self.embeddings = SlowFakeEmbeddings(size=16)
+
+        patches = [
+            patch("echo.rag_engine.embeddings", self.embeddings),
+            patch("echo.rag_engine.safe_generate", fake_generate),
+            patch("echo.rag_engine.safe_stream", streaming(fake_generate)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        vector_store_registry.shutdown()
+        self.settings_override.disable()
+        shutil.rmtree(self.chroma_dir, ignore_errors=True)
+
+    async def test_async_search_matches_sync_shape(self):
+        service = get_vector_service(self.embeddings)
+        await service.aadd_documents([
+            LCDocument(page_content="GPT4All authors", metadata={"document_id": "doc-1"}),
+            LCDocument(page_content="Training cost", metadata={"document_id": "doc-2"}),
+        ])
+
+        sync_hits = service.search("GPT4All authors", k=2)
+        async_hits = await service.asearch("GPT4All authors", k=2)
+
+        self.assertEqual(
+            [(d.page_content, round(s, 5)) for d, s in sync_hits],
+            [(d.page_content, round(s, 5)) for d, s in async_hits],
+        )
+
+        scoped = await service.asearch(
+            "GPT4All authors", k=2, metadata_filter={"document_id": "doc-2"}
+        )
+        self.assertEqual([d.metadata["document_id"] for d, _ in scoped], ["doc-2"])
+
+    async def test_concurrent_chats_keep_loop_responsive(self):
+        service = get_vector_service(self.embeddings)
+        await service.aadd_documents([
+            LCDocument(page_content=f"chunk {i}", metadata={"document_id": "doc-1"})
+            for i in range(20)
+        ])
+
+        max_lag = 0.0
+        stop = asyncio.Event()
+
+        async def monitor():
+            nonlocal max_lag
+            interval = 0.005
+            while not stop.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(interval)
+                max_lag = max(max_lag, time.perf_counter() - start - interval)
+
+        monitor_task = asyncio.create_task(monitor())
+        chats = [
+            rag_graph.ainvoke(
+                {"question": f"question {i}", "document_id": "doc-1"},
+                {"configurable": {"thread_id": f"lag_test_{i}"}},
+            )
+            for i in range(20)
+        ]
+        states = await asyncio.gather(*chats)
+        stop.set()
+        await monitor_task
+
+        self.assertTrue(all(state["context"] for state in states))
+        # 20 chats x 2 blocking embeds of 50ms would stall the loop for ~2s
+        self.assertLess(max_lag, 0.25)
@@ -27,7 +27,7 @@ class AsyncUploadTest(TransactionTestCase):
         if os.path.exists(TEST_MEDIA_ROOT):
             shutil.rmtree(TEST_MEDIA_ROOT)
 
-    @patch('echo.views.ingest_document_background')
+    @patch('echo.views.enqueue_ingestion')
     def test_upload_returns_202(self, mock_ingest):
         file = SimpleUploadedFile("test.pdf", self.pdf_content, content_type="application/pdf")
         
@@ -36,10 +36,10 @@ class AsyncUploadTest(TransactionTestCase):
         self.assertEqual(response.status_code, 202)
         self.assertIn("document_id", response.json())
         
-        # Verify the background task was triggered
+        # Verify ingestion was queued
         self.assertTrue(mock_ingest.called)
 
-    @patch('echo.views.ingest_document_background')
+    @patch('echo.views.enqueue_ingestion')
     def test_upload_creates_document_record(self, mock_ingest):
         file = SimpleUploadedFile("create_test.pdf", b"unique content", content_type="application/pdf")
         
@@ -48,7 +48,7 @@ class AsyncUploadTest(TransactionTestCase):
         # Check if record exists in DB
         self.assertTrue(Document.objects.filter(title="create_test.pdf").exists())
 
-    @patch('echo.views.ingest_document_background')
+    @patch('echo.views.enqueue_ingestion')
     def test_upload_is_non_blocking(self, mock_ingest):
         file = SimpleUploadedFile("speed_test.pdf", b"fast content", content_type="application/pdf")
         
@@ -0,0 +1,203 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langgraph.checkpoint.memory import MemorySaver
+
+from echo.consumers import ChatConsumer
+from echo.llm_gateway import reset_gateway
+from echo.rag_engine import compile_workflow
+
+
+class SlowGraph:
+    """
+    Streams "<question> token N" forever-ish; records how each run ended.
+    """
+
+    def __init__(self, tokens=200, interval=0.01):
+        self.tokens = tokens
+        self.interval = interval
+        self.started = []
+        self.cancelled = []
+        self.finished = []
+
+    async def astream(self, input, config, stream_mode):
+        question = input["question"]
+        self.started.append(question)
+        try:
+            for index in range(self.tokens):
+                await asyncio.sleep(self.interval)
+                yield "custom", {"token": f"{question} token {index} "}
+            self.finished.append(question)
+        except asyncio.CancelledError:
+            self.cancelled.append(question)
+            raise
+
+
+class EndlessChat:
+    """
+    Fake streaming LLM that only stops when its stream is closed.
+    """
+
+    def __init__(self):
+        self.closed = asyncio.Event()
+        self.chunks = 0
+
+    async def astream(self, messages):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                self.chunks += 1
+                yield AIMessageChunk(content="word ")
+        finally:
+            self.closed.set()
+
+
+class ShortChat:
+    """
+    Fake streaming LLM that answers with a few words.
+    """
+
+    async def ainvoke(self, messages):
+        return AIMessage(content=messages[-1].content)
+
+    async def astream(self, messages):
+        for word in ("short", "answer"):
+            yield AIMessageChunk(content=f"{word} ")
+
+
+async def fake_search(state, query):
+    return [{"content": "stub chunk", "score": 0.1, "metadata": {}}]
+
+
+@override_settings(CHAT_FRAME_MAX_CHARS=0, CHAT_MAX_RUNS_PER_CONNECTION=1, CHAT_SUPERSEDE_RUNS=True)
+class ChatRunLifecycleTest(SimpleTestCase):
+
+    async def connect(self, graph):
+        p = patch("echo.consumers.rag_graph", graph)
+        p.start()
+        self.addCleanup(p.stop)
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), "/ws/chat/")
+        communicator.scope["session"] = SimpleNamespace(session_key="runs")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def frames_until_end(self, communicator):
+        frames = []
+        while not frames or frames[-1].get("type") != "end":
+            frames.append(await communicator.receive_json_from(timeout=5))
+        return frames
+
+    async def test_new_question_supersedes_the_running_one(self):
+        graph = SlowGraph()
+        communicator = await self.connect(graph)
+
+        await communicator.send_json_to({"message": "first"})
+        await communicator.receive_json_from(timeout=5)
+        await communicator.send_json_to({"message": "second"})
+
+        first = await self.frames_until_end(communicator)
+        self.assertEqual(first[-1]["run"], 1)
+        self.assertTrue(first[-1]["cancelled"])
+        self.assertEqual(graph.cancelled, ["first"])
+
+        graph.interval = 0
+        second = await self.frames_until_end(communicator)
+        self.assertTrue(all(frame["run"] == 2 for frame in second))
+        self.assertNotIn("cancelled", second[-1])
+        self.assertEqual(graph.finished, ["second"])
+        await communicator.disconnect()
+
+    async def test_disconnect_cancels_the_run(self):
+        graph = SlowGraph()
+        communicator = await self.connect(graph)
+
+        await communicator.send_json_to({"message": "question"})
+        await communicator.receive_json_from(timeout=5)
+        await communicator.disconnect()
+
+        self.assertEqual(graph.cancelled, ["question"])
+
+    async def test_cancel_message_stops_the_run(self):
+        graph = SlowGraph()
+        communicator = await self.connect(graph)
+
+        await communicator.send_json_to({"message": "question"})
+        await communicator.receive_json_from(timeout=5)
+        await communicator.send_json_to({"type": "cancel"})
+
+        frames = await self.frames_until_end(communicator)
+        self.assertTrue(frames[-1]["cancelled"])
+        self.assertEqual(graph.cancelled, ["question"])
+        await communicator.disconnect()
+
+    @override_settings(CHAT_SUPERSEDE_RUNS=False, CHAT_MAX_RUNS_PER_CONNECTION=2)
+    async def test_runs_over_the_cap_are_refused(self):
+        graph = SlowGraph(tokens=20)
+        communicator = await self.connect(graph)
+
+        for question in ("one", "two", "three"):
+            await communicator.send_json_to({"message": question})
+
+        frames = []
+        while sum(frame.get("type") == "end" for frame in frames) < 2:
+            frames.append(await communicator.receive_json_from(timeout=5))
+        self.assertIn({"type": "error", "error": "too_many_runs"}, frames)
+        self.assertEqual(graph.started, ["one", "two"])
+        await communicator.disconnect()
+
+    @override_settings(RAG_EXPANSION_BUDGET_SECONDS=0)
+    async def test_cancellation_closes_the_llm_stream(self):
+        reset_gateway()
+        llm = EndlessChat()
+        with patch("echo.rag_engine._search", fake_search), \
+                patch("echo.rag_engine.get_checkpointer", return_value=None), \
+                patch("echo.llm_gateway.primary_llm", llm):
+            communicator = await self.connect(compile_workflow(speculative=False))
+            await communicator.send_json_to({"message": "question"})
+            await communicator.receive_json_from(timeout=5)
+            await communicator.disconnect()
+
+            await asyncio.wait_for(llm.closed.wait(), timeout=1)
+            chunks = llm.chunks
+            await asyncio.sleep(0.05)
+            self.assertEqual(llm.chunks, chunks)
+
+    @override_settings(RAG_EXPANSION_BUDGET_SECONDS=0, RAG_ANSWER_CACHE=False, CHAT_SINGLE_FLIGHT=False)
+    async def test_memory_compaction_runs_after_the_end_frame(self):
+        reset_gateway()
+        release = asyncio.Event()
+        compacted = []
+
+        async def slow_compact(messages, summary, summarize):
+            await release.wait()
+            compacted.append(len(messages))
+            return {"summary": "compacted"}
+
+        with patch("echo.rag_engine._search", fake_search), \
+                patch("echo.rag_engine.get_checkpointer", return_value=MemorySaver()), \
+                patch("echo.rag_engine.compact", slow_compact), \
+                patch("echo.llm_gateway.primary_llm", ShortChat()):
+            graph = compile_workflow(speculative=False)
+            communicator = await self.connect(graph)
+
+            await communicator.send_json_to({"message": "first"})
+            frames = await self.frames_until_end(communicator)
+            self.assertEqual("".join(frame.get("text", "") for frame in frames), "short answer ")
+            # A follow-up doesn't cancel the pending compaction
+            await communicator.send_json_to({"message": "second"})
+            await self.frames_until_end(communicator)
+            self.assertEqual(compacted, [])
+
+            release.set()
+            await asyncio.sleep(0.05)
+            await communicator.disconnect()
+
+        self.assertEqual(compacted[0], 2)
+        state = await graph.aget_state({"configurable": {"thread_id": "runs"}})
+        self.assertEqual(state.values["summary"], "compacted")
+        self.assertEqual(len(state.values["messages"]), 4)
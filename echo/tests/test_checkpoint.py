@@ -0,0 +1,195 @@
+import asyncio
+import gc
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.messages import AIMessage, HumanMessage
+
+from echo.checkpoint import SQLiteCheckpointSaver, SQLiteStore
+from echo.rag_engine import compile_workflow
+from echo.tests.fixtures import streaming
+
+
+async def fake_search(state, query):
+    return [{"content": "stub chunk", "score": 0.1, "metadata": {}}]
+
+
+async def fake_generate(messages):
+    return AIMessage(content=f"answer to {messages[-1].content}")
+
+
+@override_settings(RAG_EXPANSION_BUDGET_SECONDS=0)
+class SQLiteCheckpointSaverTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="ragtalk_checkpoints_")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = Path(directory) / "checkpoints.sqlite3"
+        fakes = (
+            ("echo.rag_engine._search", fake_search),
+            ("echo.rag_engine.safe_generate", fake_generate),
+            ("echo.rag_engine.safe_stream", streaming(fake_generate)),
+        )
+        for target, fake in fakes:
+            p = patch(target, fake)
+            p.start()
+            self.addCleanup(p.stop)
+
+    def saver(self, **kwargs):
+        saver = SQLiteCheckpointSaver(self.path, **kwargs)
+        self.addCleanup(saver.close)
+        return saver
+
+    def graph(self, saver):
+        with patch("echo.rag_engine.get_checkpointer", return_value=saver):
+            return compile_workflow(speculative=False)
+
+    async def ask(self, graph, thread_id, question):
+        return await graph.ainvoke({"question": question}, {"configurable": {"thread_id": thread_id}})
+
+    async def test_conversation_survives_a_restart(self):
+        saver = self.saver()
+        await self.ask(self.graph(saver), "t1", "first question")
+        saver.close()
+
+        state = await self.ask(self.graph(self.saver()), "t1", "second question")
+
+        self.assertEqual(
+            [message.content for message in state["messages"] if isinstance(message, HumanMessage)],
+            ["first question", "second question"],
+        )
+
+    async def test_only_latest_checkpoints_are_kept(self):
+        saver = self.saver(keep_latest=2)
+        graph = self.graph(saver)
+        for turn in range(5):
+            await self.ask(graph, "t1", f"question {turn}")
+        await self.ask(graph, "t2", "other thread")
+
+        stats = saver.stats()
+        self.assertEqual(stats["threads"], 2)
+        self.assertEqual(stats["checkpoints"], 4)
+        history = [item async for item in saver.alist({"configurable": {"thread_id": "t1"}})]
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[0].checkpoint["channel_values"]["question"], "question 4")
+
+    async def test_idle_threads_are_evicted(self):
+        saver = self.saver(thread_ttl=0)
+        graph = self.graph(saver)
+        await self.ask(graph, "old", "question")
+        saver.flush()
+        time.sleep(0.05)
+        await self.ask(graph, "new", "question")
+        saver.flush()
+
+        self.assertEqual(saver.evict_idle(ttl=0.03), 1)
+        self.assertIsNone(await saver.aget_tuple({"configurable": {"thread_id": "old"}}))
+        self.assertIsNotNone(await saver.aget_tuple({"configurable": {"thread_id": "new"}}))
+        self.assertEqual(saver.stats()["threads"], 1)
+
+    async def test_memory_stays_flat_across_many_sessions(self):
+        # Scaled-down `manage.py soak_checkpoints`: MemorySaver grows ~30 KB
+        # per session here, so 150 sessions would add several MB
+        saver = self.saver(keep_latest=2, thread_ttl=0.1)
+        graph = self.graph(saver)
+        batch = 50
+
+        async def sessions(start):
+            await asyncio.gather(*(self.ask(graph, f"soak-{n}", "question") for n in range(start, start + batch)))
+            saver.flush()
+
+        for start in range(0, 2 * batch, batch):
+            await sessions(start)
+        gc.collect()
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        for start in range(2 * batch, 5 * batch, batch):
+            await sessions(start)
+            stats = saver.stats()
+            self.assertLessEqual(stats["checkpoints"], 2 * stats["threads"])
+            self.assertLessEqual(stats["threads"], 2 * batch)
+        gc.collect()
+
+        self.assertLess(tracemalloc.get_traced_memory()[0], 2**20)
+
+    async def test_writes_are_queued_off_the_event_loop(self):
+        saver = self.saver()
+        slow_put = saver._put
+
+        def put(*args):
+            time.sleep(0.05)
+            slow_put(*args)
+
+        with patch.object(saver, "_put", side_effect=put):
+            start = time.perf_counter()
+            await self.ask(self.graph(saver), "t1", "question")
+            elapsed = time.perf_counter() - start
+            # Reads still see every queued write
+            latest = await saver.aget_tuple({"configurable": {"thread_id": "t1"}})
+
+        self.assertLess(elapsed, 0.2)
+        self.assertEqual(latest.checkpoint["channel_values"]["answer"], "answer to question")
+
+    async def test_delete_thread(self):
+        saver = self.saver()
+        await self.ask(self.graph(saver), "t1", "question")
+
+        await saver.adelete_thread("t1")
+
+        self.assertEqual(saver.stats(), {"threads": 0, "checkpoints": 0, "writes": 0})
+
+
+class SQLiteStoreTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="ragtalk_store_")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.store = SQLiteStore(Path(directory) / "checkpoints.sqlite3")
+        self.addCleanup(self.store.close)
+
+    def test_put_get_search_and_delete(self):
+        self.store.put(("users", "alice"), "prefs", {"lang": "en", "tone": "short"})
+        self.store.put(("users", "bob"), "prefs", {"lang": "fr"})
+        self.store.put(("usersx",), "other", {"lang": "en"})
+
+        self.assertEqual(self.store.get(("users", "alice"), "prefs").value["tone"], "short")
+        self.assertEqual(
+            [item.namespace for item in self.store.search(("users",), filter={"lang": "en"})],
+            [("users", "alice")],
+        )
+        self.assertEqual(
+            self.store.list_namespaces(prefix=("users",)), [("users", "alice"), ("users", "bob")]
+        )
+        self.assertEqual(self.store.list_namespaces(max_depth=1), [("users",), ("usersx",)])
+
+        self.store.delete(("users", "alice"), "prefs")
+        self.assertIsNone(self.store.get(("users", "alice"), "prefs"))
+
+    def test_filter_operators_and_namespace_conditions(self):
+        self.store.put(("docs", "a"), "meta", {"pages": 12, "tags": ["llm", "report"], "author": {"name": "Anand"}})
+        self.store.put(("docs", "b"), "meta", {"pages": 3, "tags": ["llm"], "author": {"name": "Nussbaum"}})
+
+        def keys(**filter):
+            return sorted(item.namespace[-1] for item in self.store.search(("docs",), filter=filter))
+
+        self.assertEqual(keys(pages={"$gt": 5}), ["a"])
+        self.assertEqual(keys(pages={"$gte": 3, "$lt": 12}), ["b"])
+        self.assertEqual(keys(pages={"$ne": 3}), ["a"])
+        self.assertEqual(keys(author={"name": "Nussbaum"}), ["b"])
+        self.assertEqual(keys(tags=["llm"]), ["b"])
+        with self.assertRaises(ValueError):
+            keys(pages={"$in": [3]})
+
+        self.assertEqual(self.store.list_namespaces(suffix=("a",)), [("docs", "a")])
+        self.assertEqual(self.store.list_namespaces(prefix=("*", "b")), [("docs", "b")])
+
+    async def test_async_api(self):
+        await self.store.aput(("threads",), "t1", {"title": "GPT4All"})
+
+        item = await self.store.aget(("threads",), "t1")
+        self.assertEqual(item.value, {"title": "GPT4All"})
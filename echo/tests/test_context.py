@@ -0,0 +1,80 @@
+from django.test import SimpleTestCase
+from langchain_core.documents import Document as LCDocument
+
+from echo.context import build_context, merge_adjacent
+from echo.parsers import DocumentParser
+from echo.tokens import count_tokens
+
+PAGE = " ".join(
+    f"Sentence {i} of the report describes finding number {i} in some detail."
+    for i in range(60)
+)
+
+
+def hits_for(text, page=0, document_id="doc-1", scores=None):
+    chunks = DocumentParser.chunk_documents([
+        LCDocument(page_content=text, metadata={"page": page, "document_id": document_id})
+    ])
+    scores = scores or [0.1 * (i + 1) for i in range(len(chunks))]
+    return [
+        {"content": chunk.page_content, "score": score, "metadata": chunk.metadata}
+        for chunk, score in zip(chunks, scores)
+    ]
+
+
+class ContextBuilderTest(SimpleTestCase):
+
+    def test_overlapping_chunks_are_stitched_back_together(self):
+        hits = hits_for(PAGE)
+        self.assertGreater(len(hits), 3)
+
+        context = build_context(hits, budget=0)
+
+        self.assertEqual(context, [PAGE])
+        self.assertLess(count_tokens(context[0]), sum(count_tokens(hit["content"]) for hit in hits))
+
+    def test_merged_passage_keeps_best_score(self):
+        hits = hits_for(PAGE)
+        hits[2]["score"] = 0.01
+
+        self.assertEqual(merge_adjacent(hits)[0]["score"], 0.01)
+
+    def test_different_pages_and_documents_stay_separate(self):
+        other = PAGE.replace("report", "appendix")
+        hits = [hits_for(PAGE, page=0)[0], hits_for(other, page=1)[1], hits_for(other, document_id="doc-2")[3]]
+
+        self.assertEqual(len(build_context(hits, budget=0)), 3)
+
+    def test_non_adjacent_chunks_are_not_merged(self):
+        hits = hits_for(PAGE)
+
+        self.assertEqual(len(build_context([hits[0], hits[3]], budget=0)), 2)
+
+    def test_near_duplicates_from_other_documents_are_dropped(self):
+        original = hits_for(PAGE, document_id="doc-1")[0]
+        copy = {**hits_for(PAGE, document_id="doc-2")[0], "score": 0.5}
+        copy["content"] = copy["content"].upper()
+
+        self.assertEqual(build_context([original, copy], budget=0), [original["content"]])
+
+    def test_hits_without_offsets_pass_through_in_score_order(self):
+        hits = [{"content": "chunk 3", "score": 0.3}, {"content": "chunk 1", "score": 0.1}]
+
+        self.assertEqual(build_context(hits, budget=0), ["chunk 1", "chunk 3"])
+
+    def test_budget_keeps_best_passages_that_fit(self):
+        hits = [
+            {"content": "alpha " * 50, "score": 0.1},
+            {"content": "bravo " * 200, "score": 0.2},
+            {"content": "charlie " * 20, "score": 0.3},
+        ]
+
+        context = build_context(hits, budget=150)
+
+        self.assertEqual(context, [hits[0]["content"], hits[2]["content"]])
+
+    def test_oversized_top_passage_is_truncated(self):
+        context = build_context([{"content": "alpha " * 500, "score": 0.1}], budget=50)
+
+        self.assertEqual(len(context), 1)
+        self.assertLessEqual(count_tokens(context[0]), 60)
@@ -13,7 +13,7 @@ class DeduplicationTest(TransactionTestCase):
     def setUp(self):
         self.pdf_content = b"identical content for deduplication"
 
-    @patch('echo.views.ingest_document_background')
+    @patch('echo.views.enqueue_ingestion')
     def test_duplicate_document_skips_processing(self, mock_ingest):
         """
         Uploading the same file twice should return the same ID 
@@ -0,0 +1,178 @@
+import asyncio
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from echo.embeddings import CachedEmbeddings, EmbeddingCache, QueryBatcher
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """
+    Fake provider that records how many texts it was asked to embed.
+    """
+
+    calls: int = 0
+    texts: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddingsTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="ragtalk_emb_")
+        self.path = os.path.join(self.tmp_dir, "cache.sqlite3")
+        self.provider = CountingEmbeddings(size=8)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make(self, memory_bytes=1024 * 1024):
+        cache = EmbeddingCache(self.path, max_memory_bytes=memory_bytes)
+        self.addCleanup(cache.close)
+        return CachedEmbeddings(self.provider, cache, model_name="fake-model")
+
+    def test_repeated_and_duplicate_texts_hit_cache(self):
+        embeddings = self.make()
+
+        first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+        second = embeddings.embed_documents(["beta", "alpha"])
+
+        self.assertEqual(self.provider.texts, 2)
+        self.assertEqual(first[0], first[2])
+        self.assertEqual(second, [first[1], first[0]])
+        stats = embeddings.stats()
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["memory_hits"], 2)
+
+    def test_query_and_documents_share_cache(self):
+        embeddings = self.make()
+
+        vector = embeddings.embed_query("who are the authors?")
+
+        self.assertEqual(embeddings.embed_documents(["who are the authors?"]), [vector])
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_disk_tier_survives_restart(self):
+        self.make().embed_documents(["persisted chunk"])
+
+        reopened = self.make()
+        reopened.embed_documents(["persisted chunk"])
+
+        self.assertEqual(self.provider.texts, 1)
+        self.assertEqual(reopened.stats()["disk_hits"], 1)
+
+    def test_memory_tier_is_bounded(self):
+        # 8 float32 dims = 32 bytes per vector; room for 3
+        embeddings = self.make(memory_bytes=100)
+
+        embeddings.embed_documents([f"text {i}" for i in range(10)])
+
+        self.assertLessEqual(embeddings.stats()["memory_bytes"], 100)
+        # Evicted entries are still served from disk
+        embeddings.embed_documents(["text 0"])
+        self.assertEqual(self.provider.texts, 10)
+        self.assertEqual(embeddings.stats()["disk_hits"], 1)
+
+    def test_model_name_is_part_of_key(self):
+        self.make().embed_documents(["same text"])
+
+        cache = EmbeddingCache(self.path, max_memory_bytes=1024)
+        self.addCleanup(cache.close)
+        CachedEmbeddings(self.provider, cache, model_name="other-model").embed_documents(["same text"])
+
+        self.assertEqual(self.provider.texts, 2)
+
+    async def test_async_paths_use_cache(self):
+        embeddings = self.make()
+
+        vector = await embeddings.aembed_query("async question")
+        again = await embeddings.aembed_documents(["async question"])
+
+        self.assertEqual(again, [vector])
+        self.assertEqual(self.provider.texts, 1)
+
+
+class SlowEmbeddings(CountingEmbeddings):
+    """
+    Async provider with a fixed per-request latency.
+    """
+
+    latency: float = 0.02
+    fail: bool = False
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise ConnectionError("embedding service down")
+        return self.embed_documents(texts)
+
+
+class QueryBatcherTest(SimpleTestCase):
+
+    def setUp(self):
+        self.provider = SlowEmbeddings(size=8)
+
+    async def test_concurrent_queries_share_one_request(self):
+        batcher = QueryBatcher(self.provider, max_batch=16, max_wait_ms=20)
+        questions = [f"question {i}" for i in range(10)]
+
+        vectors = await asyncio.gather(*(batcher.aembed_query(q) for q in questions))
+
+        self.assertEqual(self.provider.calls, 1)
+        self.assertEqual(vectors, [self.provider.embed_query(q) for q in questions])
+        stats = batcher.stats()
+        self.assertEqual((stats["queries"], stats["batches"], stats["max_batch_size"]), (10, 1, 10))
+        self.assertLessEqual(stats["wait_p95_ms"], 50)
+
+    async def test_full_batch_is_sent_without_waiting(self):
+        batcher = QueryBatcher(self.provider, max_batch=4, max_wait_ms=10_000)
+
+        await asyncio.wait_for(asyncio.gather(*(batcher.aembed_query(f"q{i}") for i in range(8))), timeout=1)
+
+        self.assertEqual(self.provider.calls, 2)
+        self.assertEqual(batcher.stats()["mean_batch_size"], 4)
+
+    async def test_duplicate_queries_are_embedded_once(self):
+        batcher = QueryBatcher(self.provider, max_batch=16, max_wait_ms=5)
+
+        first, second = await asyncio.gather(batcher.aembed_query("same"), batcher.aembed_query("same"))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.provider.texts, 1)
+
+    async def test_failure_reaches_every_caller(self):
+        self.provider.fail = True
+        batcher = QueryBatcher(self.provider, max_batch=16, max_wait_ms=5)
+
+        results = await asyncio.gather(
+            batcher.aembed_query("a"), batcher.aembed_query("b"), return_exceptions=True
+        )
+
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+
+    async def test_cancelled_caller_does_not_break_the_batch(self):
+        batcher = QueryBatcher(self.provider, max_batch=16, max_wait_ms=10)
+        cancelled = asyncio.create_task(batcher.aembed_query("gone"))
+        kept = asyncio.create_task(batcher.aembed_query("kept"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        self.assertEqual(await kept, self.provider.embed_query("kept"))
+        self.assertEqual(self.provider.texts, 2)  # "kept" + the reference vector above
+
+    async def test_batching_can_be_disabled(self):
+        batcher = QueryBatcher(self.provider, max_batch=1, max_wait_ms=5)
+
+        await asyncio.gather(*(batcher.aembed_query(f"q{i}") for i in range(3)))
+
+        self.assertEqual(batcher.stats()["batches"], 0)
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from django.test import SimpleTestCase, override_settings
+
+from echo.frames import FrameCoalescer, frame_options
+
+
+class Recorder:
+
+    def __init__(self):
+        self.frames = []
+
+    async def __call__(self, text_data):
+        self.frames.append(json.loads(text_data))
+
+
+class FrameCoalescerTest(SimpleTestCase):
+
+    async def test_flushes_on_size(self):
+        sent = Recorder()
+        frames = FrameCoalescer(sent, max_chars=10, max_delay=10)
+
+        for token in ["abc", "def", "ghij", "k"]:
+            await frames.push(token)
+
+        self.assertEqual(sent.frames, [{"seq": 1, "text": "abcdefghij"}])
+        await frames.close()
+        self.assertEqual(sent.frames[1], {"seq": 2, "text": "k"})
+
+    async def test_flushes_on_time(self):
+        sent = Recorder()
+        frames = FrameCoalescer(sent, max_chars=1000, max_delay=0.02)
+
+        await frames.push("slow ")
+        await frames.push("token")
+        self.assertEqual(sent.frames, [])
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(sent.frames, [{"seq": 1, "text": "slow token"}])
+
+    async def test_zero_chars_sends_every_token(self):
+        sent = Recorder()
+        frames = FrameCoalescer(sent, max_chars=0, max_delay=0.02)
+
+        for token in ["a", "b", "c"]:
+            await frames.push(token)
+
+        self.assertEqual([frame["text"] for frame in sent.frames], ["a", "b", "c"])
+
+    async def test_end_frame_reports_stats(self):
+        sent = Recorder()
+        frames = FrameCoalescer(sent, max_chars=4, max_delay=10)
+        for token in ["ab", "cd", "ef"]:
+            await frames.push(token)
+
+        await frames.close(usage={"completion_tokens": 3})
+
+        end = sent.frames[-1]
+        self.assertEqual(end["seq"], 3)
+        self.assertEqual(end["type"], "end")
+        self.assertEqual((end["frames"], end["chars"]), (2, 6))
+        self.assertEqual(end["usage"], {"completion_tokens": 3})
+
+    @override_settings(CHAT_FRAME_MAX_CHARS=64, CHAT_FRAME_MAX_DELAY_MS=20)
+    def test_options_from_settings_and_query_string(self):
+        self.assertEqual(frame_options({}), {"max_chars": 64, "max_delay": 0.02})
+        self.assertEqual(
+            frame_options({"query_string": b"frame_chars=0&frame_ms=50"}), {"max_chars": 0, "max_delay": 0.05}
+        )
+        self.assertEqual(
+            frame_options({"query_string": b"frame_chars=999999&frame_ms=abc"})["max_chars"], 4096
+        )
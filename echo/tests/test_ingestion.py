@@ -0,0 +1,293 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from echo.loaders import DocumentLoader
+from echo.parse_pool import iter_pdf_chunks, parse_page_range, shutdown_parse_pool
+from echo.parsers import DocumentParser
+from echo.pipeline import EmbeddingBatchError, EmbeddingPipeline
+from echo.services import DocumentIngestionService
+from echo.tests.fixtures import write_text_pdf
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class RecordingVectorService:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stored = {}
+
+    def add_embedded(self, documents, vectors, ids=None):
+        with self.lock:
+            for id_, doc in zip(ids, documents):
+                self.stored[id_] = doc.page_content
+        return ids
+
+
+class ScriptedEmbeddings(DeterministicFakeEmbedding):
+    """
+    Fake provider with configurable latency and failures per call.
+    """
+
+    latency: float = 0.0
+    failures: dict = {}
+    calls: int = 0
+    active: int = 0
+    max_active: int = 0
+
+    def embed_documents(self, texts):
+        with _counter_lock:
+            self.calls += 1
+            call = self.calls
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            error = self.failures.pop(call, None)
+            if error:
+                raise error
+            return super().embed_documents(texts)
+        finally:
+            with _counter_lock:
+                self.active -= 1
+
+
+_counter_lock = threading.Lock()
+
+
+def make_chunks(n):
+    return [LCDocument(page_content=f"chunk number {i}", metadata={}) for i in range(n)]
+
+
+class EmbeddingPipelineTest(SimpleTestCase):
+
+    def setUp(self):
+        self.store = RecordingVectorService()
+
+    def pipeline(self, embeddings, **kwargs):
+        kwargs.setdefault("batch_size", 10)
+        kwargs.setdefault("max_in_flight", 3)
+        kwargs.setdefault("retry_base_delay", 0)
+        return EmbeddingPipeline(embeddings, self.store, **kwargs)
+
+    def test_all_chunks_stored_with_stable_ids(self):
+        embeddings = ScriptedEmbeddings(size=4)
+
+        metrics = self.pipeline(embeddings).run(make_chunks(25), document_id="doc")
+
+        self.assertEqual(embeddings.calls, 3)
+        self.assertEqual(sorted(self.store.stored), sorted(f"doc:{i}" for i in range(25)))
+        self.assertEqual(self.store.stored["doc:24"], "chunk number 24")
+        self.assertEqual((metrics.chunks, metrics.batches), (25, 3))
+        self.assertGreater(metrics.tokens, 0)
+        self.assertGreater(metrics.chunks_per_second, 0)
+
+    def test_batches_run_concurrently_within_bound(self):
+        embeddings = ScriptedEmbeddings(size=4, latency=0.05)
+
+        start = time.perf_counter()
+        self.pipeline(embeddings, batch_size=5).run(make_chunks(50), document_id="doc")
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(embeddings.max_active, 3)
+        # 10 batches serially would take 0.5s
+        self.assertLess(elapsed, 0.4)
+
+    def test_rate_limited_batch_is_retried(self):
+        embeddings = ScriptedEmbeddings(size=4, failures={2: RateLimitError("429")})
+
+        metrics = self.pipeline(embeddings, max_in_flight=1).run(make_chunks(30), document_id="doc")
+
+        self.assertEqual(len(self.store.stored), 30)
+        self.assertEqual(metrics.retries, 1)
+
+    def test_failed_run_resumes_from_completed_batches(self):
+        embeddings = ScriptedEmbeddings(size=4, failures={3: ValueError("boom")})
+        pipeline = self.pipeline(embeddings, max_in_flight=1)
+
+        with self.assertRaises(EmbeddingBatchError) as ctx:
+            pipeline.run(make_chunks(40), document_id="doc")
+        self.assertEqual(ctx.exception.completed_batches, [0, 1])
+
+        metrics = pipeline.run(
+            make_chunks(40), document_id="doc",
+            completed_batches=ctx.exception.completed_batches,
+        )
+
+        self.assertEqual(metrics.skipped_batches, 2)
+        self.assertEqual(metrics.batches, 2)
+        self.assertEqual(len(self.store.stored), 40)
+
+
+class DiscardingVectorService:
+    """
+    Counts stored chunks without keeping them, so tracemalloc only sees
+    what the ingestion path itself holds on to.
+    """
+
+    def __init__(self):
+        self.stored = 0
+
+    def add_embedded(self, documents, vectors, ids=None):
+        self.stored += len(documents)
+        return ids
+
+
+class StreamingIngestionTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="ragtalk_pdf_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def pdf(self, pages):
+        return write_text_pdf(os.path.join(self.tmp_dir, f"{pages}.pdf"), pages, lines_per_page=20)
+
+    def streaming_peak(self, path):
+        store = DiscardingVectorService()
+        pipeline = EmbeddingPipeline(
+            DeterministicFakeEmbedding(size=8), store, batch_size=16, max_in_flight=2
+        )
+        document = SimpleNamespace(id="doc")
+
+        tracemalloc.start()
+        try:
+            chunks = DocumentIngestionService._tag_chunks(
+                DocumentParser.iter_chunks(DocumentLoader.lazy_load_pdf(path)), document
+            )
+            pipeline.run(chunks, document_id="doc")
+            return tracemalloc.get_traced_memory()[1], store.stored
+        finally:
+            tracemalloc.stop()
+
+    def eager_peak(self, path):
+        tracemalloc.start()
+        try:
+            chunks = DocumentParser.chunk_documents(DocumentLoader.load_pdf(path))
+            return tracemalloc.get_traced_memory()[1], len(chunks)
+        finally:
+            tracemalloc.stop()
+
+    def test_lazy_path_produces_same_chunks(self):
+        path = self.pdf(12)
+
+        eager = DocumentParser.chunk_documents(DocumentLoader.load_pdf(path))
+        lazy = list(DocumentParser.iter_chunks(DocumentLoader.lazy_load_pdf(path)))
+
+        self.assertEqual([c.page_content for c in eager], [c.page_content for c in lazy])
+        self.assertEqual([c.metadata["page"] for c in eager], [c.metadata["page"] for c in lazy])
+
+    def test_peak_memory_stays_flat_as_pdf_grows(self):
+        small, large = self.pdf(30), self.pdf(240)
+        self.streaming_peak(self.pdf(5))  # warm imports and caches
+
+        small_peak, small_chunks = self.streaming_peak(small)
+        large_peak, large_chunks = self.streaming_peak(large)
+        eager_large_peak, eager_chunks = self.eager_peak(large)
+
+        self.assertEqual(large_chunks, eager_chunks)
+        self.assertGreater(large_chunks, 7 * small_chunks)
+        # 8x the pages: the eager path grows with the text, the streaming
+        # path stays roughly where it started.
+        self.assertLess(large_peak, eager_large_peak / 3)
+        self.assertLess(large_peak, small_peak * 2)
+
+    def test_first_batch_lands_before_last_page_is_read(self):
+        path = self.pdf(40)
+        pages_read = []
+        first_store_at = []
+
+        def counting_pages(file_path):
+            for page in DocumentLoader.lazy_load_pdf(file_path):
+                pages_read.append(page.metadata["page"])
+                yield page
+
+        class SpyVectorService(DiscardingVectorService):
+            def add_embedded(self, documents, vectors, ids=None):
+                if not first_store_at:
+                    first_store_at.append(len(pages_read))
+                return super().add_embedded(documents, vectors, ids)
+
+        pipeline = EmbeddingPipeline(
+            DeterministicFakeEmbedding(size=8), SpyVectorService(), batch_size=8, max_in_flight=1
+        )
+        pipeline.run(DocumentParser.iter_chunks(counting_pages(path)), document_id="doc")
+
+        self.assertEqual(len(pages_read), 40)
+        self.assertLess(first_store_at[0], 10)
+
+
+class FlakyPool:
+    """
+    Runs page ranges inline, then breaks like a pool whose worker died.
+    """
+
+    def __init__(self, good_tasks):
+        self.good_tasks = good_tasks
+
+    def submit(self, fn, *args):
+        future = Future()
+        if self.good_tasks > 0:
+            self.good_tasks -= 1
+            future.set_result(fn(*args))
+        else:
+            future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+
+@override_settings(INGESTION_PARSE_PROCESSES=2, INGESTION_PARSE_PAGES_PER_TASK=5)
+class ParsePoolTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="ragtalk_pdf_")
+        self.path = write_text_pdf(os.path.join(self.tmp_dir, "doc.pdf"), 12, lines_per_page=20)
+
+    def tearDown(self):
+        shutdown_parse_pool()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def in_thread(self):
+        with self.settings(INGESTION_PARSE_PROCESSES=0):
+            return list(iter_pdf_chunks(self.path))
+
+    def test_page_range_covers_only_its_pages(self):
+        records = parse_page_range(self.path, 5, 10)
+
+        self.assertEqual({record.page for record in records}, set(range(5, 10)))
+
+    def test_pool_output_matches_in_thread(self):
+        expected = self.in_thread()
+
+        chunks = list(iter_pdf_chunks(self.path))
+
+        self.assertEqual(chunks, expected)
+
+    def test_falls_back_when_pool_cannot_start(self):
+        expected = self.in_thread()
+
+        with patch("echo.parse_pool.get_parse_pool", side_effect=OSError("no semaphores")):
+            chunks = list(iter_pdf_chunks(self.path))
+
+        self.assertEqual(chunks, expected)
+
+    def test_broken_pool_resumes_in_thread_without_duplicates(self):
+        expected = self.in_thread()
+
+        with patch("echo.parse_pool.get_parse_pool", return_value=FlakyPool(good_tasks=1)):
+            chunks = list(iter_pdf_chunks(self.path))
+
+        self.assertEqual(chunks, expected)
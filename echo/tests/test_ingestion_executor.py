@@ -0,0 +1,96 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from echo import tasks
+from echo.models import Document
+from echo.tasks import ingest_document_background
+
+INGEST_SECONDS = 0.5
+CONCURRENT_UPLOADS = 4
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class SlowIngestionService:
+    """
+    Stand-in for a large PDF: holds its thread without touching the loop.
+    """
+    threads = set()
+
+    def __init__(self, embeddings):
+        pass
+
+    def ingest(self, document, **kwargs):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(INGEST_SECONDS)
+
+
+@override_settings(
+    INGESTION_EXECUTOR_WORKERS=CONCURRENT_UPLOADS,
+    MEDIA_ROOT=TEST_MEDIA_ROOT,
+)
+class IngestionExecutorTest(TransactionTestCase):
+    """
+    Benchmark: concurrent ingestions run side by side on the ingestion
+    pool instead of queueing behind Django's shared sync thread.
+    """
+
+    def setUp(self):
+        self._reset_executor()
+        SlowIngestionService.threads = set()
+        self.document_ids = [
+            Document.objects.create(
+                title=f"doc-{n}.pdf",
+                file=SimpleUploadedFile(f"doc-{n}.pdf", b"%PDF"),
+                file_hash=f"{n:064d}",
+            ).id
+            for n in range(CONCURRENT_UPLOADS)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+        self._reset_executor()
+
+    def _reset_executor(self):
+        if tasks._ingestion_executor is not None:
+            tasks._ingestion_executor.shutdown(wait=True)
+        tasks._ingestion_executor = None
+
+    async def _poll_index(self, stop, latencies):
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = await self.async_client.get(reverse("echo:index"))
+            latencies.append(time.perf_counter() - start)
+            self.assertEqual(response.status_code, 200)
+            await asyncio.sleep(0.02)
+
+    @patch("echo.tasks.DocumentIngestionService", SlowIngestionService)
+    async def test_concurrent_ingestions_run_in_parallel(self):
+        stop = asyncio.Event()
+        latencies = []
+        poller = asyncio.create_task(self._poll_index(stop, latencies))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            ingest_document_background(document_id, embeddings=None)
+            for document_id in self.document_ids
+        ))
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        await poller
+
+        # Serialised on one thread this would take N * INGEST_SECONDS
+        self.assertLess(elapsed, INGEST_SECONDS * 2)
+        self.assertEqual(len(SlowIngestionService.threads), CONCURRENT_UPLOADS)
+        self.assertTrue(all(name.startswith("ingestion") for name in SlowIngestionService.threads))
+        # The index page keeps answering while every ingestion thread is busy
+        self.assertGreater(len(latencies), 3)
+        self.assertLess(max(latencies), INGEST_SECONDS)
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from echo.jobs import (
+    IngestionWorkerPool,
+    enqueue_ingestion,
+    fail_job,
+    lease_next_job,
+    recover_pending_documents,
+)
+from echo.loaders import DocumentLoader
+from echo.models import Document, IngestionJob, IngestionStage, JobStatus, ProcessingStatus
+from echo.parsers import DocumentParser
+from echo.tests.fixtures import write_text_pdf
+from echo.vectorstore import vector_store_registry
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    texts: int = 0
+
+    def embed_documents(self, texts):
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+
+@override_settings(
+    INGESTION_EMBED_BATCH_SIZE=8,
+    INGESTION_MAX_ATTEMPTS=3,
+    INGESTION_RETRY_BASE_DELAY=10,
+)
+class IngestionJobQueueTest(TransactionTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="ragtalk_jobs_")
+        self.settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp_dir, "media"),
+            CHROMA_DB_DIR=os.path.join(self.tmp_dir, "chroma"),
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        vector_store_registry.shutdown()
+        self.settings_override.disable()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make_document(self, pages=3, name="doc.pdf"):
+        path = write_text_pdf(os.path.join(self.tmp_dir, name), pages, lines_per_page=20)
+        with open(path, "rb") as fh:
+            content = fh.read()
+        return Document.objects.create(
+            title=name,
+            file=SimpleUploadedFile(name, content, content_type="application/pdf"),
+            file_hash=Document.calculate_file_hash(SimpleUploadedFile(name, content)),
+        )
+
+    def test_lease_hides_job_until_visibility_timeout(self):
+        job = enqueue_ingestion(self.make_document())
+
+        leased = lease_next_job("worker-a", lease_seconds=60)
+        self.assertEqual(leased.id, job.id)
+        self.assertEqual(leased.status, JobStatus.RUNNING)
+        self.assertIsNone(lease_next_job("worker-b"))
+
+        # Worker A "crashes": its lease runs out
+        IngestionJob.objects.filter(id=job.id).update(leased_until=timezone.now() - timedelta(seconds=1))
+
+        released = lease_next_job("worker-b")
+        self.assertEqual(released.worker_id, "worker-b")
+        self.assertEqual(released.attempts, 2)
+
+    def test_failures_back_off_then_give_up(self):
+        job = enqueue_ingestion(self.make_document())
+
+        leased = lease_next_job("worker-a")
+        self.assertFalse(fail_job(leased, ValueError("boom")))
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertGreater(job.available_at, timezone.now() + timedelta(seconds=5))
+        self.assertIsNone(lease_next_job("worker-a"))
+
+        IngestionJob.objects.filter(id=job.id).update(attempts=3)
+        job.refresh_from_db()
+        self.assertTrue(fail_job(job, ValueError("boom")))
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.FAILED)
+
+    def test_stale_pending_documents_are_recovered_once(self):
+        self.make_document()
+
+        self.assertEqual(recover_pending_documents(), 1)
+        self.assertEqual(recover_pending_documents(), 0)
+        self.assertEqual(IngestionJob.objects.count(), 1)
+
+    async def test_worker_runs_job_to_completion(self):
+        from asgiref.sync import sync_to_async
+
+        document = await sync_to_async(self.make_document)()
+        job = await sync_to_async(enqueue_ingestion)(document)
+        pool = IngestionWorkerPool(DeterministicFakeEmbedding(size=8), workers=1)
+
+        self.assertTrue(await pool.run_once())
+        self.assertFalse(await pool.run_once())
+
+        await sync_to_async(job.refresh_from_db)()
+        await sync_to_async(document.refresh_from_db)()
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(job.stage, IngestionStage.DONE)
+        self.assertTrue(job.checkpoint["completed_batches"])
+        self.assertEqual(document.processing_status, ProcessingStatus.INDEXED)
+
+    async def test_resumed_job_skips_completed_batches(self):
+        from asgiref.sync import sync_to_async
+
+        document = await sync_to_async(self.make_document)(pages=12)
+        job = await sync_to_async(enqueue_ingestion)(document)
+        # A previous attempt stored the first two batches before crashing
+        await sync_to_async(IngestionJob.objects.filter(id=job.id).update)(
+            stage=IngestionStage.EMBED, checkpoint={"completed_batches": [0, 1]}
+        )
+        embeddings = CountingEmbeddings(size=8)
+
+        await IngestionWorkerPool(embeddings, workers=1).run_once()
+
+        total_chunks = len(list(DocumentParser.iter_chunks(DocumentLoader.lazy_load_pdf(document.file.path))))
+        self.assertGreater(total_chunks, 16)
+        self.assertEqual(embeddings.texts, total_chunks - 16)
+        await sync_to_async(job.refresh_from_db)()
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertIn(0, job.checkpoint["completed_batches"])
+
+    async def test_failed_attempt_is_requeued_and_document_stays_pending(self):
+        from asgiref.sync import sync_to_async
+
+        document = await sync_to_async(self.make_document)()
+        job = await sync_to_async(enqueue_ingestion)(document)
+        pool = IngestionWorkerPool(DeterministicFakeEmbedding(size=8), workers=1)
+
+        with patch("echo.services.iter_pdf_chunks", side_effect=OSError("disk gone")):
+            await pool.run_once()
+
+        await sync_to_async(job.refresh_from_db)()
+        await sync_to_async(document.refresh_from_db)()
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertEqual(job.last_error, "disk gone")
+        self.assertEqual(document.processing_status, ProcessingStatus.PENDING)
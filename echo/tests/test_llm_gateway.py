@@ -0,0 +1,332 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from echo import llm_gateway
+from echo.embeddings import RateLimitedEmbeddings
+from echo.llm_gateway import (
+    BACKGROUND, INTERACTIVE, ProviderUnavailable, RateLimiter, gateway_stats, rate_limit_stats,
+    rate_limiter, request_priority, reset_gateway, safe_generate, safe_stream,
+)
+
+
+class StubChat:
+    """
+    Chat model stub with injected latency and errors. latency may be a
+    list (one entry per call, the last one repeats); fail makes every
+    call raise.
+    """
+
+    def __init__(self, answer, latency=0.0, fail=False):
+        self.answer = answer
+        self.latency = latency if isinstance(latency, list) else [latency]
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def _wait(self):
+        delay = self.latency[min(self.calls, len(self.latency) - 1)]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise ConnectionError(f"{self.answer} unavailable")
+
+    async def ainvoke(self, messages):
+        await self._wait()
+        return AIMessage(content=self.answer)
+
+    async def astream(self, messages):
+        await self._wait()
+        for word in self.answer.split(" "):
+            yield AIMessageChunk(content=f"{word} ")
+
+
+@override_settings(
+    LLM_BREAKER_FAILURES=3, LLM_BREAKER_COOLDOWN_SECONDS=60,
+    LLM_HEDGE=True, LLM_HEDGE_MIN_SAMPLES=5, LLM_HEDGE_PERCENTILE=0.95,
+)
+class LLMGatewayTest(SimpleTestCase):
+    messages = [HumanMessage(content="Who wrote GPT4All?")]
+
+    def setUp(self):
+        reset_gateway()
+        self.addCleanup(reset_gateway)
+
+    def use(self, primary, fallback):
+        for name, llm in (("primary_llm", primary), ("fallback_llm", fallback)):
+            p = patch(f"echo.llm_gateway.{name}", llm)
+            p.start()
+            self.addCleanup(p.stop)
+
+    async def warm_up(self, calls=5):
+        for _ in range(calls):
+            await safe_generate(self.messages)
+
+    async def test_primary_failure_falls_back_once_without_sleeping(self):
+        primary, fallback = StubChat("primary", fail=True), StubChat("fallback")
+        self.use(primary, fallback)
+
+        with self.assertLogs("echo.llm_gateway", "WARNING"):
+            response = await safe_generate(self.messages)
+
+        self.assertEqual(response.content, "fallback")
+        self.assertEqual((primary.calls, fallback.calls), (1, 1))
+
+    async def test_repeated_failures_open_the_circuit(self):
+        primary, fallback = StubChat("primary", fail=True), StubChat("fallback")
+        self.use(primary, fallback)
+
+        with self.assertLogs("echo.llm_gateway", "WARNING") as logs:
+            for _ in range(5):
+                await safe_generate(self.messages)
+
+        self.assertEqual(primary.calls, 3)
+        self.assertEqual(fallback.calls, 5)
+        self.assertTrue(any("circuit opened" in line for line in logs.output))
+        self.assertEqual(gateway_stats()["OpenAI"]["circuit"], "open")
+        self.assertEqual(gateway_stats()["OpenAI"]["error_rate"], 1.0)
+
+    async def test_circuit_closes_after_a_successful_trial(self):
+        primary, fallback = StubChat("primary", fail=True), StubChat("fallback")
+        self.use(primary, fallback)
+        with self.assertLogs("echo.llm_gateway", "WARNING"):
+            await self.warm_up(3)
+
+        breaker = llm_gateway.providers()[0].breaker
+        breaker.opened_at -= 60
+        primary.fail = False
+        response = await safe_generate(self.messages)
+
+        self.assertEqual(response.content, "primary")
+        self.assertEqual(breaker.state, "closed")
+
+    async def test_half_open_circuit_lets_one_probe_through(self):
+        primary, fallback = StubChat("primary", fail=True), StubChat("fallback")
+        self.use(primary, fallback)
+        with self.assertLogs("echo.llm_gateway", "WARNING"):
+            await self.warm_up(3)
+
+        breaker = llm_gateway.providers()[0].breaker
+        breaker.opened_at -= 60
+        primary.latency = [0.05]
+        with self.assertLogs("echo.llm_gateway", "WARNING"):
+            responses = await asyncio.gather(*(safe_generate(self.messages) for _ in range(10)))
+
+        self.assertEqual(primary.calls, 4)
+        self.assertEqual(fallback.calls, 13)
+        self.assertEqual({response.content for response in responses}, {"fallback"})
+        self.assertEqual(breaker.state, "open")
+
+    async def test_all_circuits_open_fails_fast(self):
+        self.use(StubChat("primary", fail=True), StubChat("fallback", fail=True))
+        with self.assertLogs("echo.llm_gateway", "WARNING"):
+            for _ in range(3):
+                with self.assertRaises(ConnectionError):
+                    await safe_generate(self.messages)
+
+        with self.assertRaises(ProviderUnavailable):
+            await safe_generate(self.messages)
+
+    async def test_slow_primary_is_hedged_and_the_loser_cancelled(self):
+        primary = StubChat("primary", latency=[0.01] * 5 + [1.0])
+        fallback = StubChat("fallback", latency=0.01)
+        self.use(primary, fallback)
+        await self.warm_up()
+
+        with self.assertLogs("echo.llm_gateway", "INFO") as logs:
+            response = await safe_generate(self.messages)
+
+        self.assertEqual(response.content, "fallback")
+        self.assertEqual(primary.cancelled, 1)
+        self.assertIn("hedging to Anthropic", logs.output[0])
+
+    async def test_hedged_loser_still_counts_towards_the_p95(self):
+        primary = StubChat("primary", latency=[0.01] * 5 + [1.0])
+        fallback = StubChat("fallback", latency=0.05)
+        self.use(primary, fallback)
+        await self.warm_up()
+        latency = llm_gateway.providers()[0].latency
+
+        with self.assertLogs("echo.llm_gateway", "INFO"):
+            await safe_generate(self.messages)
+
+        self.assertEqual(len(latency), 6)
+        self.assertGreater(latency[-1], 0.05)
+        self.assertGreater(llm_gateway.percentile(latency, 0.95), 0.05)
+
+    async def test_no_hedge_until_enough_samples(self):
+        primary, fallback = StubChat("primary", latency=0.05), StubChat("fallback")
+        self.use(primary, fallback)
+
+        response = await safe_generate(self.messages)
+
+        self.assertEqual(response.content, "primary")
+        self.assertEqual(fallback.calls, 0)
+
+    @override_settings(LLM_HEDGE=False)
+    async def test_hedging_can_be_disabled(self):
+        primary = StubChat("primary", latency=[0.01] * 5 + [0.2])
+        fallback = StubChat("fallback")
+        self.use(primary, fallback)
+        await self.warm_up()
+
+        response = await safe_generate(self.messages)
+
+        self.assertEqual(response.content, "primary")
+        self.assertEqual(fallback.calls, 0)
+
+    async def test_stream_hedges_on_time_to_first_token(self):
+        primary = StubChat("slow primary answer", latency=[0.01] * 5 + [1.0])
+        fallback = StubChat("fallback answer", latency=0.01)
+        self.use(primary, fallback)
+        for _ in range(5):
+            [text async for text in safe_stream(self.messages)]
+
+        with self.assertLogs("echo.llm_gateway", "INFO"):
+            tokens = [text async for text in safe_stream(self.messages)]
+
+        self.assertEqual("".join(tokens), "fallback answer ")
+        self.assertEqual(primary.cancelled, 1)
+        self.assertEqual(len(llm_gateway.providers()[0].ttft), 6)
+
+    async def test_stream_skips_an_open_primary_circuit(self):
+        primary, fallback = StubChat("primary", fail=True), StubChat("fallback answer")
+        self.use(primary, fallback)
+        with self.assertLogs("echo.llm_gateway", "WARNING"):
+            for _ in range(3):
+                [text async for text in safe_stream(self.messages)]
+
+        tokens = [text async for text in safe_stream(self.messages)]
+
+        self.assertEqual("".join(tokens), "fallback answer ")
+        self.assertEqual(primary.calls, 3)
+
+
+class FakeEmbeddings:
+    model = "fake-model"
+
+    def embed_documents(self, texts):
+        return [[0.0] for _ in texts]
+
+
+@override_settings(LLM_RATE_POLL_SECONDS=0.005, LLM_RATE_LIMITS={})
+class RateLimiterTest(SimpleTestCase):
+
+    def setUp(self):
+        reset_gateway()
+        self.addCleanup(reset_gateway)
+
+    def drained(self, **limits):
+        limiter = RateLimiter("test", **limits)
+        limiter.available = dict.fromkeys(limiter.available, 0)
+        return limiter
+
+    async def test_interactive_calls_are_served_before_queued_background_work(self):
+        limiter = self.drained(requests_per_minute=1200)  # one request per 50ms
+        order = []
+
+        async def call(name, priority):
+            await limiter.aacquire(priority=priority)
+            order.append(name)
+
+        background = [asyncio.create_task(call(f"ingest-{i}", BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        chat = asyncio.create_task(call("chat", INTERACTIVE))
+        await asyncio.gather(*background, chat)
+
+        self.assertEqual(order[0], "chat")
+        self.assertEqual(order[1:], ["ingest-0", "ingest-1", "ingest-2"])
+
+    async def test_sync_and_async_callers_share_the_bucket(self):
+        limiter = self.drained(requests_per_minute=1200)
+        order = []
+
+        def ingest():
+            limiter.acquire(priority=BACKGROUND)
+            order.append("ingest")
+
+        thread = asyncio.create_task(asyncio.to_thread(ingest))
+        await asyncio.sleep(0.01)
+        await limiter.aacquire(priority=INTERACTIVE)
+        order.append("chat")
+        await thread
+
+        self.assertEqual(order, ["chat", "ingest"])
+
+    async def test_token_cost_sets_the_wait(self):
+        limiter = self.drained(tokens_per_minute=60_000)  # 1000 tokens/s
+
+        started = time.perf_counter()
+        await limiter.aacquire(tokens=100)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.09)
+
+    async def test_oversized_call_is_capped_at_the_bucket_size(self):
+        limiter = RateLimiter("test", tokens_per_minute=600)
+
+        waited = await asyncio.wait_for(limiter.aacquire(tokens=10_000), timeout=1)
+
+        self.assertLess(waited, 0.01)
+        self.assertAlmostEqual(limiter.available["tokens"], 0, delta=1)
+
+    async def test_completion_tokens_are_charged_after_the_call(self):
+        limiter = RateLimiter("test", tokens_per_minute=600)
+        limiter.charge(900)
+
+        self.assertLess(limiter.available["tokens"], 0)
+
+    async def test_queue_depth_and_wait_metrics(self):
+        limiter = self.drained(requests_per_minute=600)  # one request per 100ms
+        waiters = [asyncio.create_task(limiter.aacquire(priority=BACKGROUND)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(limiter.stats()["queue_depth"], {"interactive": 0, "background": 2})
+        await asyncio.gather(*waiters)
+
+        stats = limiter.stats()
+        self.assertEqual(stats["queue_depth"]["background"], 0)
+        self.assertEqual(stats["max_queue_depth"], 2)
+        self.assertEqual(stats["granted"], {"interactive": 0, "background": 2})
+        self.assertGreaterEqual(stats["wait_max_ms"]["background"], 150)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        limiter = self.drained(requests_per_minute=60)
+        waiter = asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(limiter.stats()["queue_depth"]["interactive"], 0)
+
+    @override_settings(
+        LLM_RATE_LIMITS={"openai": {"requests_per_minute": 500, "tokens_per_minute": 200_000}},
+        LLM_RATE_LIMIT_PROCESSES=3,
+    )
+    def test_quota_is_split_between_processes(self):
+        self.assertEqual(rate_limiter("openai").limits, {"requests": 167, "tokens": 66_667})
+        self.assertTrue(rate_limiter("anthropic").unlimited)
+
+    @override_settings(LLM_RATE_LIMITS={"openai": {"requests_per_minute": 100, "tokens_per_minute": 0}})
+    def test_embeddings_use_the_shared_quota_at_the_callers_priority(self):
+        embeddings = RateLimitedEmbeddings(FakeEmbeddings(), "openai")
+
+        with request_priority(BACKGROUND):
+            embeddings.embed_documents(["a", "b"])
+        embeddings.embed_documents(["c"])
+
+        self.assertEqual(rate_limiter("openai").stats()["granted"], {"interactive": 1, "background": 1})
+        self.assertIn("openai", rate_limit_stats())
+
+    @override_settings(LLM_RATE_LIMITS={"openai": {"requests_per_minute": 100, "tokens_per_minute": 0}})
+    async def test_chat_calls_go_through_the_provider_limiter(self):
+        with patch("echo.llm_gateway.primary_llm", StubChat("primary")):
+            await safe_generate([HumanMessage(content="hi")])
+
+        self.assertEqual(rate_limiter("openai").stats()["granted"]["interactive"], 1)
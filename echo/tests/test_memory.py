@@ -0,0 +1,104 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from echo.memory import prompt_tokens, recent_window
+from echo.rag_engine import compile_workflow, schedule_compaction
+from echo.tests.fixtures import streaming, temporary_checkpoints
+
+
+async def fake_search(state, query):
+    return [{"content": "GPT4All was trained on 437,605 pairs.", "score": 0.1, "metadata": {}}]
+
+
+class ScriptedLLM:
+    """
+    Records every prompt; answers long enough to fill the history quickly.
+    """
+
+    def __init__(self, fail_summary=False):
+        self.prompts = []
+        self.fail_summary = fail_summary
+
+    async def __call__(self, messages):
+        self.prompts.append(messages)
+        system = messages[0].content
+        if "running summary" in system:
+            if self.fail_summary:
+                raise RuntimeError("summary model down")
+            return AIMessage(content="User asked about training data sizes.")
+        if "search optimizer" in system:
+            return AIMessage(content=messages[-1].content)
+        return AIMessage(content="The answer is 437,605 pairs. " * 20)
+
+    def generate_prompts(self):
+        return [prompt for prompt in self.prompts if "CONTEXT" in prompt[0].content]
+
+
+@override_settings(RAG_EXPANSION_BUDGET_SECONDS=0)
+class ConversationMemoryTest(SimpleTestCase):
+
+    def setUp(self):
+        temporary_checkpoints(self, prefix="ragtalk_memory_")
+
+        p = patch("echo.rag_engine._search", fake_search)
+        p.start()
+        self.addCleanup(p.stop)
+        self.graph = compile_workflow(speculative=False)
+
+    async def chat(self, llm, turns, thread="memory"):
+        config = {"configurable": {"thread_id": thread}}
+        with patch("echo.rag_engine.safe_generate", llm), patch("echo.rag_engine.safe_stream", streaming(llm)):
+            for turn in range(turns):
+                await self.graph.ainvoke({"question": f"question {turn} from bob@example.com"}, config)
+                # As the chat consumer does once the answer is sent
+                await schedule_compaction(self.graph, config)
+        return (await self.graph.aget_state(config)).values
+
+    def test_window_keeps_newest_turns_within_budget(self):
+        messages = []
+        for turn in range(10):
+            messages += [HumanMessage(content=f"q{turn} " * 20), AIMessage(content=f"a{turn} " * 20)]
+        messages.append(HumanMessage(content="current"))
+
+        window = recent_window(messages, budget=200)
+
+        self.assertEqual(window[-1].content, "current")
+        self.assertIsInstance(window[0], HumanMessage)
+        self.assertLessEqual(prompt_tokens(window), 200)
+        self.assertGreater(len(window), 1)
+
+    def test_window_always_includes_current_question(self):
+        window = recent_window([HumanMessage(content="long " * 500)], budget=10)
+
+        self.assertEqual(len(window), 1)
+
+    async def test_question_is_sent_and_stored_once(self):
+        llm = ScriptedLLM()
+        state = await self.chat(llm, turns=1)
+
+        self.assertEqual([type(m) for m in state["messages"]], [HumanMessage, AIMessage])
+        prompt = llm.generate_prompts()[0]
+        self.assertEqual([type(m) for m in prompt], [SystemMessage, HumanMessage])
+        self.assertEqual(prompt[-1].content, "question 0 from [REDACTED_EMAIL]")
+        self.assertEqual(state["prompt_tokens"]["generate"], prompt_tokens(prompt))
+
+    @override_settings(RAG_HISTORY_TOKEN_BUDGET=300, RAG_MEMORY_TOKEN_LIMIT=600)
+    async def test_long_threads_are_compacted_into_a_summary(self):
+        llm = ScriptedLLM()
+        state = await self.chat(llm, turns=12)
+
+        self.assertEqual(state["summary"], "User asked about training data sizes.")
+        self.assertLessEqual(prompt_tokens(state["messages"]), 600)
+        self.assertLess(len(state["messages"]), 24)
+        last_prompt = llm.generate_prompts()[-1]
+        self.assertIn(state["summary"], last_prompt[0].content)
+        self.assertLessEqual(prompt_tokens(last_prompt[1:]), 300)
+
+    @override_settings(RAG_HISTORY_TOKEN_BUDGET=300, RAG_MEMORY_TOKEN_LIMIT=600)
+    async def test_ceiling_holds_when_summary_fails(self):
+        state = await self.chat(ScriptedLLM(fail_summary=True), turns=12)
+
+        self.assertEqual(state["summary"], "")
+        self.assertLessEqual(prompt_tokens(state["messages"]), 600)
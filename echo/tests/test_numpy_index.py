@@ -0,0 +1,177 @@
+import shutil
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from echo.numpy_index import NumpyVectorIndex
+from echo.vectorstore import NumpyVectorStoreService, VectorStoreRegistry, VectorStoreService
+
+
+class NumpyVectorIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp(prefix="ragtalk_numpy_")
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+
+    def fill(self, index, rows, documents=4, dim=8):
+        vectors = self.rng.normal(size=(rows, dim)).astype(np.float32)
+        index.upsert(
+            [f"chunk-{row}" for row in range(rows)],
+            vectors,
+            [f"text {row}" for row in range(rows)],
+            # Contiguous per document, like ingestion batches
+            [{"document_id": f"doc-{row * documents // rows}", "page": row % 3} for row in range(rows)],
+        )
+        return vectors
+
+    def brute_force(self, vectors, query, rows, k):
+        normalised = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        scores = normalised[rows] @ (query / np.linalg.norm(query))
+        return [f"text {rows[i]}" for i in np.argsort(-scores)[:k]]
+
+    def test_top_k_matches_brute_force(self):
+        index = NumpyVectorIndex(self.index_dir, "c")
+        vectors = self.fill(index, 200)
+        query = self.rng.normal(size=8)
+
+        hits = index.search(query, k=5)
+
+        self.assertEqual([content for content, _, _ in hits], self.brute_force(vectors, query, np.arange(200), 5))
+        distances = [distance for _, _, distance in hits]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_document_filter_uses_only_that_documents_rows(self):
+        index = NumpyVectorIndex(self.index_dir, "c")
+        vectors = self.fill(index, 200)
+        query = self.rng.normal(size=8)
+
+        hits = index.search(query, k=5, metadata_filter={"document_id": "doc-2"})
+
+        self.assertEqual(index._doc_ranges["doc-2"], [[100, 150]])
+        self.assertEqual([content for content, _, _ in hits], self.brute_force(vectors, query, np.arange(100, 150), 5))
+        self.assertTrue(all(metadata["document_id"] == "doc-2" for _, metadata, _ in hits))
+
+    def test_other_metadata_keys_filter_by_mask(self):
+        index = NumpyVectorIndex(self.index_dir, "c")
+        self.fill(index, 60)
+
+        hits = index.search(self.rng.normal(size=8), k=50, metadata_filter={"document_id": "doc-1", "page": 2})
+
+        self.assertTrue(hits)
+        self.assertTrue(all(m["document_id"] == "doc-1" and m["page"] == 2 for _, m, _ in hits))
+        self.assertEqual(index.search(self.rng.normal(size=8), metadata_filter={"document_id": "nope"}), [])
+
+    def test_upsert_by_id_overwrites_in_place(self):
+        index = NumpyVectorIndex(self.index_dir, "c")
+        self.fill(index, 20)
+        replacement = self.rng.normal(size=(1, 8))
+
+        index.upsert(["chunk-3"], replacement, ["rewritten"], [{"document_id": "doc-0"}])
+
+        self.assertEqual(index.count(), 20)
+        content, _, distance = index.search(replacement[0], k=1)[0]
+        self.assertEqual(content, "rewritten")
+        self.assertAlmostEqual(distance, 0.0, places=5)
+
+    def test_repeated_id_in_one_batch_is_stored_once(self):
+        index = NumpyVectorIndex(self.index_dir, "c")
+        vectors = self.rng.normal(size=(2, 8))
+
+        index.upsert(["a", "a"], vectors, ["first", "second"], [{"document_id": "doc-0"}] * 2)
+
+        self.assertEqual(index.count(), 1)
+        content, _, distance = index.search(vectors[1], k=5)[0]
+        self.assertEqual(content, "second")
+        self.assertAlmostEqual(distance, 0.0, places=5)
+        index.close()
+        self.assertEqual(NumpyVectorIndex(self.index_dir, "c").search(vectors[1], k=5)[0][0], "second")
+
+    def test_delete_renumbers_rows_and_survives_reopen(self):
+        index = NumpyVectorIndex(self.index_dir, "c")
+        vectors = self.fill(index, 40)
+        query = self.rng.normal(size=8)
+
+        self.assertEqual(index.delete(["chunk-3", "chunk-20", "missing"]), 2)
+
+        self.assertEqual(index.count(), 38)
+        remaining = np.delete(np.arange(40), [3, 20])
+        self.assertEqual([content for content, _, _ in index.search(query, k=5)], self.brute_force(vectors, query, remaining, 5))
+        self.assertEqual(index._doc_ranges["doc-2"], [[19, 28]])
+        index.close()
+        reopened = NumpyVectorIndex(self.index_dir, "c")
+        self.assertEqual(reopened.count(), 38)
+        self.assertEqual([content for content, _, _ in reopened.search(query, k=5)], self.brute_force(vectors, query, remaining, 5))
+
+    def test_reopen_restores_rows_and_ranges(self):
+        index = NumpyVectorIndex(self.index_dir, "c")
+        vectors = self.fill(index, 40)
+        query = self.rng.normal(size=8)
+        expected = index.search(query, k=3, metadata_filter={"document_id": "doc-3"})
+        index.close()
+
+        reopened = NumpyVectorIndex(self.index_dir, "c")
+
+        self.assertEqual(reopened.count(), 40)
+        self.assertEqual(reopened.search(query, k=3, metadata_filter={"document_id": "doc-3"}), expected)
+        self.assertEqual(reopened.warmup(), 40)
+
+
+class NumpyBackendServiceTest(SimpleTestCase):
+
+    def setUp(self):
+        self.chroma_dir = tempfile.mkdtemp(prefix="ragtalk_chroma_")
+        self.index_dir = tempfile.mkdtemp(prefix="ragtalk_numpy_")
+        self.settings_override = override_settings(
+            CHROMA_DB_DIR=self.chroma_dir, NUMPY_INDEX_DIR=self.index_dir
+        )
+        self.settings_override.enable()
+        self.embeddings = DeterministicFakeEmbedding(size=16)
+        self.registry = VectorStoreRegistry()
+        self.docs = [
+            LCDocument(page_content=f"chunk {i}", metadata={"document_id": f"doc-{i % 2}"})
+            for i in range(10)
+        ]
+
+    def tearDown(self):
+        self.registry.shutdown()
+        self.settings_override.disable()
+        shutil.rmtree(self.chroma_dir, ignore_errors=True)
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+
+    def test_backend_is_selected_from_settings(self):
+        self.assertIs(type(self.registry.get(self.embeddings)), VectorStoreService)
+        with self.settings(VECTORSTORE_BACKEND="numpy"):
+            self.assertIs(type(self.registry.get(self.embeddings)), NumpyVectorStoreService)
+
+    @override_settings(VECTORSTORE_BACKEND="numpy")
+    async def test_same_return_shapes_as_chroma(self):
+        numpy_service = self.registry.get(self.embeddings)
+        with self.settings(VECTORSTORE_BACKEND="chroma"):
+            chroma_service = self.registry.get(self.embeddings)
+
+        for service in (numpy_service, chroma_service):
+            await service.aadd_documents(self.docs)
+
+            scored = service.search("chunk 3", k=3, metadata_filter={"document_id": "doc-1"})
+            self.assertEqual(len(scored), 3)
+            for doc, distance in scored:
+                self.assertIsInstance(doc, LCDocument)
+                self.assertIsInstance(distance, float)
+                self.assertEqual(doc.metadata["document_id"], "doc-1")
+            # Exact text is its own nearest neighbour on both backends
+            self.assertEqual(scored[0][0].page_content, "chunk 3")
+
+            by_vector = service.search_by_vector(self.embeddings.embed_query("chunk 4"), k=2)
+            self.assertEqual(by_vector[0].page_content, "chunk 4")
+
+            async_scored = await service.asearch("chunk 3", k=3, metadata_filter={"document_id": "doc-1"})
+            self.assertEqual(
+                [doc.page_content for doc, _ in async_scored],
+                [doc.page_content for doc, _ in scored],
+            )
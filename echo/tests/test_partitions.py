@@ -0,0 +1,152 @@
+import io
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from echo.partitions import PartitionRouter
+from echo.vectorstore import (
+    DEFAULT_COLLECTION,
+    VectorStoreService,
+    get_vector_service,
+    vector_store_registry,
+)
+
+
+class NoEmbeddings(DeterministicFakeEmbedding):
+    """
+    Fails if anything tries to embed; used where stored vectors must be reused.
+    """
+
+    def embed_documents(self, texts):
+        raise AssertionError("re-embedded during repartition")
+
+
+class PartitionRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.chroma_dir = tempfile.mkdtemp(prefix="ragtalk_chroma_")
+        self.settings_override = override_settings(CHROMA_DB_DIR=self.chroma_dir)
+        self.settings_override.enable()
+        self.embeddings = DeterministicFakeEmbedding(size=16)
+        self.docs = [
+            LCDocument(page_content=f"chunk {i}", metadata={"document_id": f"doc-{i % 3}"})
+            for i in range(30)
+        ] + [LCDocument(page_content="loose chunk", metadata={"source": "notes"})]
+
+    def tearDown(self):
+        vector_store_registry.shutdown()
+        self.settings_override.disable()
+        shutil.rmtree(self.chroma_dir, ignore_errors=True)
+
+    def flat_store(self):
+        # Unpartitioned reference store in its own collection
+        flat = vector_store_registry.get(self.embeddings, "flat_reference")
+        flat.add_documents(self.docs)
+        return flat
+
+    def test_router_is_used_when_partitioning_enabled(self):
+        self.assertIsInstance(get_vector_service(self.embeddings), VectorStoreService)
+        with self.settings(VECTORSTORE_PARTITIONING="document"):
+            self.assertIsInstance(get_vector_service(self.embeddings), PartitionRouter)
+
+    def test_document_partitions_are_written_and_routed(self):
+        router = PartitionRouter(self.embeddings, mode="document")
+        router.add_documents(self.docs)
+
+        self.assertEqual(
+            router.partitions(),
+            [DEFAULT_COLLECTION] + [f"{DEFAULT_COLLECTION}_doc_doc-{n}" for n in range(3)],
+        )
+        self.assertEqual(router.service(f"{DEFAULT_COLLECTION}_doc_doc-1").count(), 10)
+        self.assertEqual(router.base.count(), 1)
+
+        searched = []
+        original = router._search_partition
+        with patch.object(router, "_search_partition", side_effect=lambda name, *a: searched.append(name) or original(name, *a)):
+            hits = router.search("chunk 4", k=3, metadata_filter={"document_id": "doc-1"})
+
+        self.assertEqual(searched, [f"{DEFAULT_COLLECTION}_doc_doc-1"])
+        self.assertEqual(hits[0][0].page_content, "chunk 4")
+        self.assertTrue(all(doc.metadata["document_id"] == "doc-1" for doc, _ in hits))
+
+    def test_global_fan_out_matches_unpartitioned_top_k(self):
+        flat = self.flat_store()
+        router = PartitionRouter(self.embeddings, mode="shard", shards=4)
+        router.add_documents(self.docs)
+
+        expected = [doc.page_content for doc, _ in flat.search("chunk 7", k=5)]
+
+        self.assertEqual([doc.page_content for doc, _ in router.search("chunk 7", k=5)], expected)
+
+    async def test_async_fan_out_matches_sync(self):
+        router = PartitionRouter(self.embeddings, mode="shard", shards=4)
+        await router.aadd_documents(self.docs)
+
+        sync_hits = router.search("chunk 12", k=4)
+        async_hits = await router.asearch("chunk 12", k=4)
+        scoped = await router.asearch("chunk 12", k=4, metadata_filter={"document_id": "doc-0"})
+
+        self.assertEqual([d.page_content for d, _ in async_hits], [d.page_content for d, _ in sync_hits])
+        self.assertTrue(all(doc.metadata["document_id"] == "doc-0" for doc, _ in scoped))
+
+    def test_shard_routing_is_stable(self):
+        router = PartitionRouter(self.embeddings, mode="shard", shards=8)
+
+        names = {router.partition_for("4b1c2d0e-aaaa-bbbb-cccc-000000000000") for _ in range(3)}
+
+        self.assertEqual(len(names), 1)
+        self.assertRegex(names.pop(), rf"^{DEFAULT_COLLECTION}_shard_00[0-7]$")
+
+    def test_repartition_moves_chunks_without_reembedding(self):
+        legacy = vector_store_registry.get(self.embeddings)
+        legacy.add_documents(self.docs)
+        router = PartitionRouter(NoEmbeddings(size=16), mode="document")
+
+        # Before migrating, scoped queries fall back to the legacy collection
+        self.assertTrue(router.search("chunk 5", k=2, metadata_filter={"document_id": "doc-2"}))
+
+        with patch("echo.management.commands.repartition_vectorstore.embeddings", NoEmbeddings(size=16)):
+            call_command("repartition_vectorstore", mode="document", batch_size=7, stdout=io.StringIO())
+
+        self.assertEqual(legacy.count(), 1)
+        self.assertEqual(router.count(), 31)
+        self.assertEqual(router.service(f"{DEFAULT_COLLECTION}_doc_doc-2").count(), 10)
+        hits = router.search("chunk 5", k=2, metadata_filter={"document_id": "doc-2"})
+        self.assertEqual(hits[0][0].page_content, "chunk 5")
+
+    def test_shard_mode_falls_back_for_documents_that_predate_partitioning(self):
+        vector_store_registry.get(self.embeddings).add_documents(self.docs)
+        router = PartitionRouter(self.embeddings, mode="shard", shards=4)
+        router.add_documents([LCDocument(page_content="fresh", metadata={"document_id": "doc-9"})])
+
+        for document_id in ("doc-0", "doc-1", "doc-2"):
+            hits = router.search("chunk 5", k=2, metadata_filter={"document_id": document_id})
+            self.assertTrue(hits)
+            self.assertTrue(all(doc.metadata["document_id"] == document_id for doc, _ in hits))
+
+    def test_reads_never_create_partitions(self):
+        router = PartitionRouter(self.embeddings, mode="document")
+        router.add_documents(self.docs)
+
+        self.assertEqual(router.search("chunk 5", k=2, metadata_filter={"document_id": "unknown"}), [])
+        self.assertEqual(list(router.iter_embedded(metadata_filter={"document_id": "unknown"})), [])
+
+        self.assertNotIn(f"{DEFAULT_COLLECTION}_doc_unknown", router.base.list_collections())
+
+    def test_global_queries_reuse_the_partition_list(self):
+        router = PartitionRouter(self.embeddings, mode="document")
+        router.add_documents(self.docs)
+        router.partitions()
+
+        with patch.object(VectorStoreService, "list_collections", side_effect=AssertionError("listed again")):
+            hits = router.search("chunk 7", k=5)
+            router.add_documents([LCDocument(page_content="chunk new", metadata={"document_id": "doc-new"})])
+            partitions = PartitionRouter(self.embeddings, mode="document").partitions()
+
+        self.assertEqual(len(hits), 5)
+        self.assertIn(router.partition_for("doc-new"), partitions)
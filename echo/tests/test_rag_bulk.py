@@ -6,12 +6,14 @@ from django.test import TransactionTestCase, override_settings
 from django.conf import settings
 from langchain_core.messages import SystemMessage, HumanMessage
 
+from echo.eval import GOLDEN_PAIRS
 from echo.rag_engine import rag_graph
 from echo.llm_gateway import safe_generate
 
 # Define a specific directory for test files
 TEST_MEDIA_ROOT = os.path.join(settings.BASE_DIR, 'media', 'test_media')
 
+
 @override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
 class RAGBulkEvaluationTest(TransactionTestCase):
     """
@@ -29,17 +31,7 @@ class RAGBulkEvaluationTest(TransactionTestCase):
                 "thread_id": "test_thread"
             }
         }
-        # Define Golden Pairs: (Question, Expected Fact to check for)
-       
-        self.golden_pairs = [
-            ("Who are the authors of the GPT4All technical report?", "Yuvanesh Anand, Zach Nussbaum, Brandon Duderstadt, Benjamin Schmidt, Andriy Mulyar"),
-            ("What is the main purpose of GPT4All?", "chatbot trained over a massive curated corpus of assistant interactions"),
-            ("How many prompt-response pairs were collected for training?", "437,605 high-quality prompt-response pairs in final subset"),
-            ("What datasets were used to collect the initial prompts?", "chip2 subset of LAION OIG, Stackoverflow, Bigscience/P3"),
-            ("What were the GPU and API costs to train GPT4All?", "$800 in GPU costs and $500 in OpenAI API spend"),
-            ("Which model was fine-tuned to create GPT4All?", "LLaMA 7B with LoRA on curated dataset"),
-            ("What evaluation method was used to measure GPT4All’s performance?", "human evaluation from Self-Instruct paper comparing ground truth perplexity")
-        ]
+        self.golden_pairs = GOLDEN_PAIRS
 
 
     def tearDown(self):
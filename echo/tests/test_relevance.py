@@ -0,0 +1,142 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.messages import AIMessage
+
+from echo.management.commands.calibrate_relevance import pick_threshold
+from echo.prompt import NO_ANSWER
+from echo.rag_engine import compile_workflow, retrieval_hits
+from echo.tests.fixtures import streaming, temporary_checkpoints
+
+
+class CountingLLM:
+
+    def __init__(self):
+        self.answers = 0
+
+    async def __call__(self, messages):
+        if "CONTEXT" in messages[0].content:
+            self.answers += 1
+            return AIMessage(content="Yuvanesh Anand.")
+        return AIMessage(content=messages[-1].content)
+
+
+@override_settings(RAG_EXPANSION_BUDGET_SECONDS=0, RAG_ANSWER_CACHE=False, RAG_RELEVANCE_MAX_DISTANCE=0.5)
+class NoAnswerGraphTest(SimpleTestCase):
+
+    def setUp(self):
+        temporary_checkpoints(self, prefix="ragtalk_relevance_")
+
+        self.hits = []
+        self.llm = CountingLLM()
+
+        async def fake_search(state, query):
+            return self.hits
+
+        patches = [
+            patch("echo.rag_engine._search", fake_search),
+            patch("echo.rag_engine.safe_generate", self.llm),
+            patch("echo.rag_engine.safe_stream", streaming(self.llm)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.graph = compile_workflow(speculative=True)
+
+    async def ask(self, question, thread="t"):
+        config = {"configurable": {"thread_id": thread}}
+        tokens = []
+        async for chunk in self.graph.astream(
+            {"question": question, "document_id": "doc-1"}, config, stream_mode="custom",
+        ):
+            tokens.append(chunk["token"])
+        state = await self.graph.aget_state(config)
+        return "".join(tokens), state.values
+
+    def hit(self, score):
+        return {"content": "GPT4All was written by Yuvanesh Anand.", "score": score, "metadata": {}}
+
+    async def test_far_hits_get_the_canned_reply_without_an_llm_call(self):
+        self.hits = [self.hit(0.9), self.hit(1.2)]
+
+        text, state = await self.ask("What is the recipe for chocolate cake?")
+
+        self.assertEqual(text, NO_ANSWER)
+        self.assertEqual(self.llm.answers, 0)
+        self.assertEqual([m.type for m in state["messages"]], ["human", "ai"])
+        self.assertEqual(state["messages"][-1].content, NO_ANSWER)
+
+    async def test_empty_retrieval_skips_generation(self):
+        text, _ = await self.ask("Who are the authors?")
+
+        self.assertEqual(text, NO_ANSWER)
+        self.assertEqual(self.llm.answers, 0)
+
+    @override_settings(RAG_RELEVANCE_MAX_DISTANCE=None)
+    async def test_without_a_threshold_any_hit_is_answered(self):
+        self.hits = [self.hit(1.2)]
+
+        await self.ask("Who are the authors?")
+
+        self.assertEqual(self.llm.answers, 1)
+
+    async def test_close_hits_are_answered(self):
+        self.hits = [self.hit(1.2), self.hit(0.3)]
+
+        text, _ = await self.ask("Who are the authors?")
+
+        self.assertEqual(self.llm.answers, 1)
+        self.assertIn("Yuvanesh Anand", text)
+
+
+@override_settings(RAG_EXPANSION_BUDGET_SECONDS=None)
+class RetrievalHitsTest(SimpleTestCase):
+    """
+    Calibration has to see the hits the gate sees, not a raw-question search.
+    """
+
+    def setUp(self):
+        self.searched = []
+
+        async def fake_search(state, query):
+            self.searched.append(query)
+            score = 0.2 if query == "gpt4all authors" else 0.9
+            return [{"content": query, "score": score, "metadata": {}}]
+
+        async def rewrite(messages):
+            return AIMessage(content="gpt4all authors")
+
+        patches = [
+            patch("echo.rag_engine._search", fake_search),
+            patch("echo.rag_engine.safe_generate", rewrite),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    async def test_speculative_merges_raw_and_expanded_hits(self):
+        hits = await retrieval_hits("Who wrote it?", "doc-1", speculative=True)
+
+        self.assertEqual(sorted(self.searched), ["Who wrote it?", "gpt4all authors"])
+        self.assertEqual([hit["score"] for hit in hits], [0.2, 0.9])
+
+    async def test_sequential_searches_the_expanded_query(self):
+        hits = await retrieval_hits("Who wrote it?", "doc-1", speculative=False)
+
+        self.assertEqual(self.searched, ["gpt4all authors"])
+        self.assertEqual([hit["score"] for hit in hits], [0.2])
+
+
+class PickThresholdTest(SimpleTestCase):
+
+    def test_threshold_splits_the_gap(self):
+        self.assertAlmostEqual(pick_threshold([0.2, 0.3, 0.4], [0.8, 1.0]), 0.6)
+
+    def test_overlap_favours_answerable_questions(self):
+        threshold = pick_threshold([0.2, 0.3, 0.7], [0.5, 0.9, 1.0])
+
+        self.assertGreaterEqual(threshold, 0.7)
+        self.assertLess(threshold, 0.9)
+
+    def test_margin_when_nothing_is_further(self):
+        self.assertAlmostEqual(pick_threshold([0.2, 0.4], [0.1], margin=0.5), 0.6)
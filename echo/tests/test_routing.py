@@ -0,0 +1,138 @@
+import shutil
+import tempfile
+import zlib
+from unittest.mock import patch
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import Embeddings
+
+from echo.models import Document, ProcessingStatus
+from echo.rag_engine import _search
+from echo.routing import DocumentRoutingIndex, centroid
+from echo.vectorstore import vector_store_registry
+
+DIM = 16
+
+
+class TopicEmbeddings(Embeddings):
+    """
+    "doc-N ..." texts embed near topic N, so documents form clusters.
+    """
+
+    def __init__(self, topics=6):
+        self.topics = np.random.default_rng(0).standard_normal((topics, DIM))
+
+    def _embed(self, text):
+        topic = int(text.split()[0].split("-")[1])
+        noise = np.random.default_rng(zlib.crc32(text.encode())).standard_normal(DIM) * 0.2
+        return (self.topics[topic] + noise).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class DocumentRoutingTest(TestCase):
+
+    def setUp(self):
+        self.chroma_dir = tempfile.mkdtemp(prefix="ragtalk_chroma_")
+        self.settings_override = override_settings(CHROMA_DB_DIR=self.chroma_dir)
+        self.settings_override.enable()
+        self.embeddings = TopicEmbeddings()
+        self.routing = DocumentRoutingIndex(self.embeddings)
+        self.routing.chunks.add_documents([
+            LCDocument(page_content=f"doc-{d} chunk {i}", metadata={"document_id": f"doc-{d}"})
+            for d in range(6)
+            for i in range(8)
+        ])
+        for d in range(6):
+            self.routing.update_document(f"doc-{d}", title=f"Document {d}")
+
+    def tearDown(self):
+        vector_store_registry.shutdown()
+        self.settings_override.disable()
+        shutil.rmtree(self.chroma_dir, ignore_errors=True)
+
+    def test_centroid_is_normalised_mean_direction(self):
+        result = centroid([[2.0, 0.0], [0.0, 4.0]])
+
+        self.assertAlmostEqual(float(np.linalg.norm(result)), 1.0, places=5)
+        self.assertAlmostEqual(result[0], result[1], places=5)
+
+    def test_one_entry_per_document(self):
+        self.assertEqual(self.routing.index.count(), 6)
+        doc, _ = self.routing.index.search_by_vector_with_scores(self.embeddings.embed_query("doc-4 x"), k=1)[0]
+        self.assertEqual(doc.metadata, {"document_id": "doc-4", "chunks": 8})
+
+    def test_candidates_pick_the_closest_documents(self):
+        query = self.embeddings.embed_query("doc-2 what does it say")
+
+        self.assertEqual(self.routing.candidates(query, 1), ["doc-2"])
+
+    async def test_routed_search_only_searches_candidate_documents(self):
+        searched = []
+        original = self.routing._search_document
+        with patch.object(
+            self.routing, "_search_document",
+            side_effect=lambda document_id, *a: searched.append(document_id) or original(document_id, *a),
+        ):
+            hits = await self.routing.asearch("doc-3 question", k=4, n=2)
+
+        self.assertEqual(len(searched), 2)
+        self.assertIn("doc-3", searched)
+        self.assertEqual(len(hits), 4)
+        self.assertTrue(all(doc.metadata["document_id"] == "doc-3" for doc, _ in hits))
+
+    @override_settings(RAG_ROUTING_CANDIDATES=2, RAG_RETRIEVAL_K=3)
+    async def test_global_questions_are_routed_in_the_graph(self):
+        with patch("echo.rag_engine.embeddings", self.embeddings), \
+                patch.object(DocumentRoutingIndex, "candidates", autospec=True, side_effect=DocumentRoutingIndex.candidates) as candidates:
+            hits = await _search({"question": "doc-1 q"}, "doc-1 q")
+            scoped = await _search({"question": "doc-1 q", "document_id": "doc-5"}, "doc-1 q")
+
+        self.assertEqual(candidates.call_count, 1)
+        self.assertEqual(len(hits), 3)
+        self.assertTrue(all(hit["content"].startswith("doc-1 ") for hit in hits))
+        self.assertTrue(all(hit["content"].startswith("doc-5 ") for hit in scoped))
+
+    def indexed_document(self, topic):
+        document = Document.objects.create(
+            title="legacy",
+            file=SimpleUploadedFile("legacy.pdf", b"%PDF-1.4"),
+            processing_status=ProcessingStatus.INDEXED,
+        )
+        self.addCleanup(document.file.storage.delete, document.file.name)
+        self.routing.chunks.add_documents([
+            LCDocument(page_content=f"doc-{topic} legacy {i}", metadata={"document_id": str(document.id)})
+            for i in range(3)
+        ])
+        return document
+
+    async def test_documents_without_an_entry_fall_back_to_flat_search(self):
+        document = await sync_to_async(self.indexed_document)(5)
+
+        with patch.object(DocumentRoutingIndex, "candidates", side_effect=AssertionError("routed")):
+            hits = await self.routing.asearch("doc-5 legacy 1", k=11, n=2)
+
+        self.assertIn(str(document.id), {doc.metadata["document_id"] for doc, _ in hits})
+
+        await sync_to_async(self.routing.update_document)(str(document.id))
+        with patch.object(DocumentRoutingIndex, "candidates", autospec=True, side_effect=DocumentRoutingIndex.candidates) as candidates:
+            await self.routing.asearch("doc-5 legacy 1", k=3, n=2)
+        self.assertEqual(candidates.call_count, 1)
+
+    def test_deleting_a_document_removes_its_entry(self):
+        document = self.indexed_document(2)
+        self.routing.update_document(str(document.id))
+        self.assertEqual(self.routing.index.count(), 7)
+
+        document.delete()
+
+        self.assertEqual(self.routing.index.count(), 6)
+        self.assertNotIn(str(document.id), self.routing.index.ids())
@@ -0,0 +1,198 @@
+import asyncio
+from contextlib import aclosing
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langgraph.checkpoint.memory import MemorySaver
+
+from echo import single_flight
+from echo.consumers import ChatConsumer
+from echo.llm_gateway import reset_gateway
+from echo.rag_engine import compile_workflow
+
+DOCUMENT = "doc-1"
+
+
+class UpstreamChat:
+    """
+    Stub provider: counts the requests that reach it and streams a fixed
+    answer slowly enough for concurrent chats to overlap.
+    """
+
+    def __init__(self, words=20, delay=0.01):
+        self.words = words
+        self.delay = delay
+        self.streams = 0
+        self.invokes = 0
+
+    async def ainvoke(self, messages):
+        self.invokes += 1
+        return AIMessage(content="summary")
+
+    async def astream(self, messages):
+        self.streams += 1
+        for index in range(self.words):
+            await asyncio.sleep(self.delay)
+            yield AIMessageChunk(content=f"word{index} ")
+
+
+async def fake_search(state, query):
+    return [{"content": "GPT4All was trained on 437,605 pairs.", "score": 0.1, "metadata": {}}]
+
+
+@override_settings(
+    CHAT_SINGLE_FLIGHT=True, CHAT_FRAME_MAX_CHARS=0, RAG_ANSWER_CACHE=False, RAG_EXPANSION_BUDGET_SECONDS=0,
+)
+class SingleFlightTest(SimpleTestCase):
+
+    def setUp(self):
+        reset_gateway()
+        self.upstream = UpstreamChat()
+        self.checkpointer = MemorySaver()
+        patches = [
+            patch("echo.rag_engine._search", fake_search),
+            patch("echo.rag_engine.get_checkpointer", return_value=self.checkpointer),
+            patch("echo.rag_engine.get_store", return_value=None),
+            patch("echo.llm_gateway.primary_llm", self.upstream),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.graph = compile_workflow(speculative=True)
+        p = patch("echo.consumers.rag_graph", self.graph)
+        p.start()
+        self.addCleanup(p.stop)
+
+    async def connect(self, session):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), "/ws/chat/")
+        communicator.scope["session"] = SimpleNamespace(session_key=session)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def answer(self, communicator):
+        text = ""
+        while True:
+            frame = await communicator.receive_json_from(timeout=5)
+            if frame.get("type") == "end":
+                return text, frame
+            text += frame.get("text", "")
+
+    async def ask_all(self, questions, documents=None, prefix="user"):
+        documents = documents or [DOCUMENT] * len(questions)
+        chats = [await self.connect(f"{prefix}-{index}") for index in range(len(questions))]
+        for chat, question, document_id in zip(chats, questions, documents):
+            await chat.send_json_to({"message": question, "document_id": document_id})
+        answers = await asyncio.gather(*(self.answer(chat) for chat in chats))
+        for chat in chats:
+            await chat.disconnect()
+        return answers
+
+    async def messages(self, session):
+        state = await self.graph.aget_state({"configurable": {"thread_id": session}})
+        return [message.type for message in state.values.get("messages", [])]
+
+    async def test_concurrent_identical_questions_share_one_upstream_call(self):
+        answers = await self.ask_all(["Summarize this"] + ["summarize this?"] * 9)
+
+        self.assertEqual(self.upstream.streams, 1)
+        texts = {text for text, _ in answers}
+        self.assertEqual(len(texts), 1)
+        self.assertTrue(texts.pop().startswith("word0 word1"))
+        self.assertEqual(sum(bool(end["usage"].get("coalesced")) for _, end in answers), 9)
+        self.assertEqual(single_flight.in_flight(), 0)
+        # Every user's own thread holds the turn; the shared thread is gone
+        for index in range(10):
+            self.assertEqual(await self.messages(f"user-{index}"), ["human", "ai"])
+        self.assertEqual(
+            [key for key in self.checkpointer.storage if key.startswith("flight-")], []
+        )
+
+    async def test_different_questions_or_documents_are_not_coalesced(self):
+        await self.ask_all(["Summarize this", "Who are the authors?"])
+        await self.ask_all(["Summarize this", "Summarize this"], documents=["doc-2", "doc-3"], prefix="other")
+
+        self.assertEqual(self.upstream.streams, 4)
+
+    async def test_follow_up_questions_run_on_their_own(self):
+        await self.ask_all(["Summarize this"])
+        chat = await self.connect("user-0")
+        other = await self.connect("user-9")
+        await chat.send_json_to({"message": "Summarize this", "document_id": DOCUMENT})
+        await other.send_json_to({"message": "Summarize this", "document_id": DOCUMENT})
+        _, first = await self.answer(chat)
+        _, second = await self.answer(other)
+
+        self.assertEqual(self.upstream.streams, 3)
+        self.assertNotIn("coalesced", first["usage"])
+        self.assertNotIn("coalesced", second["usage"])
+        self.assertEqual(await self.messages("user-0"), ["human", "ai", "human", "ai"])
+        await chat.disconnect()
+        await other.disconnect()
+
+    async def test_leader_leaving_does_not_stop_the_others(self):
+        leader, follower = await self.connect("leader"), await self.connect("follower")
+        await leader.send_json_to({"message": "Summarize this", "document_id": DOCUMENT})
+        await leader.receive_json_from(timeout=5)
+        await follower.send_json_to({"message": "Summarize this", "document_id": DOCUMENT})
+        await leader.disconnect()
+
+        text, end = await self.answer(follower)
+
+        self.assertEqual(text.split(), [f"word{index}" for index in range(20)])
+        self.assertTrue(end["usage"]["coalesced"])
+        self.assertEqual(self.upstream.streams, 1)
+        self.assertEqual(await self.messages("leader"), [])
+        await follower.disconnect()
+
+    async def test_run_is_cancelled_when_every_subscriber_leaves(self):
+        chat = await self.connect("only")
+        await chat.send_json_to({"message": "Summarize this", "document_id": DOCUMENT})
+        await chat.receive_json_from(timeout=5)
+        await chat.disconnect()
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(single_flight.in_flight(), 0)
+
+    @override_settings(CHAT_SINGLE_FLIGHT=False)
+    async def test_can_be_disabled(self):
+        await self.ask_all(["Summarize this"] * 3)
+
+        self.assertEqual(self.upstream.streams, 3)
+
+
+class FlightTest(SimpleTestCase):
+
+    @staticmethod
+    async def source(count=100):
+        for index in range(count):
+            await asyncio.sleep(0)
+            yield index
+
+    async def test_join_after_the_last_subscriber_left_starts_a_new_run(self):
+        key = ("doc-1", "race")
+        first, _ = single_flight.join(key, self.source)
+        async with aclosing(first):
+            async for event in first:
+                if event == 2:
+                    break
+
+        second, joined = single_flight.join(key, self.source)
+        events = [event async for event in second]
+
+        self.assertFalse(joined)
+        self.assertEqual(events, list(range(100)))
+
+    async def test_cancelled_run_fails_its_remaining_subscribers(self):
+        flight = single_flight.Flight(("doc-1", "cancelled"), self.source())
+        flight.subscribers = 1
+        events = flight.subscribe()
+        self.assertEqual(await anext(events), 0)
+
+        flight.task.cancel()
+        with self.assertRaises(RuntimeError):
+            async for _ in events:
+                pass
@@ -0,0 +1,108 @@
+import asyncio
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+from langchain_core.messages import AIMessage
+
+from echo.rag_engine import compile_workflow, merge_hits
+from echo.tests.fixtures import streaming, temporary_checkpoints
+from echo.tests.test_async_retrieval import SlowFakeEmbeddings
+from echo.vectorstore import get_vector_service, vector_store_registry
+
+
+class CountingEmbeddings(SlowFakeEmbeddings):
+    queries: list = []
+
+    async def aembed_query(self, text):
+        self.queries.append(text)
+        return await super().aembed_query(text)
+
+
+def scripted_generate(expansion, delay):
+    async def generate(messages):
+        if "search optimizer" in messages[0].content:
+            await asyncio.sleep(delay)
+            return AIMessage(content=expansion)
+        return AIMessage(content="stub answer")
+    return generate
+
+
+@override_settings(RAG_RETRIEVAL_K=3, RAG_EXPANSION_BUDGET_SECONDS=1.5)
+class SpeculativeRetrievalTest(SimpleTestCase):
+
+    def setUp(self):
+        self.chroma_dir = tempfile.mkdtemp(prefix="ragtalk_chroma_")
+        self.settings_override = override_settings(CHROMA_DB_DIR=self.chroma_dir)
+        self.settings_override.enable()
+        temporary_checkpoints(self)
+        self.embeddings = CountingEmbeddings(size=16, latency=0.1, queries=[])
+
+        p = patch("echo.rag_engine.embeddings", self.embeddings)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def tearDown(self):
+        vector_store_registry.shutdown()
+        self.settings_override.disable()
+        shutil.rmtree(self.chroma_dir, ignore_errors=True)
+
+    async def ask(self, speculative, expansion="key findings and conclusions", delay=0.2):
+        service = get_vector_service(self.embeddings)
+        await service.aadd_documents([
+            LCDocument(page_content=f"chunk {i}", metadata={"document_id": f"doc-{i % 2}"})
+            for i in range(10)
+        ])
+        self.embeddings.queries.clear()
+
+        generate = scripted_generate(expansion, delay)
+        with patch("echo.rag_engine.safe_generate", generate), \
+                patch("echo.rag_engine.safe_stream", streaming(generate)):
+            graph = compile_workflow(speculative=speculative)
+            start = time.perf_counter()
+            state = await graph.ainvoke(
+                {"question": "summarize this", "document_id": "doc-1"},
+                {"configurable": {"thread_id": f"speculative_{speculative}"}},
+            )
+        return state, time.perf_counter() - start
+
+    def test_merge_hits_dedupes_and_keeps_best_distance(self):
+        merged = merge_hits(
+            [{"content": "a", "score": 0.4}, {"content": "b", "score": 0.2}],
+            [{"content": "a", "score": 0.1}, {"content": "c", "score": 0.3}],
+            k=2,
+        )
+        self.assertEqual(merged, [{"content": "a", "score": 0.1}, {"content": "b", "score": 0.2}])
+
+    async def test_speculative_mode_searches_raw_and_expanded_queries(self):
+        state, _ = await self.ask(speculative=True)
+
+        self.assertCountEqual(
+            self.embeddings.queries, ["summarize this", "key findings and conclusions"]
+        )
+        self.assertEqual(len(state["context"]), 3)
+        self.assertTrue(all(int(chunk.split()[1]) % 2 == 1 for chunk in state["context"]))
+        for node in ("pii_pre_check", "expand_query", "retrieve_raw", "retrieve", "generate"):
+            self.assertIn(node, state["timings"])
+
+    async def test_unhelpful_expansion_reuses_raw_hits(self):
+        state, _ = await self.ask(speculative=True, expansion="  Summarize THIS ")
+
+        self.assertEqual(self.embeddings.queries, ["summarize this"])
+        self.assertEqual(len(state["context"]), 3)
+
+    @override_settings(RAG_EXPANSION_BUDGET_SECONDS=0.05)
+    async def test_slow_expansion_is_abandoned_under_budget(self):
+        speculative, speculative_elapsed = await self.ask(speculative=True, delay=1.0)
+        self.assertEqual(speculative["expanded_query"], "summarize this")
+        self.assertLess(speculative["timings"]["expand_query"], 0.5)
+
+        sequential, sequential_elapsed = await self.ask(speculative=False, delay=1.0)
+        self.assertNotIn("retrieve_raw", sequential["timings"])
+
+        # Speculative retrieval overlapped the (abandoned) expansion
+        self.assertLess(speculative_elapsed, 1.0)
+        self.assertLess(speculative_elapsed, sequential_elapsed)
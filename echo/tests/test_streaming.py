@@ -0,0 +1,152 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from echo.consumers import ChatConsumer
+from echo.frames import frame_options
+from echo.llm_gateway import reset_gateway, safe_stream
+from echo.rag_engine import compile_workflow
+
+
+class FakeChat:
+    """
+    Streams the given chunks, then optionally raises after fail_after.
+    """
+
+    def __init__(self, chunks, fail_after=None, delay=0.0):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.delay = delay
+        self.calls = []
+
+    async def astream(self, messages):
+        self.calls.append(messages)
+        for index, chunk in enumerate(self.chunks):
+            if index == self.fail_after:
+                raise ConnectionError("stream reset")
+            await asyncio.sleep(self.delay)
+            yield AIMessageChunk(content=chunk)
+        if self.fail_after is not None and self.fail_after >= len(self.chunks):
+            raise ConnectionError("stream reset")
+
+
+async def collect(primary, fallback, messages):
+    with patch("echo.llm_gateway.primary_llm", primary), patch("echo.llm_gateway.fallback_llm", fallback):
+        return [text async for text in safe_stream(messages)]
+
+
+class SafeStreamTest(SimpleTestCase):
+    messages = [HumanMessage(content="Who wrote GPT4All?")]
+
+    def setUp(self):
+        reset_gateway()
+
+    async def test_primary_streams_without_fallback(self):
+        fallback = FakeChat(["unused"])
+        tokens = await collect(FakeChat(["Yuvanesh ", "Anand"]), fallback, self.messages)
+
+        self.assertEqual(tokens, ["Yuvanesh ", "Anand"])
+        self.assertEqual(fallback.calls, [])
+
+    async def test_failure_before_first_token_restarts_on_fallback(self):
+        fallback = FakeChat(["Yuvanesh ", "Anand"])
+        tokens = await collect(FakeChat(["never"], fail_after=0), fallback, self.messages)
+
+        self.assertEqual(tokens, ["Yuvanesh ", "Anand"])
+        self.assertEqual(fallback.calls, [self.messages])
+
+    async def test_mid_stream_failure_continues_without_repeating(self):
+        primary = FakeChat(["The authors are ", "Yuvanesh "], fail_after=2)
+        # A continuation of a prefill stripped of its trailing space
+        fallback = FakeChat([" Anand and ", "Zach Nussbaum."])
+        tokens = await collect(primary, fallback, self.messages)
+
+        self.assertEqual("".join(tokens), "The authors are Yuvanesh Anand and Zach Nussbaum.")
+        prefill = fallback.calls[0][-1]
+        self.assertIsInstance(prefill, AIMessage)
+        self.assertEqual(prefill.content, "The authors are Yuvanesh")
+
+    async def test_anthropic_content_blocks_are_flattened(self):
+        fallback = FakeChat([[{"type": "text", "text": "Hi", "index": 0}]])
+        tokens = await collect(FakeChat([], fail_after=0), fallback, self.messages)
+
+        self.assertEqual(tokens, ["Hi"])
+
+
+async def fake_search(state, query):
+    return [{"content": "GPT4All authors: Yuvanesh Anand.", "score": 0.1, "metadata": {}}]
+
+
+@override_settings(RAG_EXPANSION_BUDGET_SECONDS=0)
+class GraphStreamingTest(SimpleTestCase):
+
+    def setUp(self):
+        reset_gateway()
+        self.primary = FakeChat(["Yuvanesh ", "Anand ", "wrote ", "it."], delay=0.02)
+        patches = [
+            patch("echo.rag_engine._search", fake_search),
+            patch("echo.rag_engine.get_checkpointer", return_value=None),
+            patch("echo.rag_engine.get_store", return_value=None),
+            patch("echo.llm_gateway.primary_llm", self.primary),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.graph = compile_workflow(speculative=False)
+
+    async def test_tokens_are_streamed_as_custom_events(self):
+        tokens = [
+            chunk["token"] async for chunk in self.graph.astream(
+                {"question": "Who wrote it?"}, stream_mode="custom"
+            )
+        ]
+
+        self.assertEqual(tokens, ["Yuvanesh ", "Anand ", "wrote ", "it."])
+
+    async def test_time_to_first_token_is_recorded(self):
+        state = await self.graph.ainvoke({"question": "Who wrote it?"})
+
+        self.assertEqual(state["answer"], "Yuvanesh Anand wrote it.")
+        self.assertEqual(state["messages"][-1].content, "Yuvanesh Anand wrote it.")
+        self.assertLess(state["timings"]["generate_ttft"], state["timings"]["generate"])
+
+    async def consume(self, scope=None):
+        consumer = ChatConsumer()
+        consumer.frame_options = frame_options(scope or {})
+        frames = []
+
+        async def send(text_data):
+            frames.append(json.loads(text_data))
+
+        consumer.send = send
+        with patch("echo.consumers.rag_graph", self.graph):
+            await consumer.stream_openai_response("How do I get access?", thread_id=None)
+        return frames
+
+    async def test_consumer_forwards_redacted_text_and_ends_the_stream(self):
+        self.primary.chunks = ["Mail ", "bob@example.com ", "for details."]
+
+        frames = await self.consume()
+
+        text = "".join(frame.get("text", "") for frame in frames)
+        self.assertEqual(text, "Mail [REDACTED_EMAIL] for details.")
+        self.assertEqual([frame["seq"] for frame in frames], list(range(1, len(frames) + 1)))
+        end = frames[-1]
+        self.assertEqual(end["type"], "end")
+        self.assertEqual(end["frames"], len(frames) - 1)
+        self.assertEqual(end["chars"], len(text))
+        self.assertGreater(end["usage"]["prompt_tokens"], 0)
+        self.assertGreater(end["usage"]["completion_tokens"], 0)
+        self.assertIsNotNone(end["usage"]["ttft_ms"])
+
+    async def test_failed_generation_still_ends_the_stream(self):
+        self.primary.fail_after = 0
+
+        with patch("echo.llm_gateway.fallback_llm", FakeChat([], fail_after=0)), \
+                self.assertLogs("echo.consumers", "ERROR"):
+            frames = await self.consume()
+
+        self.assertEqual(frames, [{**frames[0], "seq": 1, "type": "end", "error": "generation_failed"}])
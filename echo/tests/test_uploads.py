@@ -0,0 +1,72 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from echo.models import Document
+from echo.uploads import INCOMING_DIR, HashingFileUploadHandler
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix="ragtalk_media_")
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class HashingUploadTest(TransactionTestCase):
+
+    def setUp(self):
+        # Several chunks' worth, so hashing really happens incrementally
+        self.content = os.urandom(3 * 64 * 1024 + 123)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def media_files(self, subdir):
+        path = os.path.join(TEST_MEDIA_ROOT, subdir)
+        return os.listdir(path) if os.path.isdir(path) else []
+
+    def upload(self, name):
+        file = SimpleUploadedFile(name, self.content, content_type="application/pdf")
+        return self.client.post(reverse("echo:upload_document"), {"file": file})
+
+    def test_handler_hashes_while_streaming(self):
+        handler = HashingFileUploadHandler()
+        handler.new_file("file", "doc.pdf", "application/pdf", len(self.content))
+        for start in range(0, len(self.content), handler.chunk_size):
+            handler.receive_data_chunk(self.content[start:start + handler.chunk_size], start)
+        uploaded = handler.file_complete(len(self.content))
+
+        self.assertEqual(uploaded.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(uploaded.size, len(self.content))
+        self.assertEqual(
+            os.path.dirname(uploaded.temporary_file_path()),
+            os.path.join(TEST_MEDIA_ROOT, INCOMING_DIR),
+        )
+        uploaded.close()
+        self.assertEqual(self.media_files(INCOMING_DIR), [])
+
+    @patch("echo.views.enqueue_ingestion")
+    def test_upload_is_hashed_once_and_moved_into_place(self, mock_enqueue):
+        with patch.object(Document, "calculate_file_hash", side_effect=AssertionError("re-read")):
+            response = self.upload("doc.pdf")
+
+        self.assertEqual(response.status_code, 202)
+        document = Document.objects.get(id=response.json()["document_id"])
+        self.assertEqual(document.file_hash, hashlib.sha256(self.content).hexdigest())
+        with open(document.file.path, "rb") as fh:
+            self.assertEqual(fh.read(), self.content)
+        self.assertEqual(self.media_files(INCOMING_DIR), [])
+
+    @patch("echo.views.enqueue_ingestion")
+    def test_duplicate_is_never_persisted(self, mock_enqueue):
+        first = self.upload("doc.pdf")
+        second = self.upload("doc_copy.pdf")
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json()["document_id"], second.json()["document_id"])
+        self.assertEqual(self.media_files("documents"), ["doc.pdf"])
+        self.assertEqual(self.media_files(INCOMING_DIR), [])
+        self.assertEqual(mock_enqueue.call_count, 1)
@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from echo.vectorstore import VectorStoreRegistry
+
+
+class VectorStoreRegistryTest(SimpleTestCase):
+    """
+    The registry should hand out one warm client per process instead of
+    building a new Chroma client per call.
+    """
+
+    def setUp(self):
+        self.chroma_dir = tempfile.mkdtemp(prefix="ragtalk_chroma_")
+        self.settings_override = override_settings(CHROMA_DB_DIR=self.chroma_dir)
+        self.settings_override.enable()
+        self.embeddings = DeterministicFakeEmbedding(size=16)
+        self.registry = VectorStoreRegistry()
+
+    def tearDown(self):
+        self.registry.shutdown()
+        self.settings_override.disable()
+        shutil.rmtree(self.chroma_dir, ignore_errors=True)
+
+    def test_service_is_reused(self):
+        first = self.registry.get(self.embeddings)
+        second = self.registry.get(self.embeddings)
+
+        self.assertIs(first, second)
+        self.assertEqual(self.registry.stats(), {"built": 1, "reused": 1, "live": 1})
+
+    def test_concurrent_gets_build_once(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            services = list(pool.map(lambda _: self.registry.get(self.embeddings), range(32)))
+
+        self.assertEqual(len({id(s) for s in services}), 1)
+        stats = self.registry.stats()
+        self.assertEqual(stats["built"], 1)
+        self.assertEqual(stats["reused"], 31)
+
+    def test_rebuild_counts_and_keeps_data(self):
+        service = self.registry.warmup(self.embeddings)
+        service.add_documents([LCDocument(page_content="hello world", metadata={"document_id": "a"})])
+
+        rebuilt = self.registry.rebuild(self.embeddings)
+
+        self.assertIsNot(service, rebuilt)
+        self.assertEqual(self.registry.stats()["built"], 2)
+        self.assertEqual(rebuilt.warmup(), 1)
+
+    def test_rebuild_leaves_other_collections_on_the_directory_working(self):
+        self.registry.get(self.embeddings)
+        other = self.registry.get(self.embeddings, "other")
+        other.add_documents([LCDocument(page_content="hello world", metadata={"document_id": "a"})])
+
+        self.registry.rebuild(self.embeddings)
+        other.add_documents([LCDocument(page_content="goodbye world", metadata={"document_id": "a"})])
+
+        self.assertEqual(other.warmup(), 2)
+
+    def test_shutdown_releases_services(self):
+        self.registry.get(self.embeddings)
+        self.registry.shutdown()
+
+        self.assertEqual(self.registry.stats()["live"], 0)
@@ -0,0 +1,47 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_failed = False
+_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    with _lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as exc:
+                # tiktoken downloads its BPE file on first use; offline we
+                # fall back to the usual ~4 chars/token estimate.
+                logger.warning(f"tiktoken unavailable ({exc}); estimating token counts.")
+                _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count for budgeting and metrics (cl100k_base when available).
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """
+    Cuts text to roughly `limit` tokens (proportionally, by characters).
+    """
+    tokens = count_tokens(text)
+    if tokens <= limit:
+        return text
+    return text[:len(text) * limit // tokens]
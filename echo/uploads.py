@@ -0,0 +1,68 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+# Spool directory inside MEDIA_ROOT: same filesystem as the final file, so
+# persisting an upload is a rename rather than another copy.
+INCOMING_DIR = ".incoming"
+
+
+class HashedUploadedFile(UploadedFile):
+    """
+    Upload spooled to disk next to its final location, with the SHA-256
+    of its contents computed while it streamed in.
+
+    Exposes temporary_file_path(), so FileSystemStorage moves it into
+    place instead of copying it.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        incoming = os.path.join(settings.MEDIA_ROOT, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + ext, dir=incoming)
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = None
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # Already moved into MEDIA_ROOT by the storage backend
+            pass
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """
+    Streams uploaded files to MEDIA_ROOT, hashing each chunk on the way,
+    so the view can dedupe on file_hash without re-reading the file.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.file = HashedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            # Unlinks the partial spool file
+            self.file.close()
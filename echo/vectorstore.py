@@ -1,13 +1,77 @@
 
+import asyncio
 import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
 import chromadb
-from chromadb.config import Settings  
-import os 
+from chromadb.api.client import SharedSystemClient
+from chromadb.config import Settings
+from chromadb.telemetry.product import ProductTelemetryClient
+from overrides import override
+import os
+
+from .numpy_index import NumpyVectorIndex
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_COLLECTION = "document_collection"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_vector_executor() -> ThreadPoolExecutor:
+    """
+    Bounded pool for blocking Chroma calls made from async code.
+    Kept separate from the default loop executor so a burst of queries
+    cannot starve other to_thread / sync_to_async work.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.VECTORSTORE_EXECUTOR_WORKERS,
+                thread_name_prefix="vectorstore",
+            )
+        return _executor
+
+
+async def _run_off_loop(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_vector_executor(), partial(func, *args, **kwargs))
+
+
+class NoProductTelemetry(ProductTelemetryClient):
+    """
+    Chroma 0.5's PostHog client batches events in an unlocked dict even
+    with telemetry disabled, so concurrent queries on one collection can
+    raise KeyError from inside collection.query(). We never send it.
+    """
+
+    @override
+    def capture(self, event):
+        pass
+
+
+def chroma_client_settings() -> Settings:
+    return Settings(
+        is_persistent=True,
+        anonymized_telemetry=False,
+        chroma_product_telemetry_impl="echo.vectorstore.NoProductTelemetry",
+    )
+
+
+# Chroma shares one system per persist directory between every client on
+# it; services count themselves in so only the last one to close stops it
+_system_users = {}
+_system_users_lock = threading.Lock()
+
 
 class VectorStoreService:
     """
@@ -15,14 +79,45 @@ class VectorStoreService:
     Allows easy replacement with Pinecone / Weaviate later.
     """
 
-    def __init__(self, embeddings):
+    def __init__(self, embeddings, collection_name: str = DEFAULT_COLLECTION):
         self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.persist_directory = settings.CHROMA_DB_DIR
 
         self.vector_store = Chroma(
-            collection_name="document_collection",
+            collection_name=collection_name,
             embedding_function=embeddings,
-            persist_directory=settings.CHROMA_DB_DIR
+            persist_directory=self.persist_directory,
+            client_settings=chroma_client_settings(),
         )
+        self._system = getattr(self.vector_store._client, "_identifier", None)
+        with _system_users_lock:
+            _system_users[self._system] = _system_users.get(self._system, 0) + 1
+
+    def warmup(self):
+        """
+        Touches the collection so the client, sqlite handle and segment
+        metadata are loaded before the first real query.
+        """
+        return self.vector_store._collection.count()
+
+    def close(self):
+        """
+        Releases this service's handle on the shared Chroma system; the
+        last service on the persist directory to close stops the system
+        and drops it from Chroma's process-wide client cache.
+        """
+        identifier, self._system = self._system, None
+        with _system_users_lock:
+            if identifier not in _system_users:
+                return
+            _system_users[identifier] -= 1
+            if _system_users[identifier] > 0:
+                return
+            del _system_users[identifier]
+            system = SharedSystemClient._identifier_to_system.pop(identifier, None)
+        if system is not None:
+            system.stop()
 
     def add_documents(self, documents):
         """
@@ -34,21 +129,21 @@ class VectorStoreService:
         except Exception as exc:
             logger.exception("Failed to persist documents to Chroma")
             raise exc
-            
+
     def search(self, query: str, k: int = 5, metadata_filter: dict = None):
         """
         Similarity search returning documents and confidence scores.
-        
+
         Args:
             query: The natural language string to search for.
             k: Number of chunks to retrieve (default: 4).
             metadata_filter: Optional dict for metadata filtering (e.g. {"source": "doc_id"}).
         """
-        # Lead approach: similarity_search_with_score provides the 'distance' 
+        # Lead approach: similarity_search_with_score provides the 'distance'
         # allowing the LLM/System to judge context relevance.
         return self.vector_store.similarity_search_with_score(
-            query, 
-            k=k, 
+            query,
+            k=k,
             filter=metadata_filter
         )
 
@@ -58,7 +153,313 @@ class VectorStoreService:
         Useful for advanced RAG patterns like HyDE (Hypothetical Document Embeddings).
         """
         return self.vector_store.similarity_search_by_vector(
-            embedding, 
-            k=k, 
+            embedding,
+            k=k,
             filter=metadata_filter
         )
+
+    def search_by_vector_with_scores(self, embedding: list, k: int = 5, metadata_filter: dict = None):
+        """
+        search() for a pre-computed query vector: (Document, distance) pairs.
+        """
+        return self.vector_store.similarity_search_by_vector_with_relevance_scores(
+            embedding,
+            k=k,
+            filter=metadata_filter,
+        )
+
+    def add_embedded(self, documents, vectors, ids=None):
+        """
+        Persist chunks whose embeddings were computed by the caller.
+        """
+        if not documents:
+            return []
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        try:
+            self.vector_store._collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                # Chroma rejects empty metadata dicts but accepts None
+                metadatas=[doc.metadata or None for doc in documents],
+                documents=[doc.page_content for doc in documents],
+            )
+        except Exception as exc:
+            logger.exception("Failed to persist documents to Chroma")
+            raise exc
+        return ids
+
+    def count(self) -> int:
+        return self.vector_store._collection.count()
+
+    def list_collections(self):
+        """
+        Names of every collection in this persist directory.
+        """
+        return [collection.name for collection in self.vector_store._client.list_collections()]
+
+    def has_collection(self, name: str) -> bool:
+        """
+        Whether the persist directory holds collection name; unlike
+        opening a service on it, this never creates it.
+        """
+        try:
+            self.vector_store._client.get_collection(name)
+        except ValueError:
+            return False
+        return True
+
+    def iter_embedded(self, batch_size: int = 1000, metadata_filter: dict = None):
+        """
+        Yields (ids, documents, vectors) pages of everything stored (or
+        matching metadata_filter), so chunks can be moved or summarised
+        without re-embedding them.
+        """
+        offset = 0
+        while True:
+            page = self.vector_store._collection.get(
+                where=metadata_filter,
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            if not page["ids"]:
+                return
+            documents = [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(page["documents"], page["metadatas"])
+            ]
+            yield page["ids"], documents, [list(vector) for vector in page["embeddings"]]
+            offset += len(page["ids"])
+
+    def ids(self):
+        return self.vector_store._collection.get(include=[])["ids"]
+
+    def delete(self, ids):
+        self.vector_store._collection.delete(ids=ids)
+
+    # --- Async API ---
+    # Embeddings go through the async client; the Chroma call itself is
+    # blocking and runs on the bounded vector store executor.
+
+    async def asearch(self, query: str, k: int = 5, metadata_filter: dict = None):
+        """
+        Async counterpart of search(); same (Document, distance) pairs.
+        """
+        embedding = await self.embeddings.aembed_query(query)
+        return await _run_off_loop(
+            self.search_by_vector_with_scores,
+            embedding,
+            k=k,
+            metadata_filter=metadata_filter,
+        )
+
+    async def asearch_by_vector(self, embedding: list, k: int = 5, metadata_filter: dict = None):
+        """
+        Async counterpart of search_by_vector().
+        """
+        return await _run_off_loop(
+            self.search_by_vector,
+            embedding,
+            k=k,
+            metadata_filter=metadata_filter,
+        )
+
+    async def aadd_documents(self, documents, ids=None):
+        """
+        Async counterpart of add_documents().
+        """
+        vectors = await self.embeddings.aembed_documents(
+            [doc.page_content for doc in documents]
+        )
+        return await _run_off_loop(self.add_embedded, documents, vectors, ids=ids)
+
+
+class NumpyVectorStoreService(VectorStoreService):
+    """
+    Same interface as VectorStoreService, backed by the in-process
+    NumpyVectorIndex instead of Chroma (VECTORSTORE_BACKEND = "numpy").
+    Scores are cosine distances; lower is still closer.
+    """
+
+    def __init__(self, embeddings, collection_name: str = DEFAULT_COLLECTION):
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.persist_directory = settings.NUMPY_INDEX_DIR
+        self.index = NumpyVectorIndex(self.persist_directory, collection_name)
+
+    def warmup(self):
+        return self.index.warmup()
+
+    def count(self) -> int:
+        return self.index.count()
+
+    def list_collections(self):
+        return sorted(
+            name for name in os.listdir(self.persist_directory)
+            if os.path.isdir(os.path.join(self.persist_directory, name))
+        )
+
+    def has_collection(self, name: str) -> bool:
+        return os.path.isdir(os.path.join(self.persist_directory, name))
+
+    def ids(self):
+        return self.index.ids()
+
+    def delete(self, ids):
+        self.index.delete(ids)
+
+    def close(self):
+        self.index.close()
+
+    def add_documents(self, documents):
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        self.add_embedded(documents, vectors)
+
+    def search(self, query: str, k: int = 5, metadata_filter: dict = None):
+        return self.search_by_vector_with_scores(
+            self.embeddings.embed_query(query), k=k, metadata_filter=metadata_filter
+        )
+
+    def iter_embedded(self, batch_size: int = 1000, metadata_filter: dict = None):
+        # Vectors come back L2-normalised, as stored
+        for ids, contents, metadatas, vectors in self.index.iter_rows(batch_size, metadata_filter):
+            documents = [
+                Document(page_content=content, metadata=metadata)
+                for content, metadata in zip(contents, metadatas)
+            ]
+            yield ids, documents, vectors.tolist()
+
+    def search_by_vector(self, embedding: list, k: int = 5, metadata_filter: dict = None):
+        return [
+            doc for doc, _ in
+            self.search_by_vector_with_scores(embedding, k=k, metadata_filter=metadata_filter)
+        ]
+
+    def search_by_vector_with_scores(self, embedding: list, k: int = 5, metadata_filter: dict = None):
+        return [
+            (Document(page_content=content, metadata=metadata), distance)
+            for content, metadata, distance
+            in self.index.search(embedding, k=k, metadata_filter=metadata_filter)
+        ]
+
+    def add_embedded(self, documents, vectors, ids=None):
+        if not documents:
+            return []
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        try:
+            return self.index.upsert(
+                ids,
+                vectors,
+                [doc.page_content for doc in documents],
+                [doc.metadata or {} for doc in documents],
+            )
+        except Exception as exc:
+            logger.exception("Failed to persist documents to the NumPy index")
+            raise exc
+
+
+VECTORSTORE_BACKENDS = {
+    "chroma": VectorStoreService,
+    "numpy": NumpyVectorStoreService,
+}
+
+
+def _backend():
+    backend = settings.VECTORSTORE_BACKEND
+    if backend not in VECTORSTORE_BACKENDS:
+        raise ImproperlyConfigured(
+            f"VECTORSTORE_BACKEND must be one of {sorted(VECTORSTORE_BACKENDS)}, got {backend!r}"
+        )
+    return backend
+
+
+class VectorStoreRegistry:
+    """
+    Process-wide, thread-safe cache of VectorStoreService instances.
+
+    Chat turns and ingestion jobs share one warm Chroma client per
+    (embeddings, collection, persist directory) instead of opening a new
+    client for every question.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services = {}
+        self._built = 0
+        self._reused = 0
+
+    def _key(self, embeddings, collection_name):
+        # Embeddings are process singletons, so identity is a stable key.
+        backend = _backend()
+        directory = settings.NUMPY_INDEX_DIR if backend == "numpy" else settings.CHROMA_DB_DIR
+        return (id(embeddings), collection_name, backend, directory)
+
+    def get(self, embeddings, collection_name: str = DEFAULT_COLLECTION) -> VectorStoreService:
+        key = self._key(embeddings, collection_name)
+        with self._lock:
+            service = self._services.get(key)
+            if service is not None:
+                self._reused += 1
+                return service
+
+            service_class = VECTORSTORE_BACKENDS[key[2]]
+            service = service_class(embeddings, collection_name=collection_name)
+            self._services[key] = service
+            self._built += 1
+            logger.info(
+                f"Built {key[2]} vector store for collection '{collection_name}' "
+                f"at {service.persist_directory}"
+            )
+            return service
+
+    def rebuild(self, embeddings, collection_name: str = DEFAULT_COLLECTION) -> VectorStoreService:
+        """
+        Drops the cached service (e.g. after the directory was rewritten
+        out-of-band) and builds a fresh one.
+        """
+        key = self._key(embeddings, collection_name)
+        with self._lock:
+            stale = self._services.pop(key, None)
+        if stale is not None:
+            stale.close()
+        return self.get(embeddings, collection_name)
+
+    def warmup(self, embeddings, collection_name: str = DEFAULT_COLLECTION):
+        service = self.get(embeddings, collection_name)
+        count = service.warmup()
+        logger.info(f"Vector store warm: {count} chunks in '{collection_name}'")
+        return service
+
+    def shutdown(self):
+        with self._lock:
+            services = list(self._services.values())
+            self._services.clear()
+        for service in services:
+            try:
+                service.close()
+            except Exception:
+                logger.exception("Failed closing vector store client")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "built": self._built,
+                "reused": self._reused,
+                "live": len(self._services),
+            }
+
+
+vector_store_registry = VectorStoreRegistry()
+
+
+def get_vector_service(embeddings, collection_name: str = DEFAULT_COLLECTION) -> VectorStoreService:
+    """
+    Returns the shared VectorStoreService for this process, or a
+    PartitionRouter over its partitions when VECTORSTORE_PARTITIONING is
+    "document" or "shard".
+    """
+    if settings.VECTORSTORE_PARTITIONING != "none":
+        from .partitions import PartitionRouter
+
+        return PartitionRouter(embeddings, collection_name)
+    return vector_store_registry.get(embeddings, collection_name)
@@ -9,11 +9,11 @@ from django.views.decorators.http import require_POST
 from django.http import StreamingHttpResponse
 
 from asgiref.sync import sync_to_async
+from django.db import transaction
 from echo.models import Document
-from .tasks import ingest_document_background
-# inject your embeddings instance
-from .embeddings import embeddings
+from .jobs import enqueue_ingestion, ingestion_workers
 from .rag_engine import rag_graph
+from .uploads import HashingFileUploadHandler
 
 logger = logging.getLogger(__name__)
 
@@ -32,12 +32,16 @@ async def index(request):
 @require_POST
 async def upload_document(request):
     try:
-        uploaded_file = request.FILES.get("file")
+        # 1. Parse the multipart body off the loop. The hashing handler
+        # writes the file into MEDIA_ROOT and computes its SHA-256 in the
+        # same pass (safe to swap handlers here: the view is csrf_exempt).
+        request.upload_handlers = [HashingFileUploadHandler(request)]
+        files = await sync_to_async(lambda: request.FILES, thread_sensitive=False)()
+        uploaded_file = files.get("file")
         if not uploaded_file:
             return JsonResponse({"error": "No file provided"}, status=400)
 
-        # 1. Calculate Hash
-        file_hash = Document.calculate_file_hash(uploaded_file)
+        file_hash = uploaded_file.sha256
         print(f'Processing file: {uploaded_file.name}, Hash: {file_hash}')
 
         # 2. CHECK FOR EXISTING (Deduplication Logic)
@@ -48,6 +52,8 @@ async def upload_document(request):
 
         if existing_doc:
             print(f'Document already exists: {existing_doc.id}')
+            # Never persisted: just drop the spooled copy
+            await sync_to_async(uploaded_file.close, thread_sensitive=False)()
             return JsonResponse(
                 {
                     "document_id": str(existing_doc.id),
@@ -59,21 +65,25 @@ async def upload_document(request):
 
         # 3. Create new document with File persistence fix
         # We wrap this in a sync function to ensure Django's FileField
-        # correctly moves the file from memory/temp-dir to your MEDIA_ROOT.
+        # correctly moves the file from the spool dir to your MEDIA_ROOT
+        # (a rename on the same filesystem, not a copy).
+        # The ingestion job is created in the same transaction, so an
+        # accepted upload is never lost to a restart.
         def create_document_sync():
-            return Document.objects.create(
-                title=uploaded_file.name,
-                file=uploaded_file,
-                file_hash=file_hash,
-            )
+            with transaction.atomic():
+                document = Document.objects.create(
+                    title=uploaded_file.name,
+                    file=uploaded_file,
+                    file_hash=file_hash,
+                )
+                enqueue_ingestion(document)
+            return document
 
         document = await sync_to_async(create_document_sync, thread_sensitive=True)()
         print(f'New document created: {document.id}, Path: {document.file.path}')
 
-        # 4. Fire background task only for NEW documents
-        asyncio.create_task(
-            ingest_document_background(document.id, embeddings)
-        )
+        # 4. Queue ingestion only for NEW documents; wake idle workers
+        ingestion_workers.notify()
 
         return JsonResponse(
             {
@@ -21,7 +21,13 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ragtalk.settings')
 
 django_asgi_app = get_asgi_application()
 
-application = ProtocolTypeRouter({
+from echo import lifecycle
+
+# Warm the shared vector store once per worker; closed again at exit.
+lifecycle.startup()
+
+# Starts the in-process ingestion workers on the server's event loop
+application = lifecycle.LifecycleMiddleware(ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter([
@@ -31,4 +37,4 @@ application = ProtocolTypeRouter({
             path("ws/chat/", ChatConsumer.as_asgi()),
         ])
     ),
-})
\ No newline at end of file
+}))
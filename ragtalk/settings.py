@@ -88,11 +88,155 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Ingestion threads write status/checkpoints while requests read:
+        # WAL lets readers proceed and the timeout rides out short write locks.
+        'OPTIONS': {
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
     }
 }
 
 CHROMA_DB_DIR = os.path.join(BASE_DIR, 'chroma_db')
 
+# Vector store backend: "chroma" or "numpy" (in-process memory-mapped index)
+VECTORSTORE_BACKEND = 'chroma'
+# Where the numpy backend keeps its vectors and chunk table
+NUMPY_INDEX_DIR = os.path.join(BASE_DIR, 'numpy_index')
+# Split the collection into per-document or hashed shard partitions
+# ("none", "document" or "shard"); see `manage.py repartition_vectorstore`
+VECTORSTORE_PARTITIONING = 'none'
+# Number of shard partitions when VECTORSTORE_PARTITIONING = "shard"
+VECTORSTORE_SHARDS = 8
+# Seconds a process reuses its list of partitions for global queries
+# (partitions it writes itself are picked up immediately)
+VECTORSTORE_PARTITION_LIST_TTL_SECONDS = 30
+
+# Retrieve with the raw question while query expansion runs, then merge
+RAG_SPECULATIVE_RETRIEVAL = True
+# Max seconds to wait for query expansion (0 = skip expansion)
+RAG_EXPANSION_BUDGET_SECONDS = 1.5
+# Chunks retrieved per search (merged into fewer passages before generation)
+RAG_RETRIEVAL_K = 5
+# Global questions search only the chunks of the N closest documents
+# (by centroid; see echo/routing.py). 0 = flat search over every chunk.
+# Pays off with VECTORSTORE_PARTITIONING on; over one unpartitioned
+# collection it only adds latency (`manage.py bench_routing`)
+RAG_ROUTING_CANDIDATES = 0
+# Seconds between checks that every INDEXED document has a routing entry
+# (global questions search flat while any is missing)
+RAG_ROUTING_COVERAGE_TTL_SECONDS = 60
+# Questions whose best hit is further away than this get the canned "cannot
+# find" reply without an LLM call. In the active backend's distance units
+# (squared L2 for Chroma, cosine distance for numpy); pick it with
+# `manage.py calibrate_relevance`. None = only skip when nothing is retrieved
+RAG_RELEVANCE_MAX_DISTANCE = None
+# Token cap for the CONTEXT block of the generate prompt (0 = no cap)
+RAG_CONTEXT_TOKEN_BUDGET = 1500
+# Shingle overlap above which a retrieved chunk is dropped as a near-duplicate
+RAG_CONTEXT_DUPLICATE_THRESHOLD = 0.9
+# Tokens of recent conversation sent with each prompt (older turns reach
+# the LLM only through the summary)
+RAG_HISTORY_TOKEN_BUDGET = 1000
+# Per-thread ceiling on stored messages; past it old turns are summarised away
+RAG_MEMORY_TOKEN_LIMIT = 3000
+# Cap on the rolling conversation summary
+RAG_SUMMARY_TOKEN_LIMIT = 300
+# Replay final answers to repeated questions on the same document (see
+# echo/answer_cache.py); LRU-bounded, entries expire after the TTL (0 = never)
+RAG_ANSWER_CACHE = True
+RAG_ANSWER_CACHE_MAX_ENTRIES = 1000
+RAG_ANSWER_CACHE_TTL_SECONDS = 60 * 60
+# Only reuse answers to a thread's first question, when no earlier turn can
+# change what the question means
+RAG_ANSWER_CACHE_FIRST_TURN_ONLY = True
+
+# LLM gateway: rolling stats cover each provider's last N calls
+LLM_STATS_WINDOW = 100
+# Consecutive failures that open a provider's circuit, and how long it stays open
+# before a single probe call is let through
+LLM_BREAKER_FAILURES = 5
+LLM_BREAKER_COOLDOWN_SECONDS = 30
+# Also ask the fallback when the primary is slower than this percentile of its
+# recent latency (time to first token when streaming); the first answer wins
+LLM_HEDGE = True
+LLM_HEDGE_PERCENTILE = 0.95
+# Calls recorded before hedging starts (too few samples make a noisy p95)
+LLM_HEDGE_MIN_SAMPLES = 20
+
+# Provider quotas shared by chat and embedding calls (0 = unlimited). Interactive
+# chat queues ahead of background ingestion when a bucket runs dry
+LLM_RATE_LIMITS = {
+    'openai': {'requests_per_minute': 500, 'tokens_per_minute': 200_000},
+    'anthropic': {'requests_per_minute': 50, 'tokens_per_minute': 50_000},
+}
+# Buckets live in process memory: set this to the number of processes
+# calling the providers (ASGI workers plus any `run_ingestion_workers`) and
+# each gets LLM_RATE_LIMITS / N. Chat-over-ingestion priority only applies
+# within a process
+LLM_RATE_LIMIT_PROCESSES = 1
+# How often a queued call re-checks its bucket (seconds)
+LLM_RATE_POLL_SECONDS = 0.02
+
+# Chat WebSocket: answer text is sent once this many chars are buffered or
+# this long after the first buffered token (clients may override both via
+# ?frame_chars=&frame_ms=; 0 chars = one frame per token)
+CHAT_FRAME_MAX_CHARS = 64
+CHAT_FRAME_MAX_DELAY_MS = 20
+# Answers generated at once per chat connection. A new question past the cap
+# cancels the oldest run, or is refused if superseding is off
+CHAT_MAX_RUNS_PER_CONNECTION = 1
+CHAT_SUPERSEDE_RUNS = True
+# How long a cancelled run gets to unwind (close its LLM stream) before we move on
+CHAT_CANCEL_TIMEOUT_SECONDS = 2.0
+# Identical first questions on the same document share one in-flight answer
+CHAT_SINGLE_FLIGHT = True
+
+# Open the shared Chroma client at ASGI startup instead of on the first question
+VECTORSTORE_WARMUP = True
+
+# Threads available for blocking Chroma calls made from async retrieval
+VECTORSTORE_EXECUTOR_WORKERS = 8
+
+# Content-addressed embedding cache: (model, sha256(text)) -> float32 vector
+EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, 'embedding_cache.sqlite3')
+EMBEDDING_CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+# Concurrent question embeddings are sent as one request: collected for up to
+# this many ms after the first, or until the batch is full (1 = no batching)
+EMBEDDING_QUERY_BATCH_SIZE = 16
+EMBEDDING_QUERY_BATCH_WAIT_MS = 5
+
+# LangGraph conversation state: "sqlite" (CHECKPOINT_DB_PATH, shared by
+# worker processes, survives restarts) or "memory" (per process)
+CHECKPOINT_BACKEND = 'sqlite'
+CHECKPOINT_DB_PATH = os.path.join(BASE_DIR, 'checkpoints.sqlite3')
+# Checkpoints kept per conversation thread; older ones are pruned on write
+CHECKPOINT_KEEP_LATEST = 3
+# Threads idle longer than this are deleted (seconds; 0 = keep forever)
+CHECKPOINT_THREAD_TTL_SECONDS = 24 * 60 * 60
+
+# Ingestion embedding stage: chunks per request and concurrent requests per document
+INGESTION_EMBED_BATCH_SIZE = 64
+INGESTION_EMBED_MAX_IN_FLIGHT = 4
+INGESTION_EMBED_MAX_RETRIES = 5
+INGESTION_EMBED_RETRY_BASE_DELAY = 1.0
+
+# Durable ingestion queue (echo.jobs). Workers run on the server's event loop
+# unless disabled here in favour of `manage.py run_ingestion_workers`.
+INGESTION_WORKERS_IN_PROCESS = True
+INGESTION_WORKERS = 2
+INGESTION_POLL_INTERVAL = 2.0
+INGESTION_LEASE_SECONDS = 300
+INGESTION_MAX_ATTEMPTS = 5
+INGESTION_RETRY_BASE_DELAY = 5
+INGESTION_RETRY_MAX_DELAY = 300
+# Threads that run ingestion jobs, separate from Django's shared sync thread
+INGESTION_EXECUTOR_WORKERS = INGESTION_WORKERS
+# Worker processes for PDF parse/chunk (0 = parse in the ingestion thread)
+INGESTION_PARSE_PROCESSES = 0
+# Pages per parse task, so one large PDF spreads across parse processes
+INGESTION_PARSE_PAGES_PER_TASK = 16
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 